@@ -1,4 +1,4 @@
-import os
+import os, sys, asyncio
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
 # Needs to be done before we can import QueryAuthMiddleware
@@ -9,6 +9,17 @@ from channels.routing             import ProtocolTypeRouter, URLRouter
 from django.core.asgi             import get_asgi_application
 from chat_app.websocket.routing   import websocket_urlpatterns
 from chat_app.services.middleware import QueryAuthMiddleware
+from chat_app                     import config as cf
+
+# Close long-lived clients (the LLM connection pool) when the server shuts down. daphne never sends ASGI lifespan
+# events, but it runs Twisted on an asyncio loop (its reactor is installed before the application is imported), so
+# a "before shutdown" trigger can await the close there; other servers just let the process exit.
+def _close_on_shutdown():
+    if "twisted.internet.reactor" not in sys.modules: return  # (not running under daphne, don't install a reactor)
+    from twisted.internet import reactor, defer
+    reactor.addSystemEventTrigger("before", "shutdown", lambda: defer.Deferred.fromFuture(asyncio.ensure_future(cf.llm.aclose())))
+
+_close_on_shutdown()
 
 application = ProtocolTypeRouter({
     "http"     : get_asgi_application(),
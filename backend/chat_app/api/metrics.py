@@ -0,0 +1,11 @@
+from django.http                import HttpResponse
+from rest_framework.decorators  import api_view, permission_classes
+from rest_framework.permissions import AllowAny
+
+from ..services import metrics as m
+
+# Prometheus scrape target (see services/metrics.py)
+@api_view(["GET"])
+@permission_classes([AllowAny])
+def metrics(request):
+    return HttpResponse(m.render(), content_type=m.CONTENT_TYPE)
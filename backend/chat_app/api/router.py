@@ -1,8 +1,11 @@
 from rest_framework.routers         import DefaultRouter
 from rest_framework_simplejwt.views import TokenRefreshView
 from django.urls import path, include
+from django.conf import settings
 
-from .health import health
+from .health  import health
+from .metrics import metrics
+from .traces  import traces
 from .views import (
     GoalView, UserSettingsView,              # One-off endpoints
     ProfileView, SignupView,                 # Auth / Profile
@@ -25,8 +28,9 @@ urlpatterns = [
     # /api/chatsessions/
     path("", include(router.urls)),
 
-    # Health check
-    path("health/", health, name="health"),
+    # Health check & metrics
+    path("health/",  health,  name="health" ),
+    path("metrics/", metrics, name="metrics"),
 
     # Single-row resources (one per user)
     path("goal/",             GoalView.as_view(), name="goal"    ),
@@ -41,3 +45,6 @@ urlpatterns = [
     path("token/",         MyTokenObtainPairView.as_view(), name="token"        ),
     path("token/refresh/",      TokenRefreshView.as_view(), name="token_refresh"),
 ]
+
+# Per-turn traces (dev only)
+if settings.DEBUG: urlpatterns.append(path("traces/", traces, name="traces"))
@@ -0,0 +1,19 @@
+from django.conf                import settings
+from django.http                import Http404
+from rest_framework.decorators  import api_view, permission_classes
+from rest_framework.permissions import AllowAny
+from rest_framework.response    import Response
+
+from ..services import tracing
+
+# Dev-only view of the per-turn spans (see services/tracing.py)
+#   /api/traces/              -> slowest turns still in memory (?slowest=N)
+#   /api/traces/?turn=<id>    -> every span of one turn
+@api_view(["GET"])
+@permission_classes([AllowAny])
+def traces(request):
+    if not settings.DEBUG: raise Http404
+
+    turn_id = request.query_params.get("turn")
+    if turn_id: return Response({"turn": turn_id, "spans": tracing.spans(turn_id)})
+    return Response({"slowest": tracing.slowest_turns(int(request.query_params.get("slowest", 20)))})
@@ -17,6 +17,43 @@ THIS_LANGUAGE = "en-US"
 MAX_LENGTH = 256
 PROMPT = "You are an assistant for dementia patients. Provide any response as much short as possible."
 
+# LLM API client (services/llm/llama_api.py) -- one pooled connection to the llama_api container
+LLM_URL             = os.getenv("LLM_URL", "http://llama_api:11434")
+LLM_TIMEOUT         = 30.0   # seconds (read/write/pool)
+LLM_CONNECT_TIMEOUT = 2.0    # seconds to open a connection
+LLM_MAX_CONNECTIONS = 32
+LLM_KEEPALIVE       = 16     # idle connections kept open
+LLM_RETRIES         = 2      # extra attempts on connection errors (with jittered backoff)
+LLM_HTTP2           = os.getenv("LLM_HTTP2", "0") == "1"  # (needs httpx[http2])
+LLM_STREAM          = True   # forward the reply to the client as it is generated (llm_delta messages)
+
+# LLM queue (services/llm/llm_queue.py) -- requests are spread over every replica in LLM_URLS (comma separated)
+LLM_URLS                = [url.strip() for url in os.getenv("LLM_URLS", LLM_URL).split(",") if url.strip()]
+LLM_QUEUE_DEPTH         = 32  # requests waiting for a replica before new ones fail fast (ERROR_UTTERANCE)
+LLM_REPLICA_CONCURRENCY = 1   # requests sent to one replica at a time (llama-cpp-python runs one at a time anyway)
+
+# Speculative replies (websocket/services/speculativeReply.py) -- STT interim results start the LLM request early,
+# the final transcript keeps that reply if it says the same thing & reissues the request otherwise
+STT_SPECULATIVE           = os.getenv("STT_SPECULATIVE", "0") == "1"
+STT_SPECULATIVE_STABILITY = 0.8  # every interim result must be at least this stable (Google's 0-1 estimate)
+
+# DummyLLM latencies (sandbox/load tests without a GPU), in seconds
+DUMMY_LLM_LATENCY        = float(os.getenv("DUMMY_LLM_LATENCY",        "0"))  # per request
+DUMMY_LLM_PROMPT_LATENCY = float(os.getenv("DUMMY_LLM_PROMPT_LATENCY", "0"))  # per prompt word
+DUMMY_LLM_TOKEN_LATENCY  = float(os.getenv("DUMMY_LLM_TOKEN_LATENCY",  "0"))  # per reply word
+
+# Session prompt (websocket/services/promptBuilder.py) -- the history only grows, so the server can reuse its KV cache
+LLM_N_CTX           = int(os.getenv("LLM_N_CTX", "2048"))  # n_ctx of the llama_api server (llama_api/server.config)
+PROMPT_TOKEN_BUDGET = LLM_N_CTX - MAX_LENGTH  # prompt tokens allowed, the rest is reserved for the reply
+PROMPT_KEEP_RATIO   = 0.5    # over budget, the oldest turns are dropped until the prompt is at most this much of it
+CHARS_PER_TOKEN     = 3.0    # token estimate when the server can't count them (on the high side for English)
+LLM_SLOTS           = int(os.getenv("LLM_SLOTS", "0"))  # llama.cpp server --parallel slots to pin sessions to (0: don't send id_slot)
+
+# Per-turn tracing (services/tracing.py) -- spans are kept in memory & appended to TRACE_FILE as JSON lines
+TRACE_TURNS  = True
+TRACE_FILE   = "./logs/traces.jsonl"
+TRACE_BUFFER = 5_000   # spans kept in memory for /api/traces/ (DEBUG only)
+
 # TODO: Find all imports using these and make them use the new logging_utils.py file instead
 # Colors for logging
 RED     = "\033[0;31m"
@@ -88,11 +125,17 @@ try:
     check_for_model_files(pronunciation_model_path, prosody_model_path)
 
     # Load the saved LLM model OR use a testing object that just returns sample data
-    if USE_LLM:  from .services.llm.llama_api import LlamaAPI as LLMClass
-    else:        from .services.llm.dummy_LLM import DummyLLM as LLMClass
+    from .services.llm.llm_queue import LLMQueue
+    if USE_LLM:
+        from .services.llm.llama_api import LlamaAPI as LLMClass
+        llm_options = dict(timeout=LLM_TIMEOUT, connect_timeout=LLM_CONNECT_TIMEOUT, max_connections=LLM_MAX_CONNECTIONS,
+                           max_keepalive=LLM_KEEPALIVE, retries=LLM_RETRIES, http2=LLM_HTTP2)
+    else:
+        from .services.llm.dummy_LLM import DummyLLM as LLMClass
+        llm_options = dict(latency=DUMMY_LLM_LATENCY, prompt_latency=DUMMY_LLM_PROMPT_LATENCY, token_latency=DUMMY_LLM_TOKEN_LATENCY)
        
-    # Setup the LLM
-    llm = LLMClass()
+    # Setup the LLM (one client per replica, behind the queue)
+    llm = LLMQueue([LLMClass(url, **llm_options) for url in LLM_URLS], max_depth=LLM_QUEUE_DEPTH, concurrency=LLM_REPLICA_CONCURRENCY)
     logger.info("LLM initialized successfully")
 
 
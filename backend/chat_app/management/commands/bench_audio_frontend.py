@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand
+
+import numpy as np
+from time import perf_counter
+from chat_app.websocket.biomarkers.biomarker_config import SAMPLE_RATE
+from chat_app.websocket.services.audioFrontend      import prepare_audio
+
+
+# The handle_audio_data path before audioFrontend.py (needs librosa, which the backend no longer installs)
+def librosa_path(audio_bytes, sample_rate):
+    import librosa
+    audio_array = np.frombuffer(audio_bytes, dtype=np.int16)
+    audio_array = audio_array / max(np.max(np.abs(audio_array)), 1e-9)
+    if sample_rate != SAMPLE_RATE: audio_array = librosa.resample(audio_array, orig_sr=sample_rate, target_sr=SAMPLE_RATE)
+    return librosa.util.buf_to_float(audio_array, n_bytes=2, dtype=np.float32)
+
+
+class Command(BaseCommand):
+    help = "Benchmarks the audio front-end (int16 -> normalized float32 @ 16kHz) against the old librosa path."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seconds", type=float, default=3.0,                                 help="Length of each audio chunk")
+        parser.add_argument("--repeat",  type=int,   default=50,                                  help="Runs per sample rate")
+        parser.add_argument("--rates",   type=int,   nargs="+", default=[48_000, 44_100, 24_000, 16_000], help="Input sample rates")
+
+    # ====================================================================
+    # Time both paths for every input rate
+    # ====================================================================
+    def handle(self, *args, **opts):
+        try:                import librosa  # noqa: F401
+        except ImportError: librosa = None; self.stdout.write("librosa is not installed, only timing the new front-end.")
+
+        rng = np.random.default_rng(0)
+        for rate in opts["rates"]:
+            t   = np.arange(int(opts["seconds"] * rate)) / rate
+            pcm = (8000 * np.sin(2 * np.pi * 220 * t) + 500 * rng.standard_normal(t.size)).astype(np.int16).tobytes()
+
+            new = self._time(prepare_audio, pcm, rate, opts["repeat"])
+            out = prepare_audio(pcm, rate)
+            line = f"{rate:>6,} Hz -> {SAMPLE_RATE:,} Hz: front-end {new * 1000:7.2f} ms (peak {np.max(np.abs(out)):.3f}, {out.dtype})"
+
+            if librosa is not None:
+                old     = self._time(librosa_path, pcm, rate, opts["repeat"])
+                old_out = librosa_path(pcm, rate)
+                line   += f" | librosa {old * 1000:7.2f} ms (peak {np.max(np.abs(old_out)):.6f}) | {old / new:5.1f}x"
+
+            self.stdout.write(line)
+
+    @staticmethod
+    def _time(fn, pcm, rate, repeat):
+        fn(pcm, rate) # (warm up)
+        times = []
+        for _ in range(repeat):
+            start = perf_counter(); fn(pcm, rate); times.append(perf_counter() - start)
+        return float(np.median(times))
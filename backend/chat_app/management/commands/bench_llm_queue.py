@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand
+
+import asyncio
+import numpy as np
+from time import perf_counter
+from chat_app.services.llm.dummy_LLM import DummyLLM
+from chat_app.services.llm.llm_queue import LLMQueue, LLMQueueFull
+
+
+class Command(BaseCommand):
+    help = "Load tests the LLM queue with DummyLLM replicas (no GPU needed): reply latency, fairness & fast-fails."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sessions",      type=int,   default=20,   help="Concurrent chat sessions")
+        parser.add_argument("--turns",         type=int,   default=5,    help="LLM requests per session")
+        parser.add_argument("--replicas",      type=int,   default=2,    help="DummyLLM replicas behind the queue")
+        parser.add_argument("--depth",         type=int,   default=32,   help="Max requests waiting (LLM_QUEUE_DEPTH)")
+        parser.add_argument("--concurrency",   type=int,   default=1,    help="Requests per replica at a time")
+        parser.add_argument("--latency",       type=float, default=0.05, help="Seconds per request")
+        parser.add_argument("--token-latency", type=float, default=0.01, help="Seconds per reply word")
+        parser.add_argument("--think",         type=float, default=0.5,  help="Seconds between a session's turns")
+
+    # ====================================================================
+    # Run every session at once & summarize
+    # ====================================================================
+    def handle(self, *args, **opts):
+        replicas = [DummyLLM(latency=opts["latency"], token_latency=opts["token_latency"]) for _ in range(opts["replicas"])]
+        queue    = LLMQueue(replicas, max_depth=opts["depth"], concurrency=opts["concurrency"])
+
+        start = perf_counter()
+        results = asyncio.run(self._run(queue, opts))
+        total = perf_counter() - start
+
+        times    = np.array([t for session in results for t in session if t is not None])
+        rejected = sum(t is None for session in results for t in session)
+        per_session = [np.mean([t for t in session if t is not None]) for session in results if any(t is not None for t in session)]
+
+        self.stdout.write(f"{opts['sessions']} sessions x {opts['turns']} turns over {opts['replicas']} replica(s) in {total:.2f}s")
+        if len(times): self.stdout.write(f"reply latency: p50 {np.percentile(times, 50) * 1000:7.1f} ms | p95 {np.percentile(times, 95) * 1000:7.1f} ms | max {times.max() * 1000:7.1f} ms")
+        if per_session: self.stdout.write(f"mean per session: fastest {min(per_session) * 1000:7.1f} ms | slowest {max(per_session) * 1000:7.1f} ms")
+        self.stdout.write(f"rejected (queue full): {rejected} of {opts['sessions'] * opts['turns']}")
+
+    async def _run(self, queue, opts):
+        return await asyncio.gather(*(self._session(queue, session, opts) for session in range(opts["sessions"])))
+
+    @staticmethod
+    async def _session(queue, session, opts):
+        """ Reply time of each turn (None if it was turned away) """
+        times = []
+        for turn in range(opts["turns"]):
+            start = perf_counter()
+            try:                 await queue.complete(f"<|user|>\nturn {turn} of session {session}<|end|>", session=session); times.append(perf_counter() - start)
+            except LLMQueueFull: times.append(None)
+            await asyncio.sleep(opts["think"])
+        return times
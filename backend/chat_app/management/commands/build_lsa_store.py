@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+
+import os
+from time import perf_counter
+from chat_app.websocket.biomarkers.biomarker_models import lsa_store
+
+
+class Command(BaseCommand):
+    help = "Compiles new_LSA.csv / Hoffman entropy / stoplist.txt into the memory-mapped LSA store used by the pragmatic biomarker."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--out",          default=lsa_store.STORE_DIR,    help="Output directory for the store")
+        parser.add_argument("--vectors",      default=lsa_store.VECTORS_CSV,  help="LSA vectors CSV (tokens in the first column)")
+        parser.add_argument("--entropy",      default=lsa_store.ENTROPY_CSV,  help="Entropy CSV (column 'x', aligned with the vectors)")
+        parser.add_argument("--stoplist",     default=lsa_store.STOPLIST_TXT, help="Stop word list (one word per line)")
+        parser.add_argument("--if-missing",   action="store_true",            help="Do nothing if a store already exists in --out")
+
+    # ====================================================================
+    # Build the store, then load it back to check it
+    # ====================================================================
+    def handle(self, *args, **opts):
+        if opts["if_missing"]:
+            try:                      lsa_store.load_lsa_store(opts["out"]); self.stdout.write("LSA store already built."); return
+            except FileNotFoundError: pass
+
+            # Don't stop the container from starting just because the vectors haven't been copied in yet
+            if not os.path.exists(opts["vectors"]): self.stderr.write(f"{opts['vectors']} not found, skipping LSA store build."); return
+
+        start = perf_counter()
+        built = lsa_store.build_lsa_store(opts["out"], opts["vectors"], opts["entropy"], opts["stoplist"])
+        build_time = perf_counter() - start
+
+        start  = perf_counter()
+        loaded = lsa_store.load_lsa_store(opts["out"])
+        load_time = perf_counter() - start
+
+        if loaded.shape != built.shape or loaded.tok2id != built.tok2id: raise RuntimeError("LSA store did not round-trip")
+
+        V, D = loaded.shape
+        self.stdout.write(self.style.SUCCESS(f"Built LSA store ({V:,} tokens x {D} dims) in {build_time:.1f}s -> {opts['out']} (loads in {load_time * 1000:.0f} ms)"))
@@ -0,0 +1,69 @@
+from django.core.management.base import BaseCommand, CommandError
+
+import numpy as np
+from time            import perf_counter
+from chat_app.models import ChatMessage
+from chat_app.websocket.biomarkers.biomarker_models.altered_grammer import FEATURE_NAMES, utterance_grammar_features, grammar_score_from_features
+
+# Conversational sample (short & long turns, fillers, repetitions, run-on speech)
+SAMPLE = [
+    "I went to the store yesterday to buy some bread.",
+    "My daughter visits me every Sunday and we have lunch together.",
+    "Um, I don't I don't remember where I put my glasses.",
+    "We used to live in a small house near the lake when the kids were young, and every summer we went swimming.",
+    "yeah. and realistically, like, yeah, like it hurts but doesn't",
+    "The doctor said that I should walk more often because it is good for my heart.",
+    "She is cooking dinner for the whole family tonight.",
+    "what day is it today",
+    "I was reading the newspaper this morning and then the phone rang and it was my brother who lives in Chicago.",
+    "Having finished the garden, we sat down and talked about the old days.",
+    "I like it. I like the the music they play on the radio.",
+    "Because I forgot.",
+]
+
+# Columns that come from the constituency trees (the rest are the same for both parsers)
+TREE_COLUMNS = [0, 1, 2, 4, 5]
+
+
+class Command(BaseCommand):
+    help = "Compares altered grammar features & scores from Stanza constituency trees against the Stanford parser."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--db",           type=int,   default=0,    help="Also use the latest N user messages from the DB")
+        parser.add_argument("--window",       type=int,   default=5,    help="Utterances per scored window (like the context buffer)")
+        parser.add_argument("--word-seconds", type=float, default=0.4,  help="Speech duration per word for the per-minute features")
+        parser.add_argument("--tolerance",    type=float, default=0.05, help="Max allowed |score difference|")
+
+    # ====================================================================
+    # Both parsers on the same utterances -> feature & score differences
+    # ====================================================================
+    def handle(self, *args, **opts):
+        corpus = list(SAMPLE)
+        if opts["db"]: corpus += list(ChatMessage.objects.filter(role="user").order_by("-ts").values_list("content", flat=True)[:opts["db"]])
+
+        timings = {}
+        for parser in ("stanford", "stanza"):
+            utterance_grammar_features(corpus[:1], parser=parser) # (warm up: loads the pipeline / starts the JVM)
+            start = perf_counter(); timings[parser] = (utterance_grammar_features(corpus, parser=parser), perf_counter() - start)
+        (stanford, t_stanford), (stanza, t_stanza) = timings["stanford"], timings["stanza"]
+
+        # Per-feature differences (per utterance)
+        self.stdout.write(f"{len(corpus)} utterances, stanford {t_stanford:.2f}s vs stanza {t_stanza:.2f}s")
+        for col in TREE_COLUMNS + [3]:
+            diff = stanza[:, col] - stanford[:, col]
+            self.stdout.write(f"  {FEATURE_NAMES[col]:<24} stanford mean {stanford[:, col].mean():6.2f} | stanza mean {stanza[:, col].mean():6.2f} | "
+                              f"mean |diff| {np.abs(diff).mean():5.2f} | utterances that differ {np.count_nonzero(diff)}/{len(corpus)}")
+
+        # Scores over windows of utterances
+        scores = []
+        for i in range(0, len(corpus), opts["window"]):
+            window   = slice(i, i + opts["window"])
+            duration = max(stanford[window, 7].sum() * opts["word_seconds"], 1.0)
+            scores.append((grammar_score_from_features(stanford[window].sum(axis=0), duration), grammar_score_from_features(stanza[window].sum(axis=0), duration)))
+        scores = np.array(scores, dtype=np.float64)
+        diff   = np.abs(scores[:, 1] - scores[:, 0])
+        self.stdout.write(f"scores over {len(scores)} windows: max |diff| {diff.max():.4f}, mean |diff| {diff.mean():.4f} "
+                          f"(stanford mean {scores[:, 0].mean():.4f}, stanza mean {scores[:, 1].mean():.4f})")
+
+        if diff.max() > opts["tolerance"]: raise CommandError(f"Stanza scores differ by up to {diff.max():.4f} (> {opts['tolerance']}), keep GRAMMAR_PARSER = \"stanford\"")
+        self.stdout.write(self.style.SUCCESS("Stanza scores are within tolerance of the Stanford parser"))
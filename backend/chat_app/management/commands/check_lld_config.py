@@ -0,0 +1,73 @@
+from django.core.management.base import BaseCommand, CommandError
+
+import numpy as np
+import opensmile
+from time           import perf_counter
+from scipy.io       import wavfile
+from scipy.signal   import resample_poly
+from chat_app.websocket.biomarkers.biomarker_config  import SAMPLE_RATE
+from chat_app.websocket.biomarkers.utils.lld_config import LLD_FEATURES, lld_config_path
+
+
+class Command(BaseCommand):
+    help = "Checks the reduced biomarker LLD config against the full ComParE_2016 LLD set (values and speed)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("wavs",        nargs="*",                      help="Mono/stereo .wav files to compare on (default: 30s synthetic voice-like signal)")
+        parser.add_argument("--tolerance", type=float, default=1e-5,       help="Max allowed absolute difference")
+        parser.add_argument("--repeat",    type=int,   default=3,          help="Timing repetitions")
+
+    # ====================================================================
+    # Run both extractors on the same audio & compare
+    # ====================================================================
+    def handle(self, *args, **opts):
+        full    = opensmile.Smile(opensmile.FeatureSet.ComParE_2016, opensmile.FeatureLevel.LowLevelDescriptors, sampling_rate=SAMPLE_RATE)
+        reduced = opensmile.Smile(lld_config_path(), "lld", sampling_rate=SAMPLE_RATE)
+        if reduced.feature_names != LLD_FEATURES: raise CommandError(f"Reduced config outputs {reduced.feature_names}, expected {LLD_FEATURES}")
+
+        signals = [self._load(path) for path in opts["wavs"]] or [("synthetic", self._synthetic())]
+        worst   = 0.0
+        for name, signal in signals:
+            a = full   .process_signal(signal, SAMPLE_RATE)[LLD_FEATURES].to_numpy()
+            b = reduced.process_signal(signal, SAMPLE_RATE).to_numpy()
+            if a.shape != b.shape: raise CommandError(f"{name}: shapes differ {a.shape} vs {b.shape}")
+
+            diff  = np.nanmax(np.abs(a - b), axis=0)
+            worst = max(worst, float(diff.max()))
+            t_full    = self._time(full,    signal, opts["repeat"])
+            t_reduced = self._time(reduced, signal, opts["repeat"])
+            self.stdout.write(f"{name}: {a.shape[0]:,} frames, max |diff| {diff.max():.2e} ({LLD_FEATURES[int(diff.argmax())]}), "
+                              f"full {t_full * 1000:.0f} ms vs reduced {t_reduced * 1000:.0f} ms ({t_full / t_reduced:.2f}x)")
+
+        if worst > opts["tolerance"]: raise CommandError(f"Reduced LLD config differs from ComParE_2016 by {worst:.2e}")
+        self.stdout.write(self.style.SUCCESS(f"Reduced LLD config matches ComParE_2016 ({len(LLD_FEATURES)} features, max |diff| {worst:.2e})"))
+
+    # --------------------------------------------------------------------
+    # Helpers
+    # --------------------------------------------------------------------
+    @staticmethod
+    def _time(smile, signal, repeat):
+        times = []
+        for _ in range(repeat):
+            start = perf_counter(); smile.process_signal(signal, SAMPLE_RATE); times.append(perf_counter() - start)
+        return min(times)
+
+    @staticmethod
+    def _load(path):
+        rate, data = wavfile.read(path)
+        data = data.astype(np.float32) / (np.iinfo(data.dtype).max if data.dtype.kind == "i" else 1.0)
+        if data.ndim > 1: data = data.mean(axis=1)
+        if rate != SAMPLE_RATE:
+            g = np.gcd(rate, SAMPLE_RATE)
+            data = resample_poly(data, SAMPLE_RATE // g, rate // g).astype(np.float32)
+        return path, data
+
+    @staticmethod
+    def _synthetic(seconds=30):
+        """ Gliding harmonic "voice" switching on and off, plus noise (exercises pitch, voicing & jitter paths). """
+        rng = np.random.default_rng(0)
+        t   = np.arange(seconds * SAMPLE_RATE) / SAMPLE_RATE
+        f0  = 150 + 50 * np.sin(2 * np.pi * 0.3 * t)
+        ph  = 2 * np.pi * np.cumsum(f0) / SAMPLE_RATE
+        voice = sum(np.sin(k * ph) / k for k in range(1, 6)) * (np.sin(2 * np.pi * 0.5 * t) > 0)
+        return (0.3 * voice + 0.02 * rng.standard_normal(t.size)).astype(np.float32)
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from time import perf_counter
+from chat_app.websocket.biomarkers.biomarker_models.parser_service import ParserService
+
+SENTENCES = [
+    "I went to the store yesterday to buy some bread.",
+    "My daughter visits me every Sunday afternoon.",
+    "We used to live in a small house near the lake.",
+    "The doctor said that I should walk more often.",
+    "Um I don't remember where I put my glasses.",
+    "She is cooking dinner for the whole family tonight.",
+]
+
+
+class Command(BaseCommand):
+    help = "Round-trips several batches through ONE warm Stanford parser process (each must answer well within the timeout)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batches", type=int,   default=5,    help="Batches sent to the same process")
+        parser.add_argument("--timeout", type=float, default=20.0, help="Seconds each batch may take (PARSER_TIMEOUT)")
+
+    # ====================================================================
+    # Same process for every batch, same trees as parsing one at a time
+    # ====================================================================
+    def handle(self, *args, **opts):
+        service = ParserService(timeout=opts["timeout"])
+        try:
+            # One sentence per call first (also warms up the JVM & model)
+            reference = [service.parse([s])[0] for s in SENTENCES]
+            pid = service._proc.pid
+
+            for i in range(opts["batches"]):
+                batch = SENTENCES[i % len(SENTENCES):] + SENTENCES[:i % len(SENTENCES)]
+                start = perf_counter()
+                trees = service.parse(batch)
+                took  = perf_counter() - start
+
+                expected = reference[i % len(SENTENCES):] + reference[:i % len(SENTENCES)]
+                if service._proc is None or service._proc.pid != pid: raise CommandError(f"batch {i}: the parser process was restarted")
+                if trees != expected: raise CommandError(f"batch {i}: trees differ from parsing the sentences one at a time")
+                self.stdout.write(f"batch {i}: {len(batch)} sentences in {took * 1000:.0f} ms (pid {pid})")
+
+        finally:
+            service.close()
+        self.stdout.write(self.style.SUCCESS(f"{opts['batches']} batches through one parser process, no timeouts or restarts"))
@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+
+import os
+from time import perf_counter
+import numpy as np
+from chat_app.websocket.biomarkers.rf_models import flat_forest
+
+
+class Command(BaseCommand):
+    help = "Exports the prosody/pronunciation random forest pickles into the flat, memory-mapped arrays used for scoring."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--models",     default=os.path.dirname(os.path.abspath(flat_forest.__file__)), help="Directory with the *.pkl models")
+        parser.add_argument("--samples",    type=int, default=256,  help="Random windows used to check the export against sklearn")
+        parser.add_argument("--if-missing", action="store_true",    help="Skip models whose flat export was made from the same pickle")
+
+    # ====================================================================
+    # Export every model, then check it against the pickle
+    # ====================================================================
+    def handle(self, *args, **opts):
+        import joblib
+
+        paths = flat_forest.model_paths(opts["models"])
+        if not paths: self.stderr.write(f"No *.pkl models in {opts['models']}, nothing to export."); return
+
+        for path in paths:
+            out = flat_forest.flat_dir(path)
+            if opts["if_missing"] and flat_forest.export_is_current(path):
+                self.stdout.write(f"{os.path.basename(path)} already exported."); continue
+
+            model = joblib.load(path)
+            flat_forest.save_flat_forest(flat_forest.flatten_forest(model), out, source=flat_forest.source_fingerprint(path))
+
+            start  = perf_counter()
+            loaded = flat_forest.load_flat_forest(out)
+            load_time = perf_counter() - start
+
+            # Random windows on roughly the scale of the features (the split thresholds)
+            rng   = np.random.default_rng(0)
+            scale = np.abs(loaded.threshold).max() or 1.0
+            X     = rng.uniform(-scale, scale, size=(opts["samples"], loaded.n_features))
+            if not np.array_equal(model.predict_proba(X), loaded.predict_proba(X)): raise RuntimeError(f"{path}: flat forest does not match predict_proba")
+
+            sklearn_time = self._time(model.predict_proba,  X[:1])
+            flat_time    = self._time(loaded.predict_proba, X[:1])
+            self.stdout.write(self.style.SUCCESS(
+                f"{os.path.basename(path)}: {loaded.n_estimators} trees, {loaded.threshold.shape[0]:,} nodes -> {out} "
+                f"(loads in {load_time * 1000:.1f} ms, one window {flat_time * 1e6:.0f} us vs {sklearn_time * 1e6:.0f} us with sklearn)"))
+
+    @staticmethod
+    def _time(fn, X, repeat=50):
+        fn(X); start = perf_counter()
+        for _ in range(repeat): fn(X)
+        return (perf_counter() - start) / repeat
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth import get_user_model
+
+import csv, sys
+from time            import perf_counter
+from chat_app.models import ChatSession
+from chat_app.websocket.biomarkers                                  import biomarker_config as BioConfig
+from chat_app.websocket.biomarkers.biomarker_models.coherence_batch import batch_pragmatic_gc
+from chat_app.websocket.biomarkers.biomarker_models.lsa_store       import STORE_DIR
+
+
+class Command(BaseCommand):
+    help = "Re-scores pragmatic coherence for every closed ChatSession of a user (e.g. after the LSA space changes)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("username",                                                     help="User whose closed sessions are scored")
+        parser.add_argument("--workers",    type=int, default=BioConfig.COHERENCE_WORKERS,  help="Worker processes (0 = this process)")
+        parser.add_argument("--store",      default=STORE_DIR,                              help="Compiled LSA store directory")
+        parser.add_argument("--out",        default=None,                                   help="Write the results to this CSV instead of stdout")
+
+    # ====================================================================
+    # Gather transcripts -> batch score -> CSV
+    # ====================================================================
+    def handle(self, *args, **opts):
+        try:                              user = get_user_model().objects.get(username=opts["username"])
+        except get_user_model().DoesNotExist: raise CommandError(f"No user named {opts['username']!r}")
+
+        sessions    = list(ChatSession.objects.filter(user=user, is_active=False).order_by("date", "id").prefetch_related("messages"))
+        transcripts = [[(m.role, m.content, m.ts) for m in sorted(s.messages.all(), key=lambda m: (m.ts, m.id))] for s in sessions]
+
+        start  = perf_counter()
+        scores = batch_pragmatic_gc(transcripts, workers=opts["workers"], store_dir=opts["store"])
+        elapsed = perf_counter() - start
+
+        out = open(opts["out"], "w", newline="") if opts["out"] else sys.stdout
+        try:
+            writer = csv.writer(out)
+            writer.writerow(["session_id", "date", "user_messages", "coherence", "pragmatic"])
+            for session, transcript, gc in zip(sessions, transcripts, scores):
+                pragmatic = 0 if gc == 0 else (1.0 - gc) # same adjustment as generate_pragmatic_score
+                writer.writerow([session.id, session.date.isoformat(), sum(m[0] == "user" for m in transcript), f"{gc:.6f}", f"{pragmatic:.6f}"])
+        finally:
+            if out is not sys.stdout: out.close()
+
+        self.stderr.write(self.style.SUCCESS(f"Scored {len(sessions)} sessions in {elapsed:.2f}s"))
@@ -4,6 +4,7 @@ from ..models     import ChatSession, ChatMessage, ChatBiomarkerScore
 
 from .. import config as cf
 from .db_helpers import get_sentiment_topics
+from .metrics    import DB_WRITE
 
 import logging
 logger = logging.getLogger(__name__)
@@ -92,15 +93,18 @@ class ChatService:
     # -----------------------------------------------------------------------
     # Messages
     @staticmethod
+    @DB_WRITE.timed(operation="add_message")
     def add_message(session, role, text, *, start_ts=None, end_ts=None):
         return ChatMessage.objects.create(session=session, role=role, content=text, start_ts=start_ts, end_ts=end_ts)
     
     # Biomarker Scores
     @staticmethod
+    @DB_WRITE.timed(operation="add_biomarker")
     def add_biomarker(session, score_type, score):
         return ChatBiomarkerScore.objects.create(session=session, score_type=score_type, score=score)
     
     @staticmethod
+    @DB_WRITE.timed(operation="add_biomarkers_bulk")
     def add_biomarkers_bulk(session, scores: dict):
         ChatBiomarkerScore.objects.bulk_create([ChatBiomarkerScore(session=session, score_type=k, score=v) for k, v in scores.items()])
 
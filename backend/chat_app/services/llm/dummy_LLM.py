@@ -1,12 +1,43 @@
-import logging
+import asyncio, logging
 logger = logging.getLogger(__name__)
 
 # Dummy LLM class for testing
 class DummyLLM:
-    def __init__(self, *args, **kwargs):
-        self.num_messages = 0
+    """
+    Stand-in for a llama_api replica. Replies are deterministic, and with the latencies set it also behaves like one
+    (answers one request at a time, "evaluates" the prompt, then "generates" word by word), for load tests on a CPU:
+        latency        -- seconds per request
+        prompt_latency -- seconds per prompt word (prompt evaluation)
+        token_latency  -- seconds per reply word (generation)
+    """
+    def __init__(self, *args, latency=0.0, prompt_latency=0.0, token_latency=0.0, **kwargs):
+        self.num_messages   = 0
+        self.latency        = latency
+        self.prompt_latency = prompt_latency
+        self.token_latency  = token_latency
+        self._busy          = asyncio.Lock()
         logger.info("Dummy LLM initialized (no real model loaded)")
 
     async def __call__(self, prompt, max_tokens=None, stop=None, echo=False):
         self.num_messages += 1
-        return {"choices": [{"text": f"This is dummy response number {self.num_messages} from the LLM."}]}
\ No newline at end of file
+        return {"choices": [{"text": f"This is dummy response number {self.num_messages} from the LLM."}]}
+
+    async def complete(self, prompt, max_tokens=None, stop=None, slot_id=None):
+        async with self._busy:
+            text = (await self(prompt))["choices"][0]["text"]
+            await asyncio.sleep(self._prompt_time(prompt) + self.token_latency * len(text.split()))
+        return {"text": text, "finish_reason": "stop", "usage": {"prompt_tokens": len(prompt.split()), "completion_tokens": len(text.split())}, "timings": {}}
+
+    async def stream(self, prompt, max_tokens=None, stop=None, slot_id=None):
+        async with self._busy:
+            self.num_messages += 1
+            await asyncio.sleep(self._prompt_time(prompt))
+            for word in f"This is dummy response number {self.num_messages} from the LLM.".split(" "):
+                await asyncio.sleep(self.token_latency)
+                yield word if word.startswith("This") else f" {word}"
+
+    async def count_tokens(self, text): return len(text.split()) + 1
+
+    async def aclose(self): pass
+
+    def _prompt_time(self, prompt): return self.latency + self.prompt_latency * len(prompt.split())
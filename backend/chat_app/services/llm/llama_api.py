@@ -3,35 +3,118 @@ import logging
 logger = logging.getLogger(__name__)
 
 # Need this to communicate with the other container
+import asyncio, random, json
+from time import perf_counter
 import httpx
 
+# Only errors while connecting, before the request was sent -- safe to send again (a RemoteProtocolError or read
+# error can come after the server accepted the POST, and retrying that would start the generation twice)
+RETRY_ON = (httpx.ConnectError, httpx.ConnectTimeout)
+
 # --------------------------------------------------------------------
-# Class for communicating with the llama_api container server 
+# Class for communicating with the llama_api container server
 # --------------------------------------------------------------------
-# Might need to get this endpoint URL from somewhere else and not have it be hardcoded like this...
 class LlamaAPI:
     # Initialize with a given endpoint for the LLM API container
-    def __init__(self, base_url="http://llama_api:11434"):
+    def __init__(self, base_url="http://llama_api:11434", *, timeout=30.0, connect_timeout=2.0, max_connections=32,
+                 max_keepalive=16, keepalive_expiry=60.0, retries=2, backoff=0.1, http2=False):
         self.base_url = base_url
+        self.retries  = retries
+        self.backoff  = backoff
+
+        # One long-lived client (connection pool & keep-alive) for every request, closed by aclose() on ASGI shutdown
+        self._client = httpx.AsyncClient(
+            base_url = base_url,
+            http2    = http2,  # (needs httpx[http2])
+            timeout  = httpx.Timeout(timeout, connect=connect_timeout),
+            limits   = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive, keepalive_expiry=keepalive_expiry),
+        )
         logger.info(f"Llama API LLM initialized, URL: {self.base_url}")
 
     # Call the LLM from the API container
     async def __call__(self, prompt, max_tokens=None, stop=None, echo=False):
-        # Prepare input 
+        # Prepare input
         llm_json = {"prompt": prompt, "max_tokens": max_tokens, "stop": stop, "echo": echo}
 
         # Get a response from the API
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(f"{self.base_url}/v1/completions", json=llm_json)
-                response.raise_for_status()
-                return response.json()
-        
+            response = await self._send("/v1/completions", llm_json)
+            return response.json()
+
         # On error...
-        except httpx.HTTPError as e: 
+        except httpx.HTTPError as e:
             logger.error(f"LLM call failed: {e}")
             return {"error": str(e)}
-        
-        # --- Maybe make a default response to return here? ---
-        return response.json()
-    
+
+    # Only the generated text (no echoed prompt) & what the server reports about it
+    async def complete(self, prompt, max_tokens=None, stop=None, slot_id=None):
+        """
+        {"text", "finish_reason" ("stop" or "length"), "usage" (prompt/completion tokens), "timings"}
+        timings are the server's if it sends them (llama.cpp), otherwise the round trip measured here.
+        Raises httpx.HTTPError if the request fails.
+        """
+        llm_json = {"prompt": prompt, "max_tokens": max_tokens, "stop": stop, "echo": False, **self._cache_fields(slot_id)}
+
+        start  = perf_counter()
+        output = (await self._send("/v1/completions", llm_json)).json()
+        choice = output["choices"][0]
+        return {"text"         : choice.get("text") or "",
+                "finish_reason": choice.get("finish_reason"),
+                "usage"        : output.get("usage", {}),
+                "timings"      : output.get("timings") or {"request_ms": round((perf_counter() - start) * 1000, 1)}}
+
+    # Stream the completion as it is generated (server-sent events)
+    async def stream(self, prompt, max_tokens=None, stop=None, slot_id=None):
+        """ Yields each new piece of text; raises httpx.HTTPError if the request fails. """
+        llm_json = {"prompt": prompt, "max_tokens": max_tokens, "stop": stop, "stream": True, **self._cache_fields(slot_id)}
+
+        response = await self._send("/v1/completions", llm_json, stream=True)
+        try:
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"): continue
+                payload = line[len("data:"):].strip()
+                if payload == "[DONE]": break
+
+                text = json.loads(payload)["choices"][0].get("text") or ""
+                if text: yield text
+        finally:
+            await response.aclose()
+
+    # Tokens in text, by the model's tokenizer (BOS included)
+    async def count_tokens(self, text):
+        """ Raises httpx.HTTPError if the request fails. """
+        return (await self._send("/extras/tokenize/count", {"input": text})).json()["count"]
+
+    async def aclose(self):
+        await self._client.aclose()
+
+    # --------------------------------------------------------------------
+    # Helpers
+    # --------------------------------------------------------------------
+    @staticmethod
+    def _cache_fields(slot_id):
+        """
+        Ask the server to keep & reuse the evaluated prompt (llama.cpp server fields; llama-cpp-python ignores
+        them and reuses the matching prefix on its own, see --cache in llama_api/compose.yaml).
+        """
+        fields = {"cache_prompt": True}
+        if slot_id is not None: fields["id_slot"] = slot_id
+        return fields
+
+    async def _send(self, path, payload, stream=False):
+        """
+        POST with up to `retries` more attempts on connection errors (exponential backoff with jitter).
+        With stream=True only the headers have been read, the caller reads the body & closes the response.
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                response = await self._client.send(self._client.build_request("POST", path, json=payload), stream=stream)
+                if response.is_error:
+                    if stream: await response.aread(); await response.aclose()
+                    response.raise_for_status()
+                return response
+            except RETRY_ON as e:
+                if attempt == self.retries: raise
+                delay = self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+                logger.warning(f"LLM connection error ({type(e).__name__}), retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
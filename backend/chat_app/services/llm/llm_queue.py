@@ -0,0 +1,167 @@
+# Logging setup
+import logging
+logger = logging.getLogger(__name__)
+
+import asyncio
+from collections import OrderedDict, deque
+from contextlib  import asynccontextmanager, aclosing
+from time        import perf_counter
+
+from .. import metrics
+
+# The queue is full, the request is turned away right away instead of waiting
+class LLMQueueFull(Exception): pass
+
+# --------------------------------------------------------------------
+# Front-end queue for one or more LLM replicas (LlamaAPI or DummyLLM)
+# --------------------------------------------------------------------
+class LLMQueue:
+    """
+    Has the same methods as the clients it wraps (plus a session argument), and admits at most `concurrency`
+    requests per replica at a time. llama-cpp-python answers one request at a time, and with its default
+    interrupt_requests a second request ends a reply that is still streaming.
+
+        - Requests that find no free replica wait in per-session queues; sessions take turns (one request each per
+          round), so one busy session can't starve the others
+        - With `max_depth` requests already waiting, one request is turned away with LLMQueueFull (the caller answers
+          with ERROR_UTTERANCE): the newest one of the session with the most waiting, so one session filling the
+          queue can't lock out another session's first request (the new request itself if its session is that one)
+        - A session goes to its own replica (hash of the session id) when that one is free, so the replica's prompt
+          cache is still warm; otherwise to the next free replica, round-robin
+        - Token counts skip the queue and go to the session's own replica (see count_tokens)
+    """
+    def __init__(self, replicas, max_depth=32, concurrency=1):
+        self.replicas    = list(replicas)
+        self.max_depth   = max_depth
+        self.concurrency = concurrency
+
+        self._active  = [0] * len(self.replicas)  # requests in flight per replica
+        self._waiting = OrderedDict()             # session -> deque of futures (the order sessions take turns in)
+        self._depth   = 0                         # futures in _waiting
+        self._next    = 0                         # round-robin pointer
+        logger.info(f"LLM queue over {len(self.replicas)} replica(s), {concurrency} request(s) each, max {max_depth} waiting")
+
+    # --------------------------------------------------------------------
+    # Client API (queued)
+    # --------------------------------------------------------------------
+    async def __call__(self, prompt, max_tokens=None, stop=None, echo=False, session=None):
+        async with self._replica(session) as llm: return await llm(prompt, max_tokens, stop, echo)
+
+    async def complete(self, prompt, max_tokens=None, stop=None, slot_id=None, session=None):
+        async with self._replica(session) as llm: return await llm.complete(prompt, max_tokens, stop, slot_id=slot_id)
+
+    async def stream(self, prompt, max_tokens=None, stop=None, slot_id=None, session=None):
+        """ The replica is held until the stream is done (or closed). """
+        async with self._replica(session) as llm, aclosing(llm.stream(prompt, max_tokens, stop, slot_id=slot_id)) as stream:
+            async for text in stream: yield text
+
+    # --------------------------------------------------------------------
+    # Client API (not queued, the queue only admits generations)
+    # --------------------------------------------------------------------
+    async def count_tokens(self, text, session=None):
+        """
+        Straight to the session's own replica (no queue slot), or None while that replica is generating: llama-cpp-python
+        would only answer once the reply is done, so the caller estimates instead of waiting a second time
+        """
+        index = self._own(session)
+        if self._active[index]: return None
+        return await self.replicas[index].count_tokens(text)
+
+    async def aclose(self):
+        await asyncio.gather(*(replica.aclose() for replica in self.replicas))
+
+    # --------------------------------------------------------------------
+    # Scheduling
+    # --------------------------------------------------------------------
+    @asynccontextmanager
+    async def _replica(self, session):
+        index = await self._acquire(session)
+        try:     yield self.replicas[index]
+        finally: self._release(index)
+
+    async def _acquire(self, session) -> int:
+        start = perf_counter()
+
+        # Nobody waiting & a replica free: straight through
+        if not self._depth:
+            index = self._free(session)
+            if index is not None:
+                self._take(index); metrics.QUEUE_WAIT.observe(0.0, pool="llm")
+                return index
+
+        # Full: fail fast, at the expense of the session with the most requests waiting
+        if self._depth >= self.max_depth: self._shed(session)
+
+        # Wait for this session's turn
+        future = asyncio.get_running_loop().create_future()
+        self._waiting.setdefault(session, deque()).append(future)
+        self._depth += 1; metrics.LLM_QUEUE_DEPTH.set(self._depth)
+        try:
+            index = await future
+        except asyncio.CancelledError:
+            if   future.cancelled()        : self._forget(session, future)   # (still queued)
+            elif future.exception() is None: self._release(future.result())  # (cancelled right after getting a replica)
+            raise
+
+        metrics.QUEUE_WAIT.observe(perf_counter() - start, pool="llm")
+        return index
+
+    def _release(self, index):
+        self._active[index] -= 1
+        metrics.LLM_IN_FLIGHT.dec(replica=str(index))
+        self._dispatch()
+
+    def _dispatch(self):
+        """ Hand free replicas to the waiting sessions, one request per session per round """
+        while self._waiting:
+            session, queue = next(iter(self._waiting.items()))
+            index = self._free(session)
+            if index is None: break
+
+            future = queue.popleft(); self._depth -= 1
+            if queue: self._waiting.move_to_end(session)
+            else:     del self._waiting[session]
+
+            if future.done(): continue  # (cancelled, its task hasn't run its cleanup yet)
+            self._take(index); future.set_result(index)
+        metrics.LLM_QUEUE_DEPTH.set(self._depth)
+
+    # --------------------------------------------------------------------
+    # Helpers
+    # --------------------------------------------------------------------
+    def _free(self, session):
+        """ The session's own replica if it is free, else the next free one (None if they are all busy) """
+        if session is not None:
+            own = self._own(session)
+            if self._active[own] < self.concurrency: return own
+
+        for k in range(len(self.replicas)):
+            index = (self._next + k) % len(self.replicas)
+            if self._active[index] < self.concurrency:
+                self._next = index + 1
+                return index
+        return None
+
+    def _shed(self, session):
+        """ Queue full: reject the new request, or (if another session has more than one more waiting) that one's newest """
+        hog = max(self._waiting, key=lambda s: len(self._waiting[s]), default=None)
+        metrics.LLM_REJECTED.inc()
+        if hog is None or len(self._waiting[hog]) <= len(self._waiting.get(session, ())) + 1:
+            raise LLMQueueFull(f"{self._depth} LLM requests already waiting")
+
+        future = self._waiting[hog].pop(); self._depth -= 1
+        if not self._waiting[hog]: del self._waiting[hog]
+        if not future.done(): future.set_exception(LLMQueueFull(f"{self._depth + 1} LLM requests already waiting, a newer session's request went first"))
+
+    def _own(self, session): return hash(session) % len(self.replicas)
+
+    def _take(self, index):
+        self._active[index] += 1
+        metrics.LLM_IN_FLIGHT.inc(replica=str(index))
+
+    def _forget(self, session, future):
+        queue = self._waiting.get(session)
+        if queue is None or future not in queue: return
+        queue.remove(future); self._depth -= 1
+        if not queue: del self._waiting[session]
+        metrics.LLM_QUEUE_DEPTH.set(self._depth)
@@ -0,0 +1,170 @@
+# =======================================================================
+# Metrics -- latency histograms & gauges for the turn pipeline
+# =======================================================================
+"""
+In-process metrics, served in the Prometheus text format at /api/metrics/ (see api/metrics.py).
+
+    - Histogram: observe(seconds, **labels), or time it with `with HIST.time(...)` / `@HIST.timed(...)`
+    - Gauge:     inc/dec/set(**labels)
+    - Counter:   inc(**labels)
+
+Everything lives in this process (the ASGI server). Jobs in the biomarker worker pools are timed from here,
+around the pool call, so those numbers include the time spent getting to & from the worker.
+
+"""
+import asyncio, threading
+from bisect      import bisect_left
+from contextlib  import contextmanager
+from functools   import wraps
+from time        import perf_counter
+
+CONTENT_TYPE    = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_REGISTRY = []
+
+
+# =======================================================================
+# Metric Types
+# =======================================================================
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _label_str(names, values) -> str:
+    """ {name="value",...} (empty string without labels) """
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class _Metric:
+    kind = ""
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._lock = threading.Lock()
+        _REGISTRY.append(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labels): raise ValueError(f"{self.name} takes the labels {self.labels}, got {tuple(labels)}")
+        return tuple(labels[name] for name in self.labels)
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+# -----------------------------------------------------------------------
+# Histogram
+# -----------------------------------------------------------------------
+class Histogram(_Metric):
+    kind = "histogram"
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}   # labels -> [bucket counts (+Inf last), sum]
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._series.get(key) or ([0] * (len(self.buckets) + 1), 0.0)
+            counts[bisect_left(self.buckets, value)] += 1
+            self._series[key] = [counts, total + value]
+
+    @contextmanager
+    def time(self, **labels):
+        start = perf_counter()
+        try:     yield
+        finally: self.observe(perf_counter() - start, **labels)
+
+    def timed(self, **labels):
+        """ Decorator version of time() (sync & async functions). """
+        def decorator(fn):
+            if asyncio.iscoroutinefunction(fn):
+                @wraps(fn)
+                async def async_wrapper(*args, **kwargs):
+                    with self.time(**labels): return await fn(*args, **kwargs)
+                return async_wrapper
+
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.time(**labels): return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def render(self):
+        lines = super().render()
+        with self._lock: series = {key: (list(counts), total) for key, (counts, total) in self._series.items()}
+
+        for key, (counts, total) in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_label_str((*self.labels, 'le'), (*key, bound))} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_str(self.labels, key)} {total}")
+            lines.append(f"{self.name}_count{_label_str(self.labels, key)} {cumulative}")
+        return lines
+
+# -----------------------------------------------------------------------
+# Gauge
+# -----------------------------------------------------------------------
+class Gauge(_Metric):
+    kind = "gauge"
+    def __init__(self, name, help, labels=()):
+        super().__init__(name, help, labels)
+        self._values = {}
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock: self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock: self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels): self.inc(-amount, **labels)
+
+    def render(self):
+        lines = super().render()
+        with self._lock: values = dict(self._values)
+        lines += [f"{self.name}{_label_str(self.labels, key)} {value}" for key, value in sorted(values.items())]
+        return lines
+
+# -----------------------------------------------------------------------
+# Counter
+# -----------------------------------------------------------------------
+class Counter(Gauge):
+    kind = "counter"
+    def inc(self, amount=1, **labels):
+        if amount < 0: raise ValueError(f"{self.name} can only go up")
+        super().inc(amount, **labels)
+
+    def set(self, value, **labels): raise TypeError(f"{self.name} is a counter, use inc()")
+    def dec(self, amount=1, **labels): raise TypeError(f"{self.name} is a counter, use inc()")
+
+# -----------------------------------------------------------------------
+# Exposition
+# -----------------------------------------------------------------------
+def render() -> str:
+    """ Every registered metric in the Prometheus text format. """
+    return "\n".join(line for metric in _REGISTRY for line in metric.render()) + "\n"
+
+
+# =======================================================================
+# Turn Pipeline Metrics
+# =======================================================================
+# Conversation
+STT_TO_LLM      = Histogram("turn_stt_final_to_llm_seconds", "Final transcript received -> LLM reply sent to the client")
+LLM_LATENCY     = Histogram("llm_request_seconds",           "LLM request latency")
+LLM_FIRST_TOKEN = Histogram("llm_first_token_seconds",       "LLM request -> first streamed text")
+TTS_LATENCY     = Histogram("tts_seconds",                   "Text-to-speech synthesis time")
+
+# LLM queue (services/llm/llm_queue.py; its wait is QUEUE_WAIT{pool="llm"})
+LLM_QUEUE_DEPTH = Gauge    ("llm_queue_depth",               "LLM requests waiting for a free replica")
+LLM_IN_FLIGHT   = Gauge    ("llm_in_flight",                 "LLM requests being answered",                       labels=("replica",))
+LLM_REJECTED    = Counter  ("llm_rejected_total",            "LLM requests turned away because the queue was full")
+LLM_SPECULATION = Counter  ("llm_speculation_total",         "Speculative LLM requests by outcome (hit/miss/restarted)", labels=("outcome",))
+
+# Biomarkers ("audio" is one window of prosody/pronunciation/turntaking, they are scored together)
+BIOMARKER       = Histogram("biomarker_seconds",             "Time to get a biomarker score, pool wait included", labels=("biomarker",))
+QUEUE_WAIT      = Histogram("executor_queue_wait_seconds",   "Time a job waited for a free pool worker",          labels=("pool",))
+POOL_BACKLOG    = Gauge    ("pool_backlog",                  "Jobs submitted to a pool that haven't finished",    labels=("pool",))
+
+# Sessions & DB
+ACTIVE_SESSIONS = Gauge    ("active_sessions",               "Open chat websockets")
+DB_WRITE        = Histogram("db_write_seconds",              "DB write latency",                                  labels=("operation",))
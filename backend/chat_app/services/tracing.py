@@ -0,0 +1,140 @@
+# =======================================================================
+# Tracing -- per-turn spans with a correlation id
+# =======================================================================
+"""
+Every user turn gets a turn id (with tracing.turn(): ...) that is carried in a contextvar, so everything awaited or
+spawned inside the block (asyncio tasks copy the context, so do run_coroutine_threadsafe calls from the STT thread)
+records its spans under the same id. The id is reset when the block ends, so later work on the same connection
+(audio, periodic biomarkers) isn't filed under the last turn:
+
+    with tracing.span("llm"): ...            # or @tracing.traced("tts")
+
+Each span is {turn, span, start, end, ms[, attrs][, error]}. They are kept in memory (last TRACE_BUFFER, see
+/api/traces/ with DEBUG on) and appended to TRACE_FILE as JSON lines.
+
+Work started before its turn exists (a speculative LLM request) records under capture(): its spans wait in a
+SpanBuffer until release(turn_id) files them under the turn that uses the result (they are dropped otherwise).
+
+"""
+import json, logging, threading, uuid, asyncio
+from collections import deque
+from contextlib  import contextmanager
+from contextvars import ContextVar
+from functools   import wraps
+from time        import time
+
+from .. import config as cf
+
+TURN_ID: ContextVar[str | None] = ContextVar("turn_id", default=None)
+_CAPTURE: ContextVar["SpanBuffer | None"] = ContextVar("span_capture", default=None)
+
+_SPANS = deque(maxlen=cf.TRACE_BUFFER)
+_LOCK  = threading.Lock()
+
+# JSON lines export (its own file, not dm.log)
+_export = logging.getLogger("chat_app.traces")
+_export.propagate = False
+if cf.TRACE_TURNS and cf.TRACE_FILE and not _export.handlers:
+    _handler = logging.FileHandler(cf.TRACE_FILE); _handler.setFormatter(logging.Formatter("%(message)s"))
+    _export.addHandler(_handler); _export.setLevel(logging.INFO)
+
+
+# =======================================================================
+# Recording
+# =======================================================================
+def _record(turn_id, name, start, end, attrs=None, error=None):
+    buffer = _CAPTURE.get()
+    if buffer is not None:
+        if not buffer.released: buffer.records.append((name, start, end, attrs, error)); return
+        turn_id = buffer.turn_id
+
+    record = {"turn": turn_id, "span": name, "start": start, "end": end, "ms": round((end - start) * 1000, 3)}
+    if attrs: record["attrs"] = attrs
+    if error: record["error"] = error
+
+    with _LOCK: _SPANS.append(record)
+    _export.info(json.dumps(record, default=str))
+
+@contextmanager
+def turn(**attrs):
+    """ New turn id for the block (and a "turn" marker span with the given attributes); the previous one after it. """
+    turn_id = uuid.uuid4().hex[:12]
+    token   = TURN_ID.set(turn_id)
+    if cf.TRACE_TURNS: now = time(); _record(turn_id, "turn", now, now, attrs)
+    try:     yield turn_id
+    finally: TURN_ID.reset(token)
+
+@contextmanager
+def span(name, **attrs):
+    """ Times the block as one span of the current turn (exceptions are recorded & re-raised). """
+    if not cf.TRACE_TURNS: yield; return
+
+    turn_id, start, error = TURN_ID.get(), time(), None
+    try:
+        yield
+    except BaseException as e:
+        error = type(e).__name__; raise
+    finally:
+        _record(turn_id, name, start, time(), attrs, error)
+
+class SpanBuffer:
+    """ Spans recorded under capture(), held until release() gives them a turn (later ones go straight to it). """
+    def __init__(self):
+        self.records  = []
+        self.turn_id  = None
+        self.released = False
+
+    def release(self, turn_id):
+        self.turn_id, self.released = turn_id, True
+        records, self.records = self.records, []
+        for name, start, end, attrs, error in records: _record(turn_id, name, start, end, attrs, error)
+
+@contextmanager
+def capture(buffer: SpanBuffer):
+    """ Spans recorded inside the block (and the tasks it starts) go to buffer instead of the current turn. """
+    token = _CAPTURE.set(buffer)
+    try:     yield buffer
+    finally: _CAPTURE.reset(token)
+
+def traced(name=None, **attrs):
+    """ Decorator version of span() (sync & async functions, named after the function by default). """
+    def decorator(fn):
+        span_name = name or fn.__qualname__
+        if asyncio.iscoroutinefunction(fn):
+            @wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name, **attrs): return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(span_name, **attrs): return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# =======================================================================
+# Queries (for /api/traces/)
+# =======================================================================
+def spans(turn_id=None, limit=500) -> list[dict]:
+    """ Most recent spans, oldest first (only the given turn's if turn_id is set). """
+    with _LOCK: records = list(_SPANS)
+    if turn_id is not None: records = [r for r in records if r["turn"] == turn_id]
+    return records[-limit:]
+
+def slowest_turns(n=20) -> list[dict]:
+    """ The n slowest turns still in memory, with the stage that took the longest in each. """
+    turns = {}
+    for record in spans(limit=len(_SPANS)):
+        if record["turn"] is not None: turns.setdefault(record["turn"], []).append(record)
+
+    summary = []
+    for turn_id, records in turns.items():
+        start, end = min(r["start"] for r in records), max(r["end"] for r in records)
+
+        # The stage to blame is the slowest span that doesn't wrap other spans (handle_stt_output wraps the llm call)
+        stages  = [r for r in records if r["ms"] > 0 and not any(o is not r and o["ms"] > 0 and r["start"] <= o["start"] and o["end"] <= r["end"] for o in records)]
+        slowest = max(stages or records, key=lambda r: r["ms"])
+        summary.append({"turn": turn_id, "start": start, "ms": round((end - start) * 1000, 3),
+                        "slowest_span": slowest["span"], "slowest_ms": slowest["ms"], "spans": len(records)})
+    return sorted(summary, key=lambda t: t["ms"], reverse=True)[:n]
@@ -1,3 +1,676 @@
-from django.test import TestCase
+from django.test import SimpleTestCase
 
-# Create your tests here.
+import numpy as np
+
+
+# =======================================================================
+# Reduced LLD config (user-010) -- same values as the full ComParE_2016 set
+# =======================================================================
+class ReducedLLDConfigTests(SimpleTestCase):
+    def test_matches_compare_2016(self):
+        import opensmile
+        from chat_app.management.commands.check_lld_config   import Command
+        from chat_app.websocket.biomarkers.biomarker_config  import SAMPLE_RATE
+        from chat_app.websocket.biomarkers.utils.lld_config import LLD_FEATURES, lld_config_path
+
+        full    = opensmile.Smile(opensmile.FeatureSet.ComParE_2016, opensmile.FeatureLevel.LowLevelDescriptors, sampling_rate=SAMPLE_RATE)
+        reduced = opensmile.Smile(lld_config_path(), "lld", sampling_rate=SAMPLE_RATE)
+        self.assertEqual(reduced.feature_names, LLD_FEATURES)
+
+        signal = Command._synthetic(seconds=10)
+        a = full   .process_signal(signal, SAMPLE_RATE)[LLD_FEATURES].to_numpy()
+        b = reduced.process_signal(signal, SAMPLE_RATE).to_numpy()
+        self.assertEqual(a.shape, b.shape)
+        self.assertLessEqual(float(np.nanmax(np.abs(a - b))), 1e-5)
+
+
+# =======================================================================
+# Flat random forest (user-013) -- bit-identical to sklearn, tied to its pickle
+# =======================================================================
+class FlatForestTests(SimpleTestCase):
+    def setUp(self):
+        import tempfile, joblib
+        from sklearn.ensemble import RandomForestClassifier
+
+        rng = np.random.default_rng(0)
+        self.X_train = rng.normal(size=(400, 12)); self.y_train = (self.X_train[:, 0] + self.X_train[:, 3] ** 2 > 1).astype(int)
+        self.model   = RandomForestClassifier(n_estimators=25, max_depth=8, random_state=0).fit(self.X_train, self.y_train)
+        self.X       = rng.uniform(-3, 3, size=(256, 12))
+
+        self.tmp  = tempfile.TemporaryDirectory(); self.addCleanup(self.tmp.cleanup)
+        self.path = f"{self.tmp.name}/model.pkl"; joblib.dump(self.model, self.path)
+
+    def test_predict_proba_matches_sklearn(self):
+        from chat_app.websocket.biomarkers.rf_models import flat_forest
+        out = flat_forest.flat_dir(self.path)
+        flat_forest.save_flat_forest(flat_forest.flatten_forest(self.model), out, source=flat_forest.source_fingerprint(self.path))
+
+        loaded = flat_forest.load_flat_forest(out)
+        self.assertTrue(np.array_equal(self.model.predict_proba(self.X), loaded.predict_proba(self.X)))
+        self.assertTrue(np.array_equal(self.model.predict(self.X), loaded.predict(self.X)))
+
+    def test_export_is_stale_once_the_pickle_changes(self):
+        import joblib
+        from chat_app.websocket.biomarkers.rf_models import flat_forest
+        self.assertFalse(flat_forest.export_is_current(self.path))
+
+        flat_forest.save_flat_forest(flat_forest.flatten_forest(self.model), flat_forest.flat_dir(self.path), source=flat_forest.source_fingerprint(self.path))
+        self.assertTrue(flat_forest.export_is_current(self.path))
+
+        joblib.dump(self.model.set_params(n_estimators=30).fit(self.X_train, self.y_train), self.path)
+        self.assertFalse(flat_forest.export_is_current(self.path))
+
+
+# =======================================================================
+# Batch pragmatic coherence (user-008) -- same scores as coherence_v2, one transcript at a time
+# =======================================================================
+class BatchCoherenceTests(SimpleTestCase):
+    WORDS = ("store bread daughter sunday lunch glasses house lake summer swimming doctor walk heart dinner family "
+             "newspaper morning phone brother chicago garden music radio kids young old days weather rain").split()
+
+    def setUp(self):
+        import tempfile
+        import pandas as pd
+        from chat_app.websocket.biomarkers.biomarker_models.lsa_store import build_lsa_store
+
+        # A small random LSA space (vectors, entropy & stop list written like the real CSV/TXT files)
+        rng = np.random.default_rng(0)
+        self.tmp = tempfile.TemporaryDirectory(); self.addCleanup(self.tmp.cleanup)
+        vocab    = list(self.WORDS) + ["the", "and", "to"]
+        pd.DataFrame(rng.normal(size=(len(vocab), 16)), index=vocab).to_csv(f"{self.tmp.name}/vectors.csv")
+        pd.DataFrame({"x": rng.uniform(0.2, 1.0, size=len(vocab))}).to_csv(f"{self.tmp.name}/entropy.csv", index=False)
+        with open(f"{self.tmp.name}/stoplist.txt", "w") as f: f.write("the\nand\nto\n")
+
+        self.store_dir = f"{self.tmp.name}/store"
+        self.store     = build_lsa_store(self.store_dir, f"{self.tmp.name}/vectors.csv", f"{self.tmp.name}/entropy.csv", f"{self.tmp.name}/stoplist.txt")
+
+        # Transcripts of (role, text) messages: long & short turns, unknown words, one without user turns
+        def utterance(n): return " ".join(rng.choice(self.WORDS + ["the", "and", "to", "um", "xyzzy"], size=n))
+        self.transcripts = [[(role, utterance(int(rng.integers(1, 60)))) for role in ("user", "assistant") * int(rng.integers(1, 6))] for _ in range(12)]
+        self.transcripts.append([("assistant", "Hello, how are you today?")])
+
+    def _expected(self):
+        import pandas as pd
+        from chat_app.websocket.biomarkers.biomarker_models.coherence_v2 import pragmatic_gc_mean
+        return [pragmatic_gc_mean(pd.DataFrame(t, columns=["participants", "response"]), self.store) for t in self.transcripts]
+
+    def test_matches_pragmatic_gc_mean(self):
+        from chat_app.websocket.biomarkers.biomarker_models.coherence_batch import batch_pragmatic_gc
+        scores = batch_pragmatic_gc(self.transcripts, workers=0, store_dir=self.store_dir)
+        np.testing.assert_allclose(scores, self._expected(), rtol=0, atol=1e-7)
+
+    def test_matches_pragmatic_gc_mean_on_workers(self):
+        from chat_app.websocket.biomarkers.biomarker_models.coherence_batch import batch_pragmatic_gc
+        scores = batch_pragmatic_gc(self.transcripts, workers=2, store_dir=self.store_dir, max_tokens=100)
+        np.testing.assert_allclose(scores, self._expected(), rtol=0, atol=1e-7)
+
+
+# =======================================================================
+# Streaming LLDs (user-009) -- FeatureStream blocks vs process_signal on the same audio
+# =======================================================================
+class StreamingFeatureTests(SimpleTestCase):
+    TOLERANCE = 1e-4  # max |difference| of any LLD (0.0 when last measured)
+
+    def test_blocks_match_process_signal_at_fixed_gain(self):
+        """ Only holds while the running peak doesn't move (why STREAMING_FEATURES is off by default). """
+        from chat_app.management.commands.check_lld_config  import Command
+        from chat_app.websocket.biomarkers.biomarker_config import SAMPLE_RATE
+        from chat_app.websocket.services.featureStream      import FeatureStream, _SMILE, _PROSODY_IDX, _PRONUNCIATION_IDX
+
+        signal = Command._synthetic(seconds=12)
+        pcm    = np.round(signal / np.abs(signal).max() * 32767).astype(np.int16)
+
+        stream = FeatureStream(peak=32767.0)
+        for i in range(0, pcm.size, SAMPLE_RATE // 10): stream.write(pcm[i:i + SAMPLE_RATE // 10].tobytes())
+        stream.close()
+        blocks = stream.ready_blocks()
+
+        reference = _SMILE.process_signal(pcm.astype(np.float32) / 32768, SAMPLE_RATE).to_numpy()
+        self.assertEqual(len(blocks), reference.shape[0] // stream.block_frames)
+        for k, (prosody, pronunciation) in enumerate(blocks):
+            rows = reference[k * stream.block_frames:(k + 1) * stream.block_frames]
+            self.assertLessEqual(float(np.abs(prosody       - rows[:, _PROSODY_IDX      ]).max()), self.TOLERANCE)
+            self.assertLessEqual(float(np.abs(pronunciation - rows[:, _PRONUNCIATION_IDX]).max()), self.TOLERANCE)
+
+
+# =======================================================================
+# LLM queue (user-024) -- fair turns, fail fast at admission, slots freed on cancel
+# =======================================================================
+class LLMQueueTests(SimpleTestCase):
+    def _queue(self, replicas=1, max_depth=32, latency=0.02):
+        from chat_app.services.llm.dummy_LLM import DummyLLM
+        from chat_app.services.llm.llm_queue import LLMQueue
+        return LLMQueue([DummyLLM(latency=latency) for _ in range(replicas)], max_depth=max_depth)
+
+    async def _submit(self, queue, session, name, done):
+        import asyncio
+        task = asyncio.create_task(queue.complete("prompt", session=session))
+        task.add_done_callback(lambda t: done.append(name) if not t.cancelled() and t.exception() is None else None)
+        await asyncio.sleep(0)  # (let it queue, so the submission order is the arrival order)
+        return task
+
+    async def test_sessions_take_turns(self):
+        import asyncio
+        queue, done = self._queue(), []
+        tasks = [await self._submit(queue, "a", f"a{i}", done) for i in range(1, 5)] + [await self._submit(queue, "b", "b1", done)]
+        await asyncio.gather(*tasks)
+        self.assertEqual(done, ["a1", "a2", "b1", "a3", "a4"])
+
+    async def test_full_queue_rejects_the_busiest_session(self):
+        import asyncio
+        from chat_app.services.llm.llm_queue import LLMQueueFull
+        queue, done = self._queue(max_depth=3), []
+        a = [await self._submit(queue, "a", f"a{i}", done) for i in range(1, 5)]  # a1 runs, a2-a4 wait (full)
+        b = await self._submit(queue, "b", "b1", done)                            # a new session: a4 makes room
+        with self.assertRaises(LLMQueueFull): await queue.complete("prompt", session="a")  # a still has the most waiting
+        c = await self._submit(queue, "c", "c1", done)                            # a3 makes room
+
+        results = await asyncio.gather(*a, b, c, return_exceptions=True)
+        self.assertEqual([type(r).__name__ for r in results], ["dict", "dict", "LLMQueueFull", "LLMQueueFull", "dict", "dict"])
+        self.assertEqual(done, ["a1", "a2", "b1", "c1"])
+        self.assertEqual((queue._depth, queue._active), (0, [0]))
+
+    async def test_cancel_frees_the_slot(self):
+        import asyncio
+        from contextlib import aclosing
+        queue, done = self._queue(latency=10.0), []
+        running = await self._submit(queue, "a", "a1", done)
+        waiting = await self._submit(queue, "b", "b1", done)
+
+        waiting.cancel(); await asyncio.gather(waiting, return_exceptions=True)
+        self.assertEqual((queue._depth, queue._waiting), (0, {}))
+        running.cancel(); await asyncio.gather(running, return_exceptions=True)
+        self.assertEqual(queue._active, [0])
+
+        # A stream closed early gives its replica back too
+        queue.replicas[0].latency = 0.0
+        async with aclosing(queue.stream("prompt", session="a")) as stream:
+            async for _ in stream: break
+        self.assertEqual(queue._active, [0])
+        self.assertEqual(done, [])
+
+
+# =======================================================================
+# Vectorized coherence (user-005) -- same GC as the per-window loop it replaced
+# =======================================================================
+class CoherenceV2ParityTests(SimpleTestCase):
+    TOLERANCE = 1e-6  # float32 sums in a different order (max ~3.3e-7 when last measured)
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.vocab   = [f"w{i}" for i in range(40)]
+        self.tok2id  = {w: i for i, w in enumerate(self.vocab)}
+        self.vecs    = rng.normal(size=(len(self.vocab), 16)).astype(np.float32)
+        self.vecs[7] = 0.0                                                          # (a zero vector, for norm=True)
+        self.entropy = rng.uniform(0.0, 1.0, size=len(self.vocab)).astype(np.float32)
+        self.entropy[3] = 0.0                                                       # (a zero weight)
+
+        # Repeated words, out-of-vocab words & stop words, short and long utterances
+        words = self.vocab[:12] + ["oov", "the"]
+        self.texts = [" ".join(rng.choice(words, size=int(n))) for n in rng.integers(1, 80, size=40)]
+
+    def _reference(self, text, norm, f_weight, winsize):
+        """ The per-window loop coherence_v2 used before it was vectorized (returns the windows & the GC). """
+        tokens = [t for t in text.split() if t != "the"]
+        W, D   = len(tokens), self.vecs.shape[1]
+        win_emb = np.zeros((W, D), dtype=np.float32)
+        for i in range(W):
+            ids = [self.tok2id[t] for t in tokens[max(0, i - winsize + 1):i + 1] if t in self.tok2id]
+            if not ids: continue
+            uniq, cnt = np.unique(np.array(ids, dtype=np.int64), return_counts=True)
+
+            if   f_weight == "logfreq": w = np.log10(cnt.astype(np.float32) + 1.0)
+            elif f_weight == "freq"   : w = cnt.astype(np.float32)
+            else                      : w = np.ones_like(cnt, dtype=np.float32)
+
+            w = w * self.entropy[uniq]
+            M = self.vecs[uniq, :]
+            if norm:
+                d = np.linalg.norm(M, axis=1); d[d == 0] = 1.0
+                M = M / d[:, None]
+            if w.sum() != 0: win_emb[i, :] = (w[:, None] * M).sum(axis=0) / w.sum()
+
+        valid = np.linalg.norm(win_emb, axis=1) > 0
+        if valid.sum() < 2: return win_emb, None
+        mean_all, n = win_emb[valid].mean(axis=0), int(valid.sum())
+        cos = []
+        for row in win_emb[valid]:
+            other  = (mean_all * n - row) / (n - 1)
+            na, nb = np.linalg.norm(row), np.linalg.norm(other)
+            cos.append(0.0 if na == 0 or nb == 0 else float(np.dot(row, other) / (na * nb)))
+        return win_emb, float(np.mean(cos))
+
+    def test_matches_the_per_window_loop(self):
+        from chat_app.websocket.biomarkers.biomarker_models.coherence_v2 import _window_embeddings, _global_coherence, utterance_gc
+        for f_weight in ("logfreq", "freq", "none"):
+            for winsize in (1, 3, 20):
+                for norm in (True, False):
+                    for text in self.texts:
+                        with self.subTest(f_weight=f_weight, winsize=winsize, norm=norm, text=text):
+                            win_emb, gc = self._reference(text, norm, f_weight, winsize)
+                            ids = np.array([self.tok2id.get(t, -1) for t in text.split() if t != "the"], dtype=np.int64)
+
+                            emb = _window_embeddings(ids, self.vecs, self.entropy, norm, f_weight, winsize)
+                            np.testing.assert_allclose(emb, win_emb, rtol=0, atol=self.TOLERANCE)
+
+                            got = utterance_gc(text, self.vecs, self.entropy, self.tok2id, {"the"}, norm=norm, f_weight=f_weight, winsize=winsize)
+                            self.assertEqual(got is None, gc is None)
+                            self.assertEqual(_global_coherence(emb) is None, gc is None)
+                            if gc is not None: self.assertAlmostEqual(got, gc, delta=self.TOLERANCE)
+
+
+# =======================================================================
+# Session prompt (user-022/023) -- append-only, fit into the token budget
+# =======================================================================
+class _CharTokens:
+    """ Stands in for the LLM client: one token per character (None = the replica is busy) """
+    def __init__(self, busy=False): self.busy = busy
+    async def count_tokens(self, text, session=None): return None if self.busy else len(text)
+
+
+class SessionPromptTests(SimpleTestCase):
+    def _prompt(self, system_prompt="Be brief.", budget=400, keep_ratio=0.5, session_id="s1"):
+        from chat_app.websocket.services.promptBuilder import SessionPrompt
+        return SessionPrompt(session_id, system_prompt=system_prompt, budget=budget, keep_ratio=keep_ratio)
+
+    def setUp(self):
+        from unittest import mock
+        from chat_app import config as cf
+        patcher = mock.patch.object(cf, "llm", _CharTokens()); patcher.start(); self.addCleanup(patcher.stop)
+
+    async def test_under_budget_is_append_only(self):
+        from chat_app.websocket.services.promptBuilder import ASSISTANT_TAG, format_turn
+        prompt = self._prompt()
+        prompt.extend([("user", "Hi there", "2024-01-01"), ("assistant", "Hello!", "2024-01-01")])  # (extra fields are ignored)
+        await prompt.fit(); before = prompt.render()
+        self.assertEqual(before, "<|system|>\nBe brief.<|end|>" + format_turn("user", "Hi there") + format_turn("assistant", "Hello!") + ASSISTANT_TAG)
+        self.assertEqual(prompt.tokens, len(before))
+
+        prompt.add("user", "How are you?"); await prompt.fit()
+        self.assertTrue(prompt.render().startswith(before[:-len(ASSISTANT_TAG)]))
+        self.assertEqual(len(prompt), 3)
+
+    async def test_over_budget_drops_the_oldest_turns_to_the_keep_ratio(self):
+        prompt = self._prompt(budget=400, keep_ratio=0.5)
+        turns  = [("user" if i % 2 == 0 else "assistant", f"turn {i} " + "x" * 30) for i in range(12)]
+        for role, text in turns[:6]: prompt.add(role, text)
+        await prompt.fit()
+        self.assertEqual(len(prompt), 6)  # (still under budget)
+
+        for role, text in turns[6:]: prompt.add(role, text)
+        await prompt.fit()
+        self.assertLessEqual(prompt.tokens, 200)
+        self.assertEqual([(role, text) for role, text, _ in prompt.turns], turns[-len(prompt):])  # the newest ones, in order
+        self.assertEqual(prompt.tokens, len(prompt.render()))
+
+    async def test_keep_ratio_sets_how_much_is_kept(self):
+        kept = {}
+        for keep_ratio in (0.25, 0.5, 0.9):
+            prompt = self._prompt(budget=400, keep_ratio=keep_ratio)
+            for i in range(12): prompt.add("user", f"turn {i} " + "x" * 30)
+            await prompt.fit()
+            self.assertLessEqual(prompt.tokens, int(400 * keep_ratio))
+            kept[keep_ratio] = len(prompt)
+        self.assertLess(kept[0.25], kept[0.5]); self.assertLess(kept[0.5], kept[0.9])
+
+    async def test_one_long_turn_keeps_its_end(self):
+        prompt = self._prompt(budget=400)
+        text   = " ".join(f"w{i}" for i in range(300))
+        prompt.add("user", "an old turn"); prompt.add("user", text)
+        await prompt.fit()
+
+        self.assertEqual(len(prompt), 1)
+        self.assertTrue(text.endswith(prompt.turns[0][1]))
+        self.assertLessEqual(len(prompt.render()), prompt.budget)
+
+    async def test_system_prompt_over_budget_keeps_the_tail_of_the_newest_turn(self):
+        from chat_app.websocket.services.promptBuilder import MIN_TAIL_TOKENS
+        prompt = self._prompt(system_prompt="s" * 500, budget=400)
+        text   = " ".join(f"w{i}" for i in range(100))
+        prompt.add("assistant", "earlier"); prompt.add("user", text)
+        with self.assertLogs("chat_app.websocket.services.promptBuilder", "ERROR"): await prompt.fit()
+
+        self.assertEqual(len(prompt), 1)
+        self.assertTrue(text.endswith(prompt.turns[0][1]))
+        self.assertLessEqual(len(prompt.turns[0][1]), MIN_TAIL_TOKENS)
+        self.assertGreater(len(prompt.turns[0][1]), 0)
+
+    async def test_busy_server_falls_back_to_the_estimate(self):
+        from unittest import mock
+        from chat_app import config as cf
+        from chat_app.websocket.services.promptBuilder import estimate_tokens, format_turn
+        prompt = self._prompt()
+        prompt.add("user", "Hello there")
+        with mock.patch.object(cf, "llm", _CharTokens(busy=True)): await prompt.fit()
+        self.assertEqual(prompt.turns[0][2], estimate_tokens(format_turn("user", "Hello there")))
+
+    async def test_preview_leaves_the_prompt_as_is(self):
+        from chat_app.websocket.services.promptBuilder import ASSISTANT_TAG
+        prompt = self._prompt()
+        prompt.add("user", "Hi"); await prompt.fit()
+        copy = prompt.preview("user", "And another thing")
+        self.assertEqual((len(prompt), len(copy)), (1, 2))
+        self.assertTrue(copy.render().startswith(prompt.render()[:-len(ASSISTANT_TAG)]))
+
+    def test_slot_id(self):
+        from unittest import mock
+        from chat_app import config as cf
+        with mock.patch.object(cf, "LLM_SLOTS", 4):
+            self.assertEqual(self._prompt(session_id="s1").slot_id, self._prompt(session_id="s1").slot_id)
+            self.assertIn(self._prompt(session_id="s1").slot_id, range(4))
+            self.assertIsNone(self._prompt(session_id=None).slot_id)
+        with mock.patch.object(cf, "LLM_SLOTS", 0):
+            self.assertIsNone(self._prompt(session_id="s1").slot_id)
+
+
+# =======================================================================
+# Speculative replies (user-025) -- hit, miss, restart; a dropped speculation never reaches the client
+# =======================================================================
+class SpeculatorTests(SimpleTestCase):
+    def setUp(self):
+        from unittest import mock
+        from chat_app import config as cf
+        from chat_app.services.llm.dummy_LLM import DummyLLM
+        from chat_app.services.llm.llm_queue import LLMQueue
+        from chat_app.websocket.services.promptBuilder import SessionPrompt
+        from chat_app.websocket.services.speculativeReply import Speculator
+
+        self.replica = DummyLLM(latency=0.02, token_latency=0.01)
+        for name, value in (("llm", LLMQueue([self.replica])), ("LLM_STREAM", True)):
+            patcher = mock.patch.object(cf, name, value); patcher.start(); self.addCleanup(patcher.stop)
+
+        self.prompt = SessionPrompt("s1", system_prompt="Be brief.", budget=4000)
+        self.prompt.add("assistant", "Hello, what did you do today?")
+        self.speculator = Speculator(lambda: self.prompt)
+
+    def _final(self, text):
+        """ What the consumer does with the final transcript before take() (the user turn is added to the prompt) """
+        self.prompt.add("user", text)
+        return self.speculator.take(text, self.prompt)
+
+    async def test_hit_adopts_the_running_reply(self):
+        import asyncio
+        self.speculator.start("I went to the store")
+        await asyncio.sleep(0.05)  # (a few words in)
+
+        speculation = self._final("I went to the store.")
+        self.assertIsNotNone(speculation)
+        deltas = []
+        async def on_delta(text): deltas.append(text)
+        reply = await speculation.adopt(on_delta=on_delta)
+
+        self.assertEqual(reply, "This is dummy response number 1 from the LLM.")
+        self.assertEqual("".join(deltas), reply)              # (what was buffered, then the rest, in order)
+        self.assertEqual(self.replica.num_messages, 1)        # (no second request)
+
+    async def test_miss_cancels_the_speculation(self):
+        import asyncio
+        self.speculator.start("I went to the store")
+        speculation = self.speculator.current
+        await asyncio.sleep(0.05)
+
+        self.assertIsNone(self._final("I went to the shore"))
+        await asyncio.gather(speculation.task, return_exceptions=True)
+        self.assertTrue(speculation.task.cancelled())
+        self.assertIsNone(self.speculator.current)
+
+    async def test_changed_history_is_a_miss(self):
+        import asyncio
+        self.speculator.start("I went to the store")
+        speculation = self.speculator.current
+        self.prompt.add("assistant", "A reply added after the speculation started")
+
+        self.assertIsNone(self._final("I went to the store"))
+        await asyncio.gather(speculation.task, return_exceptions=True)
+        self.assertTrue(speculation.task.cancelled())
+
+    async def test_a_differing_interim_restarts_it(self):
+        import asyncio
+        self.speculator.start("I went to the")
+        first = self.speculator.current
+        self.speculator.start("I went to the.")                # (same words: kept)
+        self.assertIs(self.speculator.current, first)
+
+        self.speculator.start("I went to the store")
+        await asyncio.gather(first.task, return_exceptions=True)
+        self.assertTrue(first.task.cancelled())
+        self.assertIsNot(self.speculator.current, first)
+        self.speculator.cancel()
+
+    async def test_a_dropped_speculation_never_reaches_the_client(self):
+        import asyncio, json
+        from chat_app.websocket.services.chatHelpers import handle_transcription
+
+        self.speculator.start("I went to the store")
+        await asyncio.sleep(0.1)                              # (the first reply is streaming by now)
+        self.assertTrue(self.speculator.current.parts)
+        self.speculator.start("I went to the shore")          # a differing interim cancels it
+
+        sent = []
+        async def send(message): sent.append(json.loads(message))
+        async def add_message(role, text, time): self.prompt.add(role, text); return self.prompt
+        async def bio(): pass
+        reply = await handle_transcription({"data": "I went to the shore"}, add_message, send, bio, speculator=self.speculator)
+
+        deltas = [m["data"] for m in sent if m["type"] == "llm_delta"]
+        self.assertEqual(reply, "This is dummy response number 2 from the LLM.")
+        self.assertEqual("".join(deltas), reply)              # (nothing of reply number 1)
+        self.assertEqual([m["data"] for m in sent if m["type"] == "llm_response"], [reply])
+        self.assertEqual(self.replica.num_messages, 2)
+
+
+# =======================================================================
+# Persistent parser (user-001) -- batches over stdin/stdout, sentinel, restart after a timeout
+# =======================================================================
+# Stands in for the LexicalizedParser process: one "oneline" tree per input line (and a blank line after it), each
+# printed only once the NEXT line arrives (like the tokenizer's lookahead), "(())" for "gibberish", never answers "hang"
+FAKE_PARSER = r"""
+import sys, time
+held = None
+for line in sys.stdin:
+    words = line.split()
+    if "hang" in words: time.sleep(3600)
+    if held is not None: print(held); print(); sys.stdout.flush()
+    held = "(())" if "gibberish" in words else "(ROOT (S " + " ".join(f"(NN {w})" for w in words) + "))"
+"""
+
+class ParserServiceTests(SimpleTestCase):
+    def setUp(self):
+        import subprocess, sys
+        from unittest import mock
+        from chat_app.websocket.biomarkers.biomarker_models import parser_service
+
+        self.started, popen = [], subprocess.Popen
+        def fake_popen(cmd, **kwargs):
+            self.started.append(cmd)
+            return popen([sys.executable, "-u", "-c", FAKE_PARSER], **kwargs)
+        patcher = mock.patch.object(parser_service.subprocess, "Popen", fake_popen); patcher.start(); self.addCleanup(patcher.stop)
+
+        self.service = parser_service.ParserService(timeout=1.0); self.addCleanup(self.service.close)
+
+    def test_one_tree_per_sentence(self):
+        trees = self.service.parse(["the dog barked", "", "gibberish here", "a  cat\nsat"])
+        self.assertEqual([t.leaves() if t is not None else None for t in trees], [["the", "dog", "barked"], None, [], ["a", "cat", "sat"]])  # (empty sentence: None, unparseable: an empty tree)
+
+        # The previous batch's sentinel tree (held back until now) isn't returned as this batch's
+        trees = self.service.parse(["one more", "and another"])
+        self.assertEqual([t.leaves() for t in trees], [["one", "more"], ["and", "another"]])
+        self.assertEqual(len(self.started), 1)  # (the same process throughout)
+
+    def test_concurrent_requests_get_their_own_trees(self):
+        from concurrent.futures import ThreadPoolExecutor
+        requests = [[f"request {i} sentence {j}" for j in range(i % 3 + 1)] for i in range(12)]
+        with ThreadPoolExecutor(6) as pool: results = list(pool.map(self.service.parse, requests))
+        for sentences, trees in zip(requests, results):
+            self.assertEqual([" ".join(t.leaves()) for t in trees], sentences)
+
+    def test_timeout_restarts_the_parser(self):
+        with self.assertLogs("chat_app.websocket.biomarkers.biomarker_models.parser_service", "ERROR"):
+            with self.assertRaises(TimeoutError): self.service.parse(["this will hang"])
+        self.assertIsNone(self.service._proc)
+
+        trees = self.service.parse(["back again"])
+        self.assertEqual(trees[0].leaves(), ["back", "again"])
+        self.assertEqual(len(self.started), 2)
+
+
+# =======================================================================
+# Incremental text biomarkers (user-003/006) -- the caches give the same scores as scoring the buffer from scratch
+# =======================================================================
+class IncrementalTextBiomarkerTests(SimpleTestCase):
+    WORDS = "store bread daughter sunday lunch glasses house lake summer swimming doctor walk heart dinner family".split()
+
+    def setUp(self):
+        import types, sys, importlib
+        from unittest import mock
+        from collections import deque
+        from chat_app.websocket.biomarkers.biomarker_models.lsa_store import LSAStore
+
+        # A sliding context buffer (role, text, ts) -- the same text comes back with a new timestamp now and then
+        rng = np.random.default_rng(0)
+        self.buffers, buffer = [], deque(maxlen=6)
+        for ts in range(40):
+            buffer.append(("user" if ts % 2 == 0 else "assistant", " ".join(rng.choice(self.WORDS + ["the", "and"], size=int(rng.integers(1, 30)))) if ts % 7 else "the store", float(ts)))
+            self.buffers.append(list(buffer))
+
+        # Altered grammar without Stanza, the parser or the model: a "feature vector" of counts, the score is the sum
+        self.parsed = []
+        def utterance_grammar_features(texts):
+            self.parsed.extend(texts)
+            return np.array([[len(t.split()), len(t), t.count("the")] for t in texts], dtype=np.float64)
+        fake = types.ModuleType("altered_grammer")
+        fake.utterance_grammar_features  = utterance_grammar_features
+        fake.grammar_score_from_features = lambda features, duration: (features.tolist(), duration)
+        fake.generate_grammar_score      = None
+
+        name = "chat_app.websocket.biomarkers.core.altered_grammar"
+        with mock.patch.dict(sys.modules, {"chat_app.websocket.biomarkers.biomarker_models.altered_grammer": fake}):
+            sys.modules.pop(name, None); self.grammar = importlib.import_module(name)
+        patcher = mock.patch.object(self.grammar, "time", return_value=100.0); patcher.start(); self.addCleanup(patcher.stop)
+
+        # Pragmatic on a small random LSA space (not the compiled store)
+        vocab = self.WORDS + ["the", "and"]
+        store = LSAStore(rng.normal(size=(len(vocab), 16)).astype(np.float32), rng.uniform(0.2, 1.0, size=len(vocab)).astype(np.float32),
+                         {w: i for i, w in enumerate(vocab)}, {"the", "and"})
+        with mock.patch("chat_app.websocket.biomarkers.biomarker_models.lsa_store.get_lsa_store", return_value=store):
+            from chat_app.websocket.biomarkers.core import pragmatic
+        self.pragmatic = pragmatic
+        patcher = mock.patch.multiple(pragmatic, bm_vecs=store.vecs, bm_entropy_arr=store.entropy, bm_tok2id=store.tok2id, bm_stop_set=store.stop_set)
+        patcher.start(); self.addCleanup(patcher.stop)
+
+    def test_feature_cache_matches_a_full_recompute(self):
+        cache = {}
+        for buffer in self.buffers:
+            self.assertEqual(self.grammar.generate_altered_grammar_score(buffer, cache), self.grammar.generate_altered_grammar_score(buffer))
+            self.assertEqual(set(cache), {m for m in buffer if m[0] == "user"})  # (evicted messages are forgotten)
+
+        # Each user message was parsed once with the cache (and once more by every full recompute)
+        self.parsed.clear(); cache = {}
+        for buffer in self.buffers: self.grammar.generate_altered_grammar_score(buffer, cache)
+        self.assertEqual(len(self.parsed), len({m for b in self.buffers for m in b if m[0] == "user"}))
+
+    def test_accumulator_matches_a_full_recompute(self):
+        accumulator = self.pragmatic.CoherenceAccumulator()
+        for buffer in self.buffers:
+            self.assertAlmostEqual(accumulator.update(buffer), self.pragmatic.CoherenceAccumulator().update(buffer), places=9)
+
+    def test_jobs_merged_in_any_order_match_a_full_recompute(self):
+        """ Like _text_biomarker: each job updates a copy, finishing after the next turn (the older job last). """
+        from chat_app.websocket.services.audioHelpers import _merge_grammar_cache
+        accumulator, cache = self.pragmatic.CoherenceAccumulator(), {}
+        for previous, buffer in zip(self.buffers, self.buffers[1:]):
+            before = (dict(accumulator._gc), dict(cache))
+            older_acc, older_cache = accumulator.copy(), dict(cache)
+            newer_acc, newer_cache = accumulator.copy(), dict(cache)
+            older_acc.update(previous); self.grammar.generate_altered_grammar_score(previous, older_cache)
+            newer_acc.update(buffer);   self.grammar.generate_altered_grammar_score(buffer,   newer_cache)
+            self.assertEqual((accumulator._gc, cache), before)  # (the jobs never touch the session's own state)
+
+            for job_acc, job_cache in ((newer_acc, newer_cache), (older_acc, older_cache)):
+                accumulator.merge(job_acc, buffer); _merge_grammar_cache(cache, job_cache, buffer)
+
+            # Nothing left to compute: exactly the current user messages, with the values a full recompute gives
+            user_messages = {m for m in buffer if m[0] == "user"}
+            self.assertEqual((set(accumulator._gc), set(cache)), (user_messages, user_messages))
+            full = self.pragmatic.CoherenceAccumulator(); full.update(buffer)
+            self.assertEqual(accumulator._gc, full._gc)
+            self.assertAlmostEqual(accumulator._sum / max(accumulator._count, 1), full._sum / max(full._count, 1), places=9)
+
+            self.parsed.clear()
+            self.assertEqual(self.grammar.generate_altered_grammar_score(buffer, cache), self.grammar.generate_altered_grammar_score(buffer))
+            self.assertEqual(len(self.parsed), sum(m[0] == "user" for m in buffer))  # (only the full recompute parsed)
+
+
+# =======================================================================
+# Biomarker pools (user-012/016) -- a crashed worker is retried once, a hung job times out as None
+# =======================================================================
+def _crash_once(marker):
+    """ Kills its worker process the first time (no marker file yet), returns "done" after that """
+    import os
+    if not os.path.exists(marker): open(marker, "w").close(); os._exit(1)
+    return "done"
+
+def _always_crash():
+    import os; os._exit(1)
+
+
+class BiomarkerPoolTests(SimpleTestCase):
+    def setUp(self):
+        import tempfile
+        from chat_app.websocket.services import audioHelpers
+        self.helpers = audioHelpers
+        self.tmp = tempfile.TemporaryDirectory(); self.addCleanup(self.tmp.cleanup)
+
+    def _process_pools(self):
+        """ One-worker process pools (fork, so the worker has this test module) in place of the app's """
+        import multiprocessing
+        from unittest import mock
+        from concurrent.futures import ProcessPoolExecutor
+        made = []
+        def make_pool(kind): made.append(ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("fork"))); return made[-1]
+        for patcher in (mock.patch.object(self.helpers, "_make_pool", make_pool), mock.patch.dict(self.helpers._POOLS, {"text": make_pool("text")})):
+            patcher.start(); self.addCleanup(patcher.stop)
+        self.addCleanup(lambda: [pool.shutdown(wait=False, cancel_futures=True) for pool in made])
+        return made
+
+    async def test_crashed_worker_is_retried_once_on_a_new_pool(self):
+        made = self._process_pools()
+        with self.assertLogs("chat_app.websocket.services.audioHelpers", "ERROR"):
+            result = await self.helpers._run_in_pool("text", _crash_once, f"{self.tmp.name}/crashed")
+        self.assertEqual(result, "done")
+        self.assertEqual(len(made), 2)
+        self.assertIs(self.helpers._POOLS["text"], made[1])
+
+    async def test_a_worker_that_keeps_crashing_gives_up(self):
+        from concurrent.futures.process import BrokenProcessPool
+        made = self._process_pools()
+        with self.assertLogs("chat_app.websocket.services.audioHelpers", "ERROR"):
+            with self.assertRaises(BrokenProcessPool): await self.helpers._run_in_pool("text", _always_crash)
+        self.assertEqual(len(made), 2)  # (retried once, not again)
+
+    async def test_a_hung_biomarker_is_none_and_leaves_the_session_alone(self):
+        import threading
+        from unittest import mock
+        from concurrent.futures import ThreadPoolExecutor
+        from chat_app.websocket.biomarkers import biomarker_config as BioConfig
+
+        release = threading.Event(); self.addCleanup(release.set)
+        def text_job(biomarker, context_buffer, grammar_cache, coherence):
+            if biomarker == "alteredgrammar": release.wait(5); grammar_cache["late"] = "result"  # (hangs past its timeout)
+            return {"alteredgrammar": 0.9, "anomia": 0.5}[biomarker], grammar_cache, coherence
+
+        pool = ThreadPoolExecutor(max_workers=2); self.addCleanup(pool.shutdown)
+        for patcher in (mock.patch.object(self.helpers.jobs, "text_job", text_job), mock.patch.dict(self.helpers._POOLS, {"text": pool}),
+                        mock.patch.dict(BioConfig.UTTERANCE_TIMEOUTS, {"alteredgrammar": 0.2, "anomia": 5.0}, clear=True)):
+            patcher.start(); self.addCleanup(patcher.stop)
+
+        scores, grammar_cache = [], {}
+        async def on_score(biomarker, score): scores.append((biomarker, score))
+        with self.assertLogs("chat_app.websocket.services.audioHelpers", "WARNING"):
+            result = await self.helpers.extract_text_biomarkers([("user", "hello", 0.0)], grammar_cache, on_score=on_score)
+
+        self.assertEqual(result, {"alteredgrammar": None, "anomia": 0.5})
+        self.assertEqual(scores, [("anomia", 0.5), ("alteredgrammar", None)])  # (each sent as soon as it is done)
+
+        release.set(); pool.shutdown(wait=True)
+        self.assertEqual(grammar_cache, {})  # (the late job only ever had a copy)
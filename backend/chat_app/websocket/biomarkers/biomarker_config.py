@@ -1,7 +1,7 @@
 import pandas as pd
 import os
 
-from ... import config as cf
+from ...services import logging_utils as lu  # (not the app config, the biomarker workers import this)
 
 # Constants
 WINDOW_SIZE = 5      # seconds
@@ -23,8 +23,46 @@ PRONUNCIATION_FEATURES = [
     'mfcc_sma[13]'
     ] 
 
-# For the LLM
-LAST_X_CHAT_ENTRIES = 5
+# Keep one openSMILE instance per session and extract LLDs as the audio arrives (services/featureStream.py)
+# instead of re-processing every few seconds of audio from scratch.
+# NOTE: the gain is not the same as the batch path. Streaming normalizes by the session's running peak (so the gain
+# only ever goes down, and the quiet start of a session is louder than later audio), while the models were trained
+# on features of windows peak normalized one at a time. Until the running peak settles, energy/spectral LLDs differ
+# from process_signal on the same audio (audspec_lengthL1norm by up to ~0.06 on a ~2.7 scale, pcm_RMSenergy ~0.016);
+# only at a fixed gain do the blocks match it (StreamingFeatureTests in chat_app/tests.py). Off until that is solved.
+STREAMING_FEATURES = False
+
+# Worker pools for the biomarkers (services/biomarkerJobs.py) -- "process" gives audio & text their own
+# process pools (no GIL contention, models loaded once per worker), "thread" runs them in this process
+BIOMARKER_POOL = "process"
+AUDIO_WORKERS  = 2
+TEXT_WORKERS   = 3   # one per utterance biomarker, so they run side by side
+
+# On-utterance biomarkers run as separate jobs (see extract_text_biomarkers in services/audioHelpers.py) and
+# each one is saved & sent as soon as it is done; one that takes longer than its timeout (seconds) is missing (None)
+UTTERANCE_TIMEOUTS = {
+    "pragmatic"     : 10.0,
+    "alteredgrammar": 30.0,
+    "anomia"        :  5.0,
+}
+
+# Cross-session micro-batching of the random forests (services/audioBatcher.py) -- windows from every session
+# that arrive within AUDIO_BATCH_WINDOW seconds are scored with one predict_proba call per model
+AUDIO_BATCHING     = True
+AUDIO_BATCH_WINDOW = 0.005
+AUDIO_BATCH_SIZE   = 64      # flush early once this many windows are waiting
+
+# Altered grammar -- "stanford" uses the persistent Stanford parser for trees (see biomarker_models/parser_service.py),
+# "stanza" gets trees & dependencies from one Stanza pass (no Java). The logistic model was trained on Stanford trees,
+# so "stanza" changes the CC/S/production rule counts it sees -- only switch once `manage.py check_grammar_parity`
+# shows the scores agree (or the model has been retrained on Stanza features)
+GRAMMAR_PARSER      = "stanford"
+PARSER_JAVA_OPTIONS = "-mx1g"   # JVM options for the long-lived parser process
+PARSER_TIMEOUT      = 30        # seconds to wait for a batch before the parser is restarted
+
+# Batch coherence re-scoring (see biomarker_models/coherence_batch.py)
+COHERENCE_WORKERS      = 4         # processes for batch_pragmatic_gc (0 = score in this process)
+COHERENCE_BATCH_TOKENS = 200_000   # max tokens stacked into one matrix operation
 
 # =======================================================================
 # Configure Logging
@@ -35,7 +73,7 @@ TIME_BIOMARKERS = True
 # -----------------------------------------------------------------------
 # Biomarker Logging Helpers
 # -----------------------------------------------------------------------
-BIO_LOG = f"{cf.GREEN}[Bio] "
+BIO_LOG = f"{lu.GREEN}[Bio] "
 PRAG = f"{BIO_LOG}Pragmatic:      "
 GRAM = f"{BIO_LOG}Altered Grammar:"
 PROS = f"{BIO_LOG}Prosody:        "
@@ -4,41 +4,41 @@ import pandas as pd
 from nltk.tree import Tree
 import re
 from datetime import datetime
-from nltk.parse import stanford
 import numpy as np
-import pickle
 import logging
-import shutil
 from time import time
+from bisect import bisect_right
 
 # Configure logging (logging config should only be in config.py ... pretty sure)
 #logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-nlp = stanza.Pipeline('en')
+from .. import biomarker_config as BioConfig
+from .grammar_model.predictor import GRAMMAR_MODEL
+from .parser_service import get_parser
 
-java_path = shutil.which("java")
+# One Stanza pass gives the dependencies (and the constituency trees with "stanza"), so only load what those need
+# (no NER/sentiment). The Java parser is only started on the first "stanford" parse.
+_PIPELINES = {}
+def get_nlp(parser=None):
+    parser = parser or BioConfig.GRAMMAR_PARSER
+    if parser not in _PIPELINES:
+        processors = 'tokenize,mwt,pos,lemma,depparse' + ('' if parser == "stanford" else ',constituency')
+        _PIPELINES[parser] = stanza.Pipeline('en', processors=processors)
+    return _PIPELINES[parser]
 
-if (not java_path):
-    java_path = r"C:\Program Files\Java\jdk-22"
-os.environ['JAVAHOME'] = java_path
-os.environ['JAVA_HOME'] = java_path
-# nltk.internals.config_java(bin=java_path)
+nlp = get_nlp() # (the configured pipeline is loaded with the module)
 
-# Update this path to where you extracted the Stanford Parser
-root_path = os.path.dirname(os.path.abspath(__file__))
-stanford_parser_path = root_path + "/stanford-parser-full-2020-11-17"
-
-# Set the CLASSPATH environment variable
-os.environ['CLASSPATH'] = f"{stanford_parser_path}/stanford-parser.jar;{stanford_parser_path}/stanford-parser-4.2.0-models.jar"
-
-# Set other required environment variables
-os.environ['STANFORD_PARSER'] = stanford_parser_path
-os.environ['STANFORD_MODELS'] = stanford_parser_path
-
-# Initialize the Stanford Parser
-parser = stanford.StanfordParser(model_path=f"{stanford_parser_path}/englishPCFG.ser.gz")
+# Column order the logistic model was trained on
+FEATURE_NAMES = [
+    # Syntactic Features
+    "coordinated_sentences", "subordinated_sentences", "reduced_sentences", "num_predicates", "production_rules",
+    # Lexical Features
+    "function_words", "num_unique_words", "num_words", "text_character_length", "immediate_word_repetitions",
+]
 
+# Separates utterances in the joined text; Stanza never lets a sentence run across a blank line
+UTTERANCE_SEP = "\n\n"
 
 
 # =======================================================================
@@ -56,51 +56,15 @@ def generate_grammar_score(list_sentences, speech_duration_seconds):
     if not list_sentences: logger.warning("No sentences provided. Returning default score of 1."); return 1
    
     try:
-        # -----------------------------------------------------------------------
-        # Extract the syntactic and lexical features needed
-        # -----------------------------------------------------------------------
-        # Position & tag Features
-        coordinated_sentences, subordinated_sentences, reduced_sentences, production_rules, function_words = pos_tags_features(list_sentences)
-
-        POS_end_time = time()
-        logger.info(f"Alt Gram Features 1: {POS_end_time-start_time:.4f} seconds")
-
-        # Predicates calling
-        num_predicates              = 0
-        immediate_word_repetitions  = 0
-        text_character_length       = 0
-        num_unique_words            = 0
-        num_words                   = 0
-        
-        for data in list_sentences:
-            doc = nlp(data)
-            unique_words, words = count_unique_words(data)
-
-            immediate_word_repetitions  += count_immediate_repetitions(data)
-            text_character_length       += len(data) # Simply return the length of the text
-            num_unique_words            += unique_words
-            num_words                   += words
-            num_predicates              += count_predicates(doc)
-
-        predicates_end_time = time()
-        logger.info(f"Alt Gram Features 2: {predicates_end_time-POS_end_time:.4f} seconds")
-
-        # -----------------------------------------------------------------------
-        # Finish formatting features & run the model
-        # -----------------------------------------------------------------------
-        extracted_features = np.array([
-            # Syntactic Features
-            coordinated_sentences, subordinated_sentences, reduced_sentences, num_predicates, production_rules, 
-            # Lexical Features
-            function_words, num_unique_words, num_words, text_character_length, immediate_word_repetitions
-        ])
-
-        # Features should be per-minute
-        extracted_features_per_minute = extracted_features / (speech_duration_seconds / 60)
-
-        # Calculate the altered grammer score
-        altered_grammar_score = calculate_probability(extracted_features_per_minute)
-        logger.info(f"Alt Gram Model Ran:  {time()-predicates_end_time:.4f} seconds, Score: {altered_grammar_score:.4f}")
+        # Extract the syntactic and lexical features needed (summed over every utterance)
+        extracted_features = utterance_grammar_features(list_sentences).sum(axis=0)
+
+        features_end_time = time()
+        logger.info(f"Alt Gram Features:   {features_end_time-start_time:.4f} seconds")
+
+        # Per-minute features -> altered grammar score
+        altered_grammar_score = grammar_score_from_features(extracted_features, speech_duration_seconds)
+        logger.info(f"Alt Gram Model Ran:  {time()-features_end_time:.4f} seconds, Score: {altered_grammar_score:.4f}")
 
         return altered_grammar_score
     
@@ -109,56 +73,76 @@ def generate_grammar_score(list_sentences, speech_duration_seconds):
         return 1  # Return a default score in case of error
 
 
+# -----------------------------------------------------------------------
+# Score from already extracted (raw, summed) features
+# -----------------------------------------------------------------------
+def grammar_score_from_features(extracted_features, speech_duration_seconds):
+    # Features should be per-minute
+    extracted_features_per_minute = np.asarray(extracted_features) / (speech_duration_seconds / 60)
 
-# =======================================================================
-# Load in the saved model and scaler
-# =======================================================================
-def load_model():
-    # Get the directory of the current script & construct the path to the pickle files
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    pickle_path = os.path.join(current_dir, "grammar_model", "pickle_files")
-    logger.debug(f"Looking for pickle files in: {pickle_path}")
-
-    # Check if the directory exists before getting all .pkl files within
-    if not os.path.exists(pickle_path): raise FileNotFoundError(f"Directory not found: {pickle_path}")
-    model_files = [f for f in os.listdir(pickle_path) if f.endswith('.pkl') and f != 'scaler.pkl']
-    
-    # Make sure there is at least one model file
-    if not model_files: raise FileNotFoundError("No model .pkl files found in the pickle_files directory.")
-    
-    # Use the first model file found instead of trying to find the most recent
-    most_recent_file = model_files[0]
-    model_path = os.path.join(pickle_path, most_recent_file)
+    # Calculate the altered grammer score
+    return calculate_probability(extracted_features_per_minute)
 
-    # Load in the model
-    try:
-        if not os.path.exists(model_path): raise FileNotFoundError(f"Model file not found: {model_path}")
-        with open(model_path, 'rb') as file: logistic_model = pickle.load(file)
-    except Exception as e: logger.error(f"Error loading model from {model_path}: {str(e)}"); raise
+# -----------------------------------------------------------------------
+# Raw features for each utterance
+# -----------------------------------------------------------------------
+def utterance_grammar_features(list_sentences, parser=None):
+    """
+    Returns an (n_utterances, 10) array of raw counts (columns follow FEATURE_NAMES). parser is "stanford" or
+    "stanza" (default: GRAMMAR_PARSER, see manage.py check_grammar_parity for how far apart they are).
+
+    All of the utterances are joined into ONE document and parsed with a single nlp(...) call; each Stanza 
+    sentence is mapped back to its utterance by character offset. The same pass supplies the constituency 
+    trees (CC/S/VBG/VBN counts, production rules, function words) and the dependencies (predicates).
+    """
+    features = np.zeros((len(list_sentences), len(FEATURE_NAMES)), dtype=np.float64)
+
+    # Character offset where each utterance starts in the joined text
+    starts, offset = [], 0
+    for data in list_sentences:
+        starts.append(offset); offset += len(data) + len(UTTERANCE_SEP)
+
+    # -----------------------------------------------------------------------
+    # 1) Syntactic features -- one Stanza pass
+    # -----------------------------------------------------------------------
+    parser = parser or BioConfig.GRAMMAR_PARSER
+    doc    = get_nlp(parser)(UTTERANCE_SEP.join(list_sentences))
+    for sentence in doc.sentences:
+        i = bisect_right(starts, sentence.tokens[0].start_char) - 1
+        features[i, 3] += count_sentence_predicates(sentence)
 
-    # Load the scaler
-    scaler_path = os.path.join(pickle_path, 'scaler.pkl')
-    try:
-        if not os.path.exists(scaler_path): raise FileNotFoundError(f"Scaler file not found: {scaler_path}")
-        with open(scaler_path, 'rb') as file:  scaler = pickle.load(file)
-    except Exception as e: logger.error(f"Error loading scaler from {scaler_path}: {str(e)}"); raise
+        if parser != "stanford":
+            features[i, [0, 1, 2, 4, 5]] += tree_features(stanza_to_nltk(sentence.constituency))
+
+    # Stanford parser: one tree per utterance from the persistent parser process
+    if parser == "stanford":
+        for i, tree in enumerate(get_parser().parse(list_sentences)):
+            if tree is not None: features[i, [0, 1, 2, 4, 5]] += tree_features(tree)
 
-    # Return both the model and the scaler
-    return logistic_model, scaler
+    # -----------------------------------------------------------------------
+    # 2) Lexical features
+    # -----------------------------------------------------------------------
+    for i, data in enumerate(list_sentences):
+        unique_words, words = count_unique_words(data)
 
+        features[i, 6] = unique_words
+        features[i, 7] = words
+        features[i, 8] = len(data) # Simply return the length of the text
+        features[i, 9] = count_immediate_repetitions(data)
+
+    return features
+
+
+
+# =======================================================================
+# Saved model & scaler (loaded once per process, see grammar_model/predictor.py)
+# =======================================================================
 # -----------------------------------------------------------------------
 # Calculate Probability
 # -----------------------------------------------------------------------
 def calculate_probability(features):
-    # Load in the saved model weights & the scaler it used
-    logistic_model, scaler = load_model()
-    
-    # Prepare and scale the features
-    features = np.array(features).reshape(1, -1)
-    features_scaled = scaler.transform(features)
-    
-    # Calculate the probability
-    try: return logistic_model.predict_proba(features_scaled)[0][1]
+    # Scaler is folded into the logistic coefficients -> one dot product + sigmoid
+    try: return GRAMMAR_MODEL.get().predict_proba(features)
     except Exception as e: logger.error(f"Error calculating probability: {str(e)}"); raise
     
 
@@ -194,51 +178,42 @@ def extract_tags(tree):
     return tag_data
 
 # -----------------------------------------------------------------------
-# 
+# Constituency tree features
 # -----------------------------------------------------------------------
-# Takes pretty long to run right now
-def pos_tags_features(sentences_list):
-    coordinated_sentences  = 0
-    subordinated_sentences = 0
-    reduced_sentences      = 0
-    production_rules       = 0
-    function_words         = 0
+# Stanza trees -> nltk trees so the same helpers work for either parser
+def stanza_to_nltk(node):
+    if not node.children: return node.label
+    return Tree(node.label, [stanza_to_nltk(child) for child in node.children])
+
+# CC, S, VBG + VBN, production rule & function word counts for one tree
+def tree_features(tree):
+    # Extract tag data
+    tag_data = extract_tags(tree)
+
+    coordinated_sentences  =  tag_data.get("CC",  {}).get("count", 0)
+    subordinated_sentences =  tag_data.get("S",   {}).get("count", 0)
+    reduced_sentences      = (tag_data.get("VBG", {}).get("count", 0) + tag_data.get("VBN", {}).get("count", 0))
+
+    production_rules = extract_production_rules(tree)
+    function_words   = extract_function_words  (tree)
     
-    for data in sentences_list:
-        sentences = parser.raw_parse_sents([data])
-        for line in sentences:
-            for sentence in line:
-                tree = Tree.fromstring(str(sentence))
-
-                # Extract tag data
-                tag_data = extract_tags(tree)
-
-                coordinated_sentences  +=  tag_data.get("CC",  {}).get("count", 0)
-                subordinated_sentences +=  tag_data.get("S",   {}).get("count", 0)
-                reduced_sentences      += (tag_data.get("VBG", {}).get("count", 0) + tag_data.get("VBN", {}).get("count", 0))
-
-                production_rules += extract_production_rules(tree)
-                function_words   += extract_function_words  (tree)
-    
-    print()
     return coordinated_sentences, subordinated_sentences, reduced_sentences, production_rules, function_words
 #------------------------------------------------------------------#------------------------------------------------------------------
 
 # Counts Predicates
+PREDICATE_RELATIONS = {'nsubj', 'obj', 'iobj', 'ccomp', 'xcomp'}
 
 # Function to count predicates
 def count_predicates(doc):
-    predicate_count = 0
-    
-    for sentence in doc.sentences:
-        for word in sentence.words:
-            if word.upos == 'VERB':
-                for dep in sentence.dependencies:
-                    if (dep[0].id == word.id or dep[2].id == word.id) and dep[1] in {'nsubj', 'obj', 'iobj', 'ccomp', 'xcomp'}:
-                        # print('Matching dependency:', dep)
-                        predicate_count += 1
-                        break  # Count each predicate only once
-    return predicate_count
+    return sum(count_sentence_predicates(sentence) for sentence in doc.sentences)
+
+# A verb counts once if it is the head or the dependent of any predicate relation
+def count_sentence_predicates(sentence):
+    linked = set()
+    for head, relation, dependent in sentence.dependencies:
+        if relation in PREDICATE_RELATIONS: linked.update((head.id, dependent.id))
+
+    return sum(1 for word in sentence.words if word.upos == 'VERB' and word.id in linked)
 
 
 #------------------------------------------------------------------#------------------------------------------------------------------
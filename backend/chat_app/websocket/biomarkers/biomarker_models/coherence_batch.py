@@ -0,0 +1,162 @@
+"""
+Batch pragmatic coherence
+
+Same numbers as coherence_v2.pragmatic_gc_mean, but for MANY transcripts at once (e.g. every closed ChatSession
+for a user when the LSA space changes). Instead of looping over utterances:
+
+    1) Every user utterance is tokenized & mapped to vector rows, then all of them are concatenated with
+       (winsize - 1) padding ids in front of each one
+    2) A sliding view over that gives a padded (n_windows, winsize) id matrix for every window of every utterance
+    3) The windows become ONE sparse (n_windows, n_tokens) weight matrix (counts -> logfreq/freq/none, x entropy),
+       so all window embeddings are a single sparse @ dense product
+    4) GC uses segment sums (one segment per utterance) instead of per-utterance matrices
+
+Transcripts are split into chunks of roughly COHERENCE_BATCH_TOKENS tokens and spread across a process pool;
+each worker maps the compiled LSA store once (the pages are shared between workers).
+
+"""
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy import sparse
+from numpy.lib.stride_tricks import sliding_window_view
+
+from .. import biomarker_config as BioConfig
+from .coherence_v2 import _tokenize
+from .lsa_store    import LSAStore, STORE_DIR, load_lsa_store, get_lsa_store
+
+logger = logging.getLogger(__name__)
+
+
+# ==================================================================== ===================================
+# Stacked GC for many utterances
+# ==================================================================== ===================================
+def batch_utterance_gc(texts, store: LSAStore, *, norm=True, f_weight="logfreq", winsize=20) -> list:
+    """ Mean window GC for every text (None where the utterance doesn't have 2 usable windows). """
+    if f_weight not in {"logfreq", "freq", "none"}: raise ValueError("f_weight must be one of {'logfreq','freq','none'}")
+    if winsize < 1                                : raise ValueError("winsize must be >= 1")
+
+    # 1) Token ids per utterance (-1 = out of vocab), empty utterances are skipped
+    tok2id, stop_set = store.tok2id, store.stop_set
+    utt_ids = [[tok2id.get(t, -1) for t in _tokenize(text) if t not in stop_set] for text in texts]
+    lengths = np.fromiter((len(ids) for ids in utt_ids), dtype=np.int64, count=len(utt_ids))
+
+    results = [None] * len(texts)
+    keep    = np.flatnonzero(lengths)
+    if keep.size == 0: return results
+
+    # 2) Pad every utterance on the left and take every window that ends on a real token
+    pad   = winsize - 1
+    flat  = np.concatenate([np.r_[np.full(pad, -1), utt_ids[k]] for k in keep]).astype(np.int64)
+    ends  = np.cumsum(lengths[keep] + pad)                          # one past the last slot of each utterance
+    seg   = np.repeat(np.arange(keep.size), lengths[keep])          # utterance (segment) of each window
+    last  = np.concatenate([np.arange(e - n, e) for e, n in zip(ends, lengths[keep])])
+    win   = sliding_window_view(flat, winsize)[last - pad]          # (n_windows, winsize)
+
+    # 3) Sparse weights: counts of each distinct in-vocab token per window
+    rows, cols = np.nonzero(win >= 0)
+    if rows.size == 0: return results
+    uniq, local = np.unique(win[rows, cols], return_inverse=True)
+
+    counts = sparse.csr_matrix((np.ones(rows.size, dtype=np.float32), (rows, local.ravel())), shape=(win.shape[0], uniq.size))
+    counts.sum_duplicates()
+
+    if   f_weight == "logfreq": counts.data = np.log10(counts.data + 1.0)
+    elif f_weight == "none"   : counts.data = np.ones_like(counts.data)
+    weights = counts @ sparse.diags(store.entropy[uniq].astype(np.float32))
+
+    M = np.asarray(store.vecs[uniq], dtype=np.float32)
+    if norm:
+        d = np.linalg.norm(M, axis=1); d[d == 0] = 1.0
+        M = M / d[:, None]
+
+    num = np.asarray(weights @ M, dtype=np.float32)
+    den = np.asarray(weights.sum(axis=1)).ravel()
+
+    E  = np.zeros_like(num)
+    ok = den != 0
+    E[ok] = num[ok] / den[ok, None]
+
+    # 4) GC per utterance from segment sums over the valid (non-zero) windows
+    valid = np.linalg.norm(E, axis=1) > 0
+    E, seg = E[valid], seg[valid]
+    n_seg  = np.bincount(seg, minlength=keep.size)
+
+    seg_sum = np.zeros((keep.size, E.shape[1]), dtype=np.float32)
+    np.add.at(seg_sum, seg, E)
+
+    denom = (n_seg[seg] - 1).astype(np.float32); denom[denom == 0] = 1.0
+    other = (seg_sum[seg] - E) / denom[:, None]
+    na, nb = np.linalg.norm(E, axis=1), np.linalg.norm(other, axis=1)
+
+    cos = np.zeros(E.shape[0], dtype=np.float64)
+    ok  = nb > 0
+    cos[ok] = (E[ok] * other[ok]).sum(axis=1) / (na[ok] * nb[ok])
+
+    gc_sum = np.bincount(seg, weights=cos, minlength=keep.size)
+    for i, k in enumerate(keep):
+        if n_seg[i] >= 2: results[k] = float(gc_sum[i] / n_seg[i])
+    return results
+
+
+# ==================================================================== ===================================
+# Transcripts -> mean GC (one value per transcript, like pragmatic_gc_mean)
+# ==================================================================== ===================================
+def _user_texts(transcript) -> list[str]:
+    """ A transcript is a list of (role, text, ...) messages (same shape as the context buffer). """
+    return [message[1] for message in transcript if message[0] == "user"]
+
+def _score_chunk(transcripts, store, options) -> list[float]:
+    texts  = [_user_texts(t) for t in transcripts]
+    gcs    = iter(batch_utterance_gc([text for group in texts for text in group], store, **options))
+
+    scores = []
+    for group in texts:
+        values = [gc for gc in (next(gcs) for _ in group) if gc is not None]
+        scores.append(float(np.mean(values)) if values else 0.0)
+    return scores
+
+def _chunks(transcripts, max_tokens):
+    """ Consecutive groups of transcripts with roughly max_tokens words each. """
+    chunk, size = [], 0
+    for transcript in transcripts:
+        chunk.append(transcript); size += sum(len(text.split()) for text in _user_texts(transcript))
+        if size >= max_tokens: yield chunk; chunk, size = [], 0
+    if chunk: yield chunk
+
+# --------------------------------------------------------------------
+# Process pool workers (each maps the store once)
+# --------------------------------------------------------------------
+_WORKER_STORE = None
+
+def _init_worker(store_dir):
+    global _WORKER_STORE
+    _WORKER_STORE = load_lsa_store(store_dir)
+
+def _score_chunk_in_worker(transcripts, options):
+    return _score_chunk(transcripts, _WORKER_STORE, options)
+
+# --------------------------------------------------------------------
+# Entry point
+# --------------------------------------------------------------------
+def batch_pragmatic_gc(transcripts, *, workers=BioConfig.COHERENCE_WORKERS, store_dir=STORE_DIR,
+                       max_tokens=BioConfig.COHERENCE_BATCH_TOKENS, norm=True, f_weight="logfreq", winsize=20) -> list[float]:
+    """
+    Mean user GC for every transcript, in the same order (0.0 for transcripts without a scorable utterance).
+
+    workers=0 scores everything in this process (and falls back to the CSV files if the store isn't built);
+    otherwise the compiled store in store_dir is required so the workers can map it.
+    """
+    transcripts = list(transcripts)
+    options     = dict(norm=norm, f_weight=f_weight, winsize=winsize)
+    chunks      = list(_chunks(transcripts, max_tokens))
+
+    if workers <= 0 or len(chunks) <= 1:
+        store = load_lsa_store(store_dir) if store_dir != STORE_DIR else get_lsa_store()
+        return [score for chunk in chunks for score in _score_chunk(chunk, store, options)]
+
+    logger.info(f"{BioConfig.PRAG} Scoring {len(transcripts)} transcripts in {len(chunks)} chunks on {workers} workers")
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(store_dir,)) as pool:
+        results = pool.map(_score_chunk_in_worker, chunks, [options] * len(chunks))
+        return [score for chunk_scores in results for score in chunk_scores]
@@ -17,11 +17,16 @@ token window to the rest of the utterance. For each user utterance:
 
 The result is a single float; higher = more on-topic.
 
+Steps 2-4 are fully vectorized per utterance: tokens are mapped to vector rows once, every window's token counts
+come from a cumulative count matrix (C[end] - C[start]), window embeddings are one matrix product (or, for
+f_weight="freq", a difference of cumulative weighted-vector sums), and all GC cosines are one matrix operation.
+
 """
 import numpy  as np
 import pandas as pd
 import re
-from sklearn.metrics.pairwise import cosine_similarity
+
+from .lsa_store import LSAStore
 
 # ==================================================================== ===================================
 # Helpers
@@ -32,61 +37,102 @@ def _tokenize(text: str) -> list[str]:
     return _TOKEN_RE.sub("", (text or "").lower()).strip().split()
 
 # --------------------------------------------------------------------
-# Cosine Similarity
+# Window embeddings for every window of an utterance at once
 # --------------------------------------------------------------------
-def _safe_cos(a: np.ndarray, b: np.ndarray) -> float:
+def _window_embeddings(ids, vecs, entropy, norm, f_weight, winsize):
     """
-    Should do the same thing as the Sklearn function without the overhead from
-    one on one comparisons.
-    """
-    na = np.linalg.norm(a); nb = np.linalg.norm(b)
-    if na == 0 or nb == 0: return 0.0
-    return float(np.dot(a, b) / (na * nb))
-
-# Sklearn cosine similarity
-def _cosine_sklearn(a: np.ndarray, b: np.ndarray) -> float:
-    return float(cosine_similarity(a.reshape(1, -1), b.reshape(1, -1))[0, 0])
+    Embed every sliding window (ending at each token) as a weighted MEAN of its word vectors.
 
+    ids      => (W,) row index into vecs for each token, -1 for out-of-vocab tokens
+    vecs     => (V,D) embedding matrix aligned to vectors.index
+    entropy  => (V,) array; weights are multiplied by entropy[ids]
+    norm     => if True, L2-normalize each token vector before averaging
+    f_weight => "logfreq" | "freq" | "none" (applied to each token's count inside the window)
 
-# --------------------------------------------------------------------
-# Build a window embedding as a weighted MEAN of word vectors
-# --------------------------------------------------------------------
-def _weighted_mean_embed(ids, w, vecs, entropy, norm):
-    """
-    Turn each window into a semantic embedding. 
-        (weighted mean of word vectors, optionally normalized, entropy-weighted).
-
-    All arguments except norm are np.darray; norm is a bool.
     ------------
-    ids     => indices of tokens in this window (into vecs rows)
-    w       => window-internal weights per token (logfreq / freq / ones)
-    vecs    => (V,D) embedding matrix aligned to vectors.index
-    entropy => (V,) array; weights are multiplied by entropy[ids]
-    norm    => if True, L2-normalize each token vector before averaging
-
-    ------------
-    Returns a (D,) vector. If the window has no in-vocab tokens or the
-    sum of weights is zero, returns a zero vector. Using a mean (not sum)
-    keeps the scale stable across different window lengths.
+    Returns a (W, D) float32 matrix. Windows with no in-vocab tokens or a zero weight sum are zero 
+    vectors. Using a mean (not sum) keeps the scale stable across different window lengths.
 
     """
-    # If the window has no in-vocab tokens, returns a zero vector.
-    if ids.size == 0: return np.zeros((vecs.shape[1],), dtype=np.float32)
+    W, D = ids.shape[0], vecs.shape[1]
+    in_vocab = ids >= 0
+    if not in_vocab.any(): return np.zeros((W, D), dtype=np.float32)
 
-    # Construct the embedding matrix
-    w = w.astype(np.float32) * entropy[ids].astype(np.float32)
-    M = vecs[ids, :]
+    # Only the distinct tokens of this utterance are needed (local ids 0..U-1)
+    uniq, local = np.unique(ids[in_vocab], return_inverse=True)
+    M = vecs[uniq, :].astype(np.float32, copy=False)
+    e = entropy[uniq].astype(np.float32, copy=False)
 
     # If True, L2-normalize each token vector before averaging.
     if norm:
         d = np.linalg.norm(M, axis=1); d[d == 0] = 1.0
         M = M / d[:, None]
-    
+
+    # Window i covers tokens [start[i], end[i])
+    end   = np.arange(1, W + 1)
+    start = np.maximum(0, end - winsize)
+
+    if f_weight == "freq":
+        # Linear in the counts -> prefix sums of the weighted vectors, every window is an O(D) difference
+        # (summed in float64: float32 prefix sums lose ~1e-5 over a long utterance, the difference of two cancels badly)
+        tok_w = np.zeros(W, dtype=np.float64); tok_w[in_vocab] = e[local]
+        tok_v = np.zeros((W, D), dtype=np.float64); tok_v[in_vocab] = e[local, None] * M[local]
+
+        P = np.zeros((W + 1, D), dtype=np.float64); np.cumsum(tok_v, axis=0, out=P[1:])
+        S = np.zeros( W + 1,     dtype=np.float64); np.cumsum(tok_w,         out=S[1:])
+        num, den = (P[end] - P[start]).astype(np.float32), (S[end] - S[start]).astype(np.float32)
+
+    else:
+        # Cumulative count matrix -> per-window counts of each distinct token
+        C = np.zeros((W + 1, uniq.shape[0]), dtype=np.float32)
+        C[np.flatnonzero(in_vocab) + 1, local] = 1.0
+        np.cumsum(C, axis=0, out=C)
+        counts = C[end] - C[start]
+
+        if f_weight == "logfreq": w = np.log10(counts + 1.0)
+        else                    : w = (counts > 0).astype(np.float32)
+
+        w  *= e[None, :]
+        num = w @ M
+        den = w.sum(axis=1)
+
     # If the sum of weights is zero, returns a zero vector.
-    s = w.sum()
-    if s == 0: return np.zeros((vecs.shape[1],), dtype=np.float32)
+    out = np.zeros((W, D), dtype=np.float32)
+    ok  = den != 0
+    out[ok] = num[ok] / den[ok, None]
+    return out
+
+# --------------------------------------------------------------------
+# Global coherence of every window in one matrix operation
+# --------------------------------------------------------------------
+def _global_coherence(win_emb):
+    """
+    Cosine of each valid (non-zero) window with the mean of all OTHER valid windows.
+    Returns the mean GC, or None if there are fewer than 2 valid windows.
+    """
+    E = win_emb[np.linalg.norm(win_emb, axis=1) > 0]
+    n = E.shape[0]
+    if n < 2: return None
 
-    return (w[:, None] * M).sum(axis=0) / s
+    other = (E.sum(axis=0)[None, :] - E) / (n - 1)
+    na, nb = np.linalg.norm(E, axis=1), np.linalg.norm(other, axis=1)
+
+    cos = np.zeros(n, dtype=np.float64)
+    ok  = nb > 0
+    cos[ok] = (E[ok] * other[ok]).sum(axis=1) / (na[ok] * nb[ok])
+    return float(cos.mean())
+
+# --------------------------------------------------------------------
+# GC for a single utterance
+# --------------------------------------------------------------------
+def utterance_gc(text, vecs, entropy_arr, tok2id, stop_set, *, norm=True, f_weight="logfreq", winsize=20):
+    """ Mean window GC for one utterance (None if it doesn't have 2 usable windows). """
+    # Convert to tokens; skip if none
+    tokens = [t for t in _tokenize(text) if t not in stop_set]
+    if not tokens: return None
+
+    ids = np.fromiter((tok2id.get(t, -1) for t in tokens), dtype=np.int64, count=len(tokens))
+    return _global_coherence(_window_embeddings(ids, vecs, entropy_arr, norm, f_weight, winsize))
 
             
 # ====================================================================
@@ -118,9 +164,9 @@ def validation_setup(f_weight, winsize, vectors, entropy):
 # ==================================================================== ===================================
 def pragmatic_gc_mean(
     data      : pd.DataFrame,
-    vectors   : pd.DataFrame,  # rows: tokens, cols: dims
-    entropy   : pd.DataFrame,  # aligned with vectors.index (same order/length)
-    stop_list : pd.DataFrame,
+    vectors   : pd.DataFrame | LSAStore,  # rows: tokens, cols: dims (or a compiled store)
+    entropy   : pd.DataFrame = None,     # aligned with vectors.index (same order/length)
+    stop_list : pd.DataFrame = None,
     *,
     norm     : bool = True,
     f_weight : str  = "logfreq",        # "logfreq" | "freq" | "none"
@@ -130,7 +176,7 @@ def pragmatic_gc_mean(
     Returns a single float: mean global coherence (GC) across all USER rows.
     
     data      : DataFrame with columns ["participants","response"].
-    vectors   : DataFrame indexed by tokens (unique), values are embeddings.
+    vectors   : DataFrame indexed by tokens (unique), values are embeddings -- or an LSAStore (entropy/stop_list come from it).
     entropy   : Series (index == vectors.index) or ndarray of len == len(vectors).
     stop_list : list of stop words.
     
@@ -138,13 +184,17 @@ def pragmatic_gc_mean(
     # --------------------------------------------------------------------
     # Input validation & initial setup
     # --------------------------------------------------------------------
-    vecs, entropy_arr, D, tok2id = validation_setup(f_weight, winsize, vectors, entropy)
+    if isinstance(vectors, LSAStore):
+        if f_weight not in {"logfreq", "freq", "none"}: raise ValueError("f_weight must be one of {'logfreq','freq','none'}")
+        if winsize < 1                                : raise ValueError("winsize must be >= 1")
+        vecs, entropy_arr, tok2id, stop_set = vectors.vecs, vectors.entropy, vectors.tok2id, vectors.stop_set
+    else:
+        vecs, entropy_arr, D, tok2id = validation_setup(f_weight, winsize, vectors, entropy)
+        if stop_list is not None: stop_list = stop_list.iloc[:, 0].tolist()
+        stop_set = set(stop_list or [])
 
     df = data.iloc[:, :2].copy()
     df.columns = ["participants", "response"]
-
-    if stop_list is not None: stop_list = stop_list.iloc[:, 0].tolist()
-    stop_set = set(stop_list or [])
     
     # ====================================================================
     # Per-user-row GC (no iterrows; use ndarray of texts)
@@ -153,61 +203,11 @@ def pragmatic_gc_mean(
     gc_values: list[float] = []
 
     for text in user_texts:
-        # --------------------------------------------------------------------
-        # 1) Tokenize to words (lowercased, punctuation removed)
-        # --------------------------------------------------------------------
-        # Convert to tokens; skip if none
-        tokens = [t for t in _tokenize(text) if t not in stop_set]
-        if not tokens: continue
-
-        # --------------------------------------------------------------------
-        # 2) Build sliding windows of up to `winsize` tokens (ending at each token)
-        # --------------------------------------------------------------------
-        # Sliding window embeddings
-        W = len(tokens)
-        win_emb = np.zeros((W, D), dtype=np.float32)
-
-        for i in range(W):
-            a = max(0, i - winsize + 1); b = i + 1
-            span = tokens[a:b]
-
-            # Map to vector row ids
-            ids = [tok2id[t] for t in span if t in tok2id]
-            if not ids: continue
-
-            ids = np.array(ids, dtype=np.int64)
-            uniq, cnt = np.unique(ids, return_counts=True)
-
-            if   f_weight == "logfreq": w = np.log10(cnt.astype(np.float32) + 1.0)
-            elif f_weight == "freq"   : w = cnt.astype(np.float32)
-            else                      : w = np.ones_like(cnt, dtype=np.float32)
-
-            # 3) Embed each window as a weighted MEAN of its word vectors:
-            win_emb[i, :] = _weighted_mean_embed(uniq, w, vecs, entropy_arr, norm)
-
-        # --------------------------------------------------------------------
-        # 4) For each window, get GLOBAL COHERENCE 
-        # --------------------------------------------------------------------
-        # If there are fewer than 2 valid windows, skip.
-        valid = (np.linalg.norm(win_emb, axis=1) > 0)
-        if valid.sum() < 2: continue
-
-        mean_all = win_emb[valid].mean(axis=0)
-        idxs     = np.where(valid)[0]
-        n_valid  = len(idxs)
-
-        # GC per valid window as cosine with the mean of all OTHER windows
-        cos_vals = []
-        for j in idxs:
-            # Cosine similarity
-            other = (mean_all * n_valid - win_emb[j, :]) / (n_valid - 1)
-            cos_vals.append(_safe_cos(win_emb[j, :], other))
-            
-            # Sklearn method
-            #cos_vals.append(_cosine_sklearn(win_emb[j, :], other))
+        # 1) Tokenize, 2) window, 3) embed & 4) GC -- all windows at once
+        gc = utterance_gc(text, vecs, entropy_arr, tok2id, stop_set, norm=norm, f_weight=f_weight, winsize=winsize)
 
         # 5a) Average window GC for the utterance
-        if cos_vals: gc_values.append(float(np.mean(cos_vals)))
+        if gc is not None: gc_values.append(gc)
 
     # 5b) Average across utterances
     return float(np.mean(gc_values)) if gc_values else 0.0
@@ -0,0 +1,122 @@
+"""
+Altered grammar model registry
+
+Loads the logistic regression model and scaler.pkl ONCE per process, checks they belong together, and folds the
+StandardScaler into the logistic coefficients:
+
+    z = coef . ((x - mean) / scale) + intercept
+      = (coef / scale) . x + (intercept - coef . (mean / scale))
+
+so scoring an utterance is a single NumPy dot product plus a sigmoid. The pickle files are re-checked every
+RELOAD_INTERVAL seconds and reloaded if they changed on disk (a bad reload keeps the previous predictor).
+
+"""
+import os, pickle, logging, threading
+from time   import monotonic
+from typing import NamedTuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+PICKLE_PATH     = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pickle_files")
+SCALER_FILE     = "scaler.pkl"
+RELOAD_INTERVAL = 5.0 # seconds between checks of the pickle files
+
+
+# ==================================================================== ===================================
+# Immutable predictor
+# ==================================================================== ===================================
+class GrammarPredictor(NamedTuple):
+    weights    : np.ndarray  # (n_features,) coefficients with the scaler folded in (read-only)
+    bias       : float
+    model_path : str
+
+    def predict_proba(self, features) -> float:
+        """ Probability of the positive class, same as logistic_model.predict_proba(scaler.transform(x))[0][1] """
+        z = float(np.dot(np.asarray(features, dtype=np.float64).reshape(-1), self.weights)) + self.bias
+        return 1.0 / (1.0 + np.exp(-z))
+
+
+def build_predictor(logistic_model, scaler, model_path="") -> GrammarPredictor:
+    """ Validate the model/scaler pair and fold the scaler into the coefficients. """
+    coef = np.asarray(getattr(logistic_model, "coef_", None), dtype=np.float64)
+    if coef.ndim != 2 or coef.shape[0] != 1                             : raise ValueError("grammar model must be a fitted binary logistic regression")
+    if list(getattr(logistic_model, "classes_", [])) != [0, 1]          : raise ValueError("grammar model classes must be [0, 1]")
+    if getattr(scaler, "n_features_in_", coef.shape[1]) != coef.shape[1]: raise ValueError("scaler and model have a different number of features")
+
+    n_features = coef.shape[1]
+    mean  = scaler.mean_  if getattr(scaler, "with_mean", True) and scaler.mean_  is not None else np.zeros(n_features)
+    scale = scaler.scale_ if getattr(scaler, "with_std",  True) and scaler.scale_ is not None else np.ones (n_features)
+
+    weights = coef[0] / scale
+    bias    = float(logistic_model.intercept_[0] - np.dot(coef[0], mean / scale))
+    if not (np.all(np.isfinite(weights)) and np.isfinite(bias)): raise ValueError("folded grammar model is not finite")
+
+    weights.flags.writeable = False
+    return GrammarPredictor(weights, bias, model_path)
+
+
+# ==================================================================== ===================================
+# Registry (one per process)
+# ==================================================================== ===================================
+class GrammarModelRegistry:
+    def __init__(self, pickle_path=PICKLE_PATH, reload_interval=RELOAD_INTERVAL):
+        self.pickle_path     = pickle_path
+        self.reload_interval = reload_interval
+
+        self._predictor  = None
+        self._signature  = None
+        self._checked_at = 0.0
+        self._lock       = threading.Lock()
+
+    def get(self) -> GrammarPredictor:
+        """ Current predictor; only touches the disk every reload_interval seconds. """
+        if self._predictor is not None and (monotonic() - self._checked_at) < self.reload_interval:
+            return self._predictor
+
+        with self._lock:
+            if self._predictor is None or (monotonic() - self._checked_at) >= self.reload_interval:
+                self._checked_at = monotonic()
+                signature = self._files_signature()
+                if signature != self._signature:
+                    try:
+                        self._predictor = self._load()
+                        self._signature = signature
+                        logger.info(f"Loaded grammar model: {self._predictor.model_path}")
+                    except Exception as e:
+                        if self._predictor is None: raise
+                        logger.error(f"Reloading grammar model failed, keeping the previous one: {e}")
+
+        return self._predictor
+
+    # --------------------------------------------------------------------
+    # Helpers
+    # --------------------------------------------------------------------
+    def _model_file(self) -> str:
+        # Check if the directory exists before getting all .pkl files within
+        if not os.path.exists(self.pickle_path): raise FileNotFoundError(f"Directory not found: {self.pickle_path}")
+        model_files = sorted(f for f in os.listdir(self.pickle_path) if f.endswith('.pkl') and f != SCALER_FILE)
+
+        # Make sure there is at least one model file
+        if not model_files: raise FileNotFoundError("No model .pkl files found in the pickle_files directory.")
+        return os.path.join(self.pickle_path, model_files[0])
+
+    def _files_signature(self):
+        try:
+            paths = [self._model_file(), os.path.join(self.pickle_path, SCALER_FILE)]
+            return tuple((path, os.stat(path).st_mtime_ns, os.stat(path).st_size) for path in paths)
+        except OSError:
+            return None
+
+    def _load(self) -> GrammarPredictor:
+        model_path  = self._model_file()
+        scaler_path = os.path.join(self.pickle_path, SCALER_FILE)
+        if not os.path.exists(scaler_path): raise FileNotFoundError(f"Scaler file not found: {scaler_path}")
+
+        with open(model_path,  'rb') as file: logistic_model = pickle.load(file)
+        with open(scaler_path, 'rb') as file: scaler         = pickle.load(file)
+        return build_predictor(logistic_model, scaler, model_path)
+
+
+GRAMMAR_MODEL = GrammarModelRegistry()
@@ -0,0 +1,109 @@
+"""
+Compiled LSA vector store for the pragmatic biomarker
+
+new_LSA.csv / Hoffman_entropy_53758.csv / stoplist.txt are compiled ONCE (python manage.py build_lsa_store) into:
+
+    vectors.npy   => (V, D) float32 matrix, opened with mmap so every worker process shares the same pages
+    entropy.npy   => (V,)   float32, aligned with the rows of vectors.npy
+    vocab.json    => token -> row index (the lookup coherence_v2 used to rebuild on every call)
+    stoplist.json => stop words
+
+Loading the store only maps the arrays and reads the vocabulary, so startup takes milliseconds and there
+is no DataFrame -> array conversion left for the per-utterance code.
+
+"""
+import os, json, logging
+
+import numpy  as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------------------------------------
+# Paths
+# --------------------------------------------------------------------
+bm_path   = os.path.dirname(os.path.abspath(__file__))
+STORE_DIR = f"{bm_path}/lsa_store"
+
+VECTORS_CSV  = f"{bm_path}/new_LSA.csv"
+ENTROPY_CSV  = f"{bm_path}/Hoffman_entropy_53758.csv"
+STOPLIST_TXT = f"{bm_path}/stoplist.txt"
+
+VECTORS_FILE  = "vectors.npy"
+ENTROPY_FILE  = "entropy.npy"
+VOCAB_FILE    = "vocab.json"
+STOPLIST_FILE = "stoplist.json"
+
+
+# ==================================================================== ===================================
+# Store
+# ==================================================================== ===================================
+class LSAStore:
+    """ Everything the coherence code needs, already in the form it uses. """
+    def __init__(self, vecs, entropy, tok2id, stop_set):
+        if entropy.shape[0] != vecs.shape[0]: raise ValueError("entropy length must equal number of vector rows")
+
+        self.vecs     = vecs      # (V, D) float32
+        self.entropy  = entropy   # (V,)   float32
+        self.tok2id   = tok2id    # token -> row
+        self.stop_set = stop_set  # set of stop words
+
+    @property
+    def shape(self): return self.vecs.shape
+
+    # --------------------------------------------------------------------
+    # Constructors
+    # --------------------------------------------------------------------
+    @classmethod
+    def from_frames(cls, vectors: pd.DataFrame, entropy: pd.DataFrame, stop_list: pd.DataFrame = None):
+        """ Same conversion coherence_v2.validation_setup does (the token index keeps the LAST row of a duplicate). """
+        vecs     = np.ascontiguousarray(vectors.values, dtype=np.float32)
+        entropy  = np.ascontiguousarray(np.asarray(entropy["x"]), dtype=np.float32)
+        tok2id   = {w: i for i, w in enumerate(vectors.index)}
+        stop_set = set(stop_list.iloc[:, 0].tolist()) if stop_list is not None else set()
+        return cls(vecs, entropy, tok2id, stop_set)
+
+    @classmethod
+    def from_csv(cls, vectors_csv=VECTORS_CSV, entropy_csv=ENTROPY_CSV, stoplist_txt=STOPLIST_TXT):
+        return cls.from_frames(pd.read_csv(vectors_csv, index_col=0), pd.read_csv(entropy_csv), pd.read_table(stoplist_txt, header=None))
+
+
+# ==================================================================== ===================================
+# Build / Load
+# ==================================================================== ===================================
+def build_lsa_store(out_dir=STORE_DIR, vectors_csv=VECTORS_CSV, entropy_csv=ENTROPY_CSV, stoplist_txt=STOPLIST_TXT) -> LSAStore:
+    """ Compile the CSV/TXT files into out_dir (each file is written to a temp name first, then swapped in). """
+    store = LSAStore.from_csv(vectors_csv, entropy_csv, stoplist_txt)
+    os.makedirs(out_dir, exist_ok=True)
+
+    def _write(name, save):
+        tmp = os.path.join(out_dir, f".{name}.tmp")
+        with open(tmp, "wb") as f: save(f)
+        os.replace(tmp, os.path.join(out_dir, name))
+
+    _write(VECTORS_FILE,  lambda f: np.save(f, store.vecs))
+    _write(ENTROPY_FILE,  lambda f: np.save(f, store.entropy))
+    _write(VOCAB_FILE,    lambda f: f.write(json.dumps(store.tok2id).encode("utf-8")))
+    _write(STOPLIST_FILE, lambda f: f.write(json.dumps(sorted(store.stop_set)).encode("utf-8")))
+
+    logger.info(f"Built LSA store in {out_dir}: {store.shape[0]:,} tokens x {store.shape[1]} dims")
+    return store
+
+def load_lsa_store(store_dir=STORE_DIR, mmap=True) -> LSAStore:
+    """ Map a compiled store (raises FileNotFoundError if it hasn't been built). """
+    mode = "r" if mmap else None
+    vecs    = np.load(os.path.join(store_dir, VECTORS_FILE), mmap_mode=mode)
+    entropy = np.load(os.path.join(store_dir, ENTROPY_FILE), mmap_mode=mode)
+
+    with open(os.path.join(store_dir, VOCAB_FILE),    encoding="utf-8") as f: tok2id   = json.load(f)
+    with open(os.path.join(store_dir, STOPLIST_FILE), encoding="utf-8") as f: stop_set = set(json.load(f))
+
+    return LSAStore(vecs, entropy, tok2id, stop_set)
+
+def get_lsa_store() -> LSAStore:
+    """ The compiled store if it exists, otherwise fall back to parsing the CSV files (slow). """
+    try:
+        return load_lsa_store()
+    except FileNotFoundError:
+        logger.warning(f"No compiled LSA store in {STORE_DIR}, loading the CSV files (run: python manage.py build_lsa_store)")
+        return LSAStore.from_csv()
@@ -0,0 +1,187 @@
+"""
+Persistent Stanford constituency parser
+
+NLTK's StanfordParser starts a brand new JVM (and reloads englishPCFG.ser.gz) for every call to raw_parse_sents,
+which is where almost all of the altered grammar latency came from. This keeps ONE warm LexicalizedParser process
+per worker and talks to it over stdin/stdout:
+
+    1) The parser is started once with "-sentences newline -outputFormat oneline" and reads from stdin ("-")
+    2) Callers submit a list of sentences and block on a Future
+    3) A single dispatcher thread drains every pending request, writes them as one batch (one sentence per line)
+       followed by a sentinel line, and reads back exactly one tree per sentence. The sentinel's own tree is
+       skipped whenever it shows up, so the batch doesn't hang if the tokenizer holds back a line of lookahead
+       until the next line arrives (see manage.py check_parser_service)
+    4) If the process dies or stops answering, it is killed and restarted on the next batch
+
+"""
+import os, shutil, logging, subprocess, threading
+from queue              import Queue, Empty
+from concurrent.futures import Future
+
+from nltk.tree import Tree
+
+from .. import biomarker_config as BioConfig
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------------------------------------
+# Paths
+# --------------------------------------------------------------------
+root_path            = os.path.dirname(os.path.abspath(__file__))
+stanford_parser_path = f"{root_path}/stanford-parser-full-2020-11-17"
+stanford_model_path  = f"{stanford_parser_path}/englishPCFG.ser.gz"
+
+PARSER_CLASS = "edu.stanford.nlp.parser.lexparser.LexicalizedParser"
+SENTINEL     = "ParserBatchSentinel"  # written after every batch, its tree is never returned
+
+
+# ==================================================================== ===================================
+# Helpers
+# ==================================================================== ===================================
+def _java_bin() -> str:
+    """ java on the PATH, otherwise whatever JAVA_HOME points at. """
+    java = shutil.which("java")
+    if java: return java
+
+    java_home = os.environ.get("JAVA_HOME", r"C:\Program Files\Java\jdk-22")
+    return os.path.join(java_home, "bin", "java")
+
+def _clean(sentence: str) -> str:
+    """ The parser reads one sentence per line, so an utterance can't contain its own newlines. """
+    return " ".join((sentence or "").split())
+
+def _to_tree(line: str):
+    """ Unparseable sentences come back as "(())" -- treat those as an empty tree. """
+    try:              return Tree.fromstring(line)
+    except Exception: return None
+
+
+# ==================================================================== ===================================
+# Parser Service
+# ==================================================================== ===================================
+class ParserService:
+    """
+    One long-lived LexicalizedParser process with request batching.
+
+    parse(sentences) is thread-safe; requests from every biomarker thread are funnelled through
+    a single dispatcher so the process only ever sees one batch at a time.
+    """
+    def __init__(self, model_path=stanford_model_path, classpath=f"{stanford_parser_path}/*",
+                 java_options=BioConfig.PARSER_JAVA_OPTIONS, timeout=BioConfig.PARSER_TIMEOUT):
+        self.model_path   = model_path
+        self.classpath    = classpath
+        self.java_options = java_options
+        self.timeout      = timeout
+
+        self._proc     = None
+        self._lines    = None
+        self._requests = Queue()
+        self._closed   = False
+
+        self._dispatcher = threading.Thread(target=self._dispatch, name="parser-dispatch", daemon=True)
+        self._dispatcher.start()
+
+    # --------------------------------------------------------------------
+    # Public API
+    # --------------------------------------------------------------------
+    def parse(self, sentences: list[str]) -> list:
+        """ Returns one nltk Tree per sentence (None for empty/unparseable sentences). """
+        sentences = [_clean(s) for s in sentences]
+        if not any(sentences): return [None] * len(sentences)
+
+        future = Future()
+        self._requests.put((sentences, future))
+        return future.result()
+
+    def close(self):
+        self._closed = True
+        self._requests.put(None)
+        self._stop_process()
+
+    # --------------------------------------------------------------------
+    # Process management
+    # --------------------------------------------------------------------
+    def _start_process(self):
+        cmd = [_java_bin(), *self.java_options.split(), "-cp", self.classpath, PARSER_CLASS,
+               "-encoding", "utf-8", "-sentences", "newline", "-outputFormat", "oneline", self.model_path, "-"]
+
+        # stderr is just progress output, it would fill the pipe and stall the parser if we kept it
+        self._proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                      text=True, encoding="utf-8", bufsize=1)
+
+        # Read stdout on its own thread so batches can time out instead of hanging forever
+        self._lines = Queue()
+        threading.Thread(target=self._read_stdout, args=(self._proc, self._lines), name="parser-stdout", daemon=True).start()
+        logger.info(f"{BioConfig.GRAM} Stanford parser started (pid {self._proc.pid})")
+
+    def _stop_process(self):
+        proc, self._proc = self._proc, None
+        if proc is None: return
+        try:              proc.kill(); proc.wait(timeout=5)
+        except Exception: pass
+
+    @staticmethod
+    def _read_stdout(proc, lines):
+        for line in proc.stdout:
+            line = line.strip()
+            if line: lines.put(line)
+        lines.put(None) # EOF -> process exited
+
+    # --------------------------------------------------------------------
+    # Dispatcher -- drains everything waiting and sends it as one batch
+    # --------------------------------------------------------------------
+    def _dispatch(self):
+        while True:
+            request = self._requests.get()
+            if request is None: return
+
+            batch = [request]
+            while True:
+                try:          request = self._requests.get_nowait()
+                except Empty: break
+                if request is None: self._closed = True; break
+                batch.append(request)
+
+            try:
+                trees = self._parse_batch([s for sentences, _ in batch for s in sentences])
+                for sentences, future in batch:
+                    future.set_result(trees[:len(sentences)]); trees = trees[len(sentences):]
+
+            except Exception as e:
+                logger.error(f"{BioConfig.GRAM} Parser batch failed, restarting parser: {e}")
+                self._stop_process()
+                for _, future in batch: future.set_exception(e)
+
+            if self._closed: return
+
+    def _parse_batch(self, sentences: list[str]) -> list:
+        # Empty lines produce no output at all, so only send the non-empty ones
+        to_send = [s for s in sentences if s]
+
+        if self._proc is None or self._proc.poll() is not None: self._start_process()
+        self._proc.stdin.write("".join(f"{s}\n" for s in to_send) + f"{SENTINEL}\n")
+        self._proc.stdin.flush()
+
+        parsed = []
+        while len(parsed) < len(to_send):
+            try:          line = self._lines.get(timeout=self.timeout)
+            except Empty: raise TimeoutError(f"no response from parser after {self.timeout}s")
+            if line is None:     raise RuntimeError("parser process exited")
+            if SENTINEL in line: continue  # (this batch's, or the previous one's if it was held back)
+            parsed.append(_to_tree(line))
+
+        parsed = iter(parsed)
+        return [next(parsed) if s else None for s in sentences]
+
+
+# ==================================================================== ===================================
+# One warm parser per worker process
+# ==================================================================== ===================================
+_SERVICE      = None
+_SERVICE_LOCK = threading.Lock()
+
+def get_parser() -> ParserService:
+    global _SERVICE
+    with _SERVICE_LOCK:
+        if _SERVICE is None: _SERVICE = ParserService()
+    return _SERVICE
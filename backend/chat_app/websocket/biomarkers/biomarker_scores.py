@@ -1,6 +1,8 @@
 import logging
+import numpy as np
+from time import time
 from . import biomarker_config as BioConfig
-from ...config import RESET
+from ...services.logging_utils import RESET
 
 # Set up logger
 logger = logging.getLogger(__name__)
@@ -9,12 +11,24 @@ logger = logging.getLogger(__name__)
 # =======================================================================
 # Import Biomarker Functions
 # =======================================================================
-from .core.pragmatic       import generate_pragmatic_score       as prag
-from .core.altered_grammar import generate_altered_grammar_score as gram
-from .core.prosody         import generate_prosody_score         as pros
-from .core.pronunciation   import generate_pronunciation_score   as pron
-from .core.anomia          import generate_anomia_score          as anom
-from .core.turntaking      import generate_turntaking_score      as turn
+# Imported inside the two generate_* functions below, so an audio worker process never loads Stanza/LSA
+# and a text worker never loads the random forests (see services/biomarkerJobs.py)
+def _text_biomarkers():
+    from .core.pragmatic       import generate_pragmatic_score       as prag
+    from .core.altered_grammar import generate_altered_grammar_score as gram
+    from .core.anomia          import generate_anomia_score          as anom
+    return prag, gram, anom
+
+def _audio_biomarkers():
+    from .core.prosody         import generate_prosody_score         as pros
+    from .core.pronunciation   import generate_pronunciation_score   as pron
+    from .core.turntaking      import generate_turntaking_score      as turn
+    return pros, pron, turn
+
+def _audio_batch_biomarkers():
+    from .core.prosody         import generate_prosody_scores        as pros
+    from .core.pronunciation   import generate_pronunciation_scores  as pron
+    return pros, pron
 
 # --------------------------------------------------------------------
 # Try/Except Wrapper
@@ -25,6 +39,12 @@ def generate_biomarker_score(biomarker: str, generate_score, args):
     except Exception as e: score = 0.0; logger.error(f"Error with {biomarker}{RESET}: {e}")
     return score
 
+# Same for a function that scores n windows at once (all n default to 0.0 on errors)
+def generate_biomarker_scores(biomarker: str, generate_scores, args, n: int):
+    try:                   scores = 1.0 - np.asarray(generate_scores(**args), dtype=float)
+    except Exception as e: scores = np.zeros(n); logger.error(f"Error with {biomarker}{RESET}: {e}")
+    return scores
+
 # --------------------------------------------------------------------
 # Function for Timing/Logging each score as they are calculated
 # --------------------------------------------------------------------
@@ -33,7 +53,6 @@ def generate_biomarker_score(biomarker: str, generate_score, args):
 
 # Only time the individual calculations if specified in configuration
 if BioConfig.TIME_BIOMARKERS:
-    from time import time
     def gen_score(biomarker: str, generate_score, args):
         # Time how long it takes to calculate the score
         start_time = time()
@@ -53,15 +72,40 @@ else:
 # =======================================================================
 # Generate Multiple Scores
 # =======================================================================
-# 1) On-Utterance Biomarkers
-def generate_utterance_biomarkers(context_buffer):
-    return {"pragmatic"      : gen_score(BioConfig.PRAG, prag, {"context_buffer": context_buffer}),
-            "alteredgrammar" : gen_score(BioConfig.GRAM, gram, {"context_buffer": context_buffer}), 
-            "anomia"         : gen_score(BioConfig.ANOM, anom, {"context_buffer": context_buffer}),}
+# 1) On-Utterance Biomarkers (per-session state: grammar_cache -> per-message grammar features, coherence -> per-message GC)
+def generate_utterance_biomarker(biomarker: str, context_buffer, grammar_cache=None, coherence=None):
+    prag, gram, anom = _text_biomarkers()
+    label, generate_score, args = {
+        "pragmatic"      : (BioConfig.PRAG, prag, {"context_buffer": context_buffer, "accumulator"  : coherence    }),
+        "alteredgrammar" : (BioConfig.GRAM, gram, {"context_buffer": context_buffer, "feature_cache": grammar_cache}),
+        "anomia"         : (BioConfig.ANOM, anom, {"context_buffer": context_buffer}),
+    }[biomarker]
+    return gen_score(label, generate_score, args)
+
+def generate_utterance_biomarkers(context_buffer, grammar_cache=None, coherence=None):
+    return {biomarker: generate_utterance_biomarker(biomarker, context_buffer, grammar_cache, coherence) for biomarker in BioConfig.UTTERANCE_TIMEOUTS}
 
 # 2) On-Audio Biomarkers
 def generate_audio_biomarkers(prosody_features, pronunciation_features, overlapped_speech_count):
+    pros, pron, turn = _audio_biomarkers()
     return {"prosody"      : gen_score(BioConfig.PROS, pros, {      "prosody_features" :       prosody_features }),
             "pronunciation": gen_score(BioConfig.PRON, pron, {"pronunciation_features" : pronunciation_features }),
              "turntaking"  : gen_score(BioConfig.TURN, turn, {"overlapped_speech_count": overlapped_speech_count}),}
+
+# 3) On-Audio Biomarkers for many windows at once (services/audioBatcher.py)
+#    The windows are stacked along the frame axis, so each model gets a single predict_proba call
+def generate_audio_biomarkers_batch(prosody_features, pronunciation_features, overlapped_speech_counts):
+    pros, pron = _audio_batch_biomarkers()
+    _, _, turn = _audio_biomarkers()
+    n = len(overlapped_speech_counts)
+
+    start_time = time()
+    prosody       = generate_biomarker_scores(BioConfig.PROS, pros, {      "prosody_features":       prosody_features}, n)
+    pronunciation = generate_biomarker_scores(BioConfig.PRON, pron, {"pronunciation_features": pronunciation_features}, n)
+    logger.info(f"{BioConfig.BIO_LOG}Prosody & Pronunciation x{n} ({(time()-start_time):5.4f}s) {RESET}")
+
+    return [{"prosody"      : float(prosody[i]),
+             "pronunciation": float(pronunciation[i]),
+             "turntaking"   : generate_biomarker_score(BioConfig.TURN, turn, {"overlapped_speech_count": count}),}
+            for i, count in enumerate(overlapped_speech_counts)]
     
\ No newline at end of file
@@ -1,38 +1,46 @@
 # =======================================================================
 # Altered Grammar Biomarker
 # =======================================================================
+import numpy as np
 from time import time
-from ..biomarker_models.altered_grammer import generate_grammar_score
+from ..biomarker_models.altered_grammer import generate_grammar_score, grammar_score_from_features, utterance_grammar_features
 
 """
-Temporarily changing this so it just gets the most recent message instead of doing all of them.
-It should do all of them, but the code needs a lot of work to make it not as slow.
+Scores every user message in the context buffer again. The raw feature vector of each message is cached
+(feature_cache, stored on the consumer for the session) so each turn only parses the new utterance; the
+cached vectors are summed and divided by the duration like before.
 
 """
-# TODO: Make this faster, currently have this temporarily set just to use the most recent utterance beceause it is too slow
 
 # Uses saved model on given features (score defaults to 1.0 on error)
-def generate_altered_grammar_score(context_buffer):
+def generate_altered_grammar_score(context_buffer, feature_cache=None):
+    # All of the users messages from the context buffer -- (role, text, ts) tuples are the cache keys
+    user_messages = [message for message in context_buffer if message[0] == "user"]
+    if not user_messages: return 1
+
     # Earliest message timestamp (ToDo: this isn't exact enough, but whatever for now)
     current_duration = time() - context_buffer[0][2]
 
-    # Just get the first most recent message, it's taking too long doing all of them
-    user_messages = []
-    for i in range(len(context_buffer)-1, -1, -1):
-        if context_buffer[i][0] == "user":
-            user_messages.append(context_buffer[i][1])
+    # No cache given, just parse everything
+    if feature_cache is None: feature_cache = {}
 
-            # Get the duration -> should be this timestamp minus the timestamp of the one before it
-            current_duration = context_buffer[i][2] - context_buffer[i-1][2]
-            break # This is whaat does it
+    # 1) Only parse the messages we haven't seen yet
+    new_messages = [message for message in user_messages if message not in feature_cache]
+    if new_messages:
+        features = utterance_grammar_features([message[1] for message in new_messages])
+        feature_cache.update(zip(new_messages, features))
 
-    score = generate_grammar_score(user_messages, current_duration)
-    return score
+    # 2) Forget messages that slid out of the context buffer
+    for message in [m for m in list(feature_cache) if m not in user_messages]: feature_cache.pop(message, None)
+
+    # 3) Sum the cached vectors & score
+    extracted_features = np.sum([feature_cache[message] for message in user_messages], axis=0)
+    return grammar_score_from_features(extracted_features, current_duration)
 
 
 
 # -----------------------------------------------------------------------
-# [OLD VERSION] This should be how it is setup, but is too slow right now
+# [OLD VERSION] Re-parses every message on every turn
 # -----------------------------------------------------------------------
 # Uses saved model on given features (score defaults to 1.0 on error)
 def generate_altered_grammar_score_OLD(context_buffer):
@@ -6,44 +6,105 @@ logger = logging.getLogger(__name__)
 # =======================================================================
 # Pragmatic Biomarker
 # =======================================================================
-import pandas as pd
 import math
-import os
+import threading
 
-from ..biomarker_models.coherence_function import coherence
-from ..biomarker_models.coherence_v2 import pragmatic_gc_mean
+from ..biomarker_models.coherence_v2 import utterance_gc
+from ..biomarker_models.lsa_store    import get_lsa_store
 
 # -----------------------------------------------------------------------
 # Features for the Pragmatic Score
 # -----------------------------------------------------------------------
-current_path = os.path.dirname(os.path.abspath(__file__))
-parent_path  = os.path.dirname(current_path) # (one level up)
-bm_path      = f"{parent_path}/biomarker_models"
+# Compiled LSA vectors/entropy/vocab (python manage.py build_lsa_store), falls back to the CSV files
+LSA = get_lsa_store()
 
-# ---- TODO: As soon as these get used in the function, they have some formatting done to them. Just do it here... ----
-bm_vectors   = pd.read_csv  (f"{bm_path}/new_LSA.csv", index_col=0 )
-bm_entropy   = pd.read_csv  (f"{bm_path}/Hoffman_entropy_53758.csv")
-bm_stop_list = pd.read_table(f"{bm_path}/stoplist.txt", header=None)
+# Arrays/lookups used for every utterance
+bm_vecs, bm_entropy_arr, bm_tok2id, bm_stop_set = LSA.vecs, LSA.entropy, LSA.tok2id, LSA.stop_set
+
+
+# -----------------------------------------------------------------------
+# Per-session coherence accumulator
+# -----------------------------------------------------------------------
+class CoherenceAccumulator:
+    """
+    Keeps the GC of every user message currently in the context buffer, plus their running sum/count.
+
+    Each turn only the new message(s) get windowed & embedded; messages that slid out of the buffer
+    are subtracted back out. GC only compares windows inside the same utterance, so a message's value 
+    never changes once it has been computed.
+    """
+    def __init__(self):
+        self._gc    = {}  # (role, text, ts) -> mean window GC (None if the utterance had < 2 usable windows)
+        self._sum   = 0.0
+        self._count = 0
+        self._lock  = threading.Lock()
+
+    def update(self, context_buffer) -> float:
+        """ Fold in new user messages, drop evicted ones, return the mean GC across utterances (0.0 if none). """
+        user_messages = [message for message in context_buffer if message[0] == "user"]
+
+        with self._lock:
+            # 1) New messages
+            for message in user_messages:
+                if message in self._gc: continue
+                gc = self._gc[message] = utterance_gc(message[1], bm_vecs, bm_entropy_arr, bm_tok2id, bm_stop_set)
+                if gc is not None: self._sum += gc; self._count += 1
+
+            # 2) Evicted messages
+            current = set(user_messages)
+            for message in [m for m in self._gc if m not in current]:
+                gc = self._gc.pop(message)
+                if gc is not None: self._sum -= gc; self._count -= 1
+
+            return (self._sum / self._count) if self._count else 0.0
+
+    def copy(self) -> "CoherenceAccumulator":
+        """ A snapshot for a job to update (the job never touches the session's own accumulator). """
+        copy = CoherenceAccumulator()
+        with self._lock: copy._gc, copy._sum, copy._count = dict(self._gc), self._sum, self._count
+        return copy
+
+    def merge(self, other: "CoherenceAccumulator", context_buffer):
+        """
+        Bring back what a job computed on a copy, by message: only messages in context_buffer (the session's context
+        as it is NOW) are kept, values this one doesn't have yet are taken from other. Jobs can finish in any order.
+        """
+        current = {message for message in context_buffer if message[0] == "user"}
+
+        with self._lock:
+            for message in [m for m in other._gc if m in current and m not in self._gc]:
+                gc = self._gc[message] = other._gc[message]
+                if gc is not None: self._sum += gc; self._count += 1
+
+            for message in [m for m in self._gc if m not in current]:
+                gc = self._gc.pop(message)
+                if gc is not None: self._sum -= gc; self._count -= 1
+
+    # Locks can't be pickled (accumulators are sent to/from the text worker processes)
+    def __getstate__(self):
+        return {"_gc": self._gc, "_sum": self._sum, "_count": self._count}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
 
 
 # -----------------------------------------------------------------------
 # Pragmatic Score
 # -----------------------------------------------------------------------
 # Uses saved models on given features (score defaults to 1.0 on error)
-# TODO: Utterances are too short, just gives 1
-def generate_pragmatic_score(context_buffer):
-    # Get a DataFrame for the given speech
-    try:                   speech_df = get_speech_df(context_buffer)
-    except Exception as e: logger.error(f"Error preparing speech data for coherence calculation: {e}"); return 1
+# Each user message is scored as one utterance (the accumulator keeps them between turns)
+def generate_pragmatic_score(context_buffer, accumulator=None):
+    # No accumulator given, just score everything in the buffer
+    if accumulator is None: accumulator = CoherenceAccumulator()
     
     # Calculate the pragmatic score
     try:
-        #pragmatic_score = coherence(speech_df, vectors=bm_vectors, entropy=bm_entropy, stop_list=bm_stop_list)
-        pragmatic_score = pragmatic_gc_mean(speech_df, vectors=bm_vectors, entropy=bm_entropy, stop_list=bm_stop_list)
+        pragmatic_score = accumulator.update(context_buffer)
         
         # Assuming pragmatic_score is a float
         if math.isnan(pragmatic_score):
-            print("is nan condition pragmatic_score", pragmatic_score)
+            logger.warning(f"Pragmatic score is NaN ({pragmatic_score}), using 0")
             pragmatic_score = 0
 
         # Adjusted pragmatic score
@@ -52,24 +113,3 @@ def generate_pragmatic_score(context_buffer):
     
     except Exception as e: logger.error(f"Error calculating pragmatic score: {e}"); return 1.0
 
-
-
-# -----------------------------------------------------------------------
-# Creates a DataFrame for the given speech
-# -----------------------------------------------------------------------
-# TODO: DataFrames are slow, we should just either give it the context buffer or pre convert it into an array or something...
-def get_speech_df(context_buffer):
-    """
-    Roles are: "user" "assistant"
-    The function expects user and robot, but robot isn't used anymore so...
-    """
-    word_vector, role_vector = [], []
-    for utterance in context_buffer:
-        words =  utterance[1].split()
-        roles = [utterance[0]] * len(words)
-
-        word_vector += words
-        role_vector += roles
- 
-    speech_df = pd.DataFrame({"V1": role_vector, "V2": word_vector})
-    return speech_df
@@ -7,3 +7,7 @@ from ..rf_models.model_loader import PRONUNCIATION_MODEL
 # Uses saved model on given features (score defaults to 1.0 on error)
 def generate_pronunciation_score(pronunciation_features, pronunciation_model=PRONUNCIATION_MODEL):
     return process_scores(pronunciation_features, pronunciation_model)[0]
+
+# Many windows stacked along the frame axis -> one score per window (a single predict_proba call)
+def generate_pronunciation_scores(pronunciation_features, pronunciation_model=PRONUNCIATION_MODEL):
+    return process_scores(pronunciation_features, pronunciation_model)
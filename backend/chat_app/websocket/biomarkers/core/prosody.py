@@ -7,3 +7,7 @@ from ..rf_models.model_loader import PROSODY_MODEL
 # Uses saved model on given features (score defaults to 1.0 on error)
 def generate_prosody_score(prosody_features, prosody_model=PROSODY_MODEL):
     return process_scores(prosody_features, prosody_model)[0]
+
+# Many windows stacked along the frame axis -> one score per window (a single predict_proba call)
+def generate_prosody_scores(prosody_features, prosody_model=PROSODY_MODEL):
+    return process_scores(prosody_features, prosody_model)
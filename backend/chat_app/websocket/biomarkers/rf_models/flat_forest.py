@@ -0,0 +1,131 @@
+"""
+Flat random forest predictor
+
+The prosody/pronunciation RandomForestClassifiers are exported ONCE (python manage.py export_rf_models) from the
+joblib pickles into contiguous node arrays for ALL trees:
+
+    feature.npy   => (N,) int32    split feature of each node
+    threshold.npy => (N,) float64  split threshold (X <= threshold goes left, same as sklearn)
+    children.npy  => (N, 2) int32  absolute index of the [right, left] child (leaves point to themselves)
+    value.npy     => (N, C) float64 class probabilities of each node, normalized exactly like DecisionTreeClassifier
+    roots.npy     => (T,) int32    root node of each tree
+    meta.json     => depth, n_features, classes & the size/sha256 of the source pickle
+
+Prediction walks every tree at once: `depth` rounds of gathers (children[node, X <= threshold]), no Python per
+node or per tree. X is cast to float32 like sklearn does and the trees are accumulated in order, so predict_proba
+matches sklearn's exactly.
+The arrays are loaded with mmap, so every worker process shares them. An export only counts while its pickle is
+unchanged (export_is_current), so replacing a .pkl can't leave the old forest in use.
+
+"""
+import os, json, glob, hashlib
+import numpy as np
+
+NODE_ARRAYS = ("feature", "threshold", "children", "value", "roots")
+META_FILE   = "meta.json"
+
+
+# ==================================================================== ===================================
+# Predictor
+# ==================================================================== ===================================
+class FlatForest:
+    def __init__(self, feature, threshold, children, value, roots, depth, n_features, classes):
+        # (np.asarray drops the np.memmap subclass, its per-operation overhead adds up over the depth loop)
+        self.feature    = np.asarray(feature)
+        self.threshold  = np.asarray(threshold)
+        self.children   = np.asarray(children)
+        self.value      = np.asarray(value)
+        self.roots      = np.asarray(roots)
+        self.depth      = int(depth)
+        self.n_features = int(n_features)
+        self.classes_   = np.asarray(classes)
+
+    @property
+    def n_estimators(self): return self.roots.shape[0]
+
+    def apply(self, X) -> np.ndarray:
+        """ (n_samples, n_trees) leaf index reached in every tree. """
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features: raise ValueError(f"X has shape {X.shape}, expected (n, {self.n_features})")
+
+        # Flat indexes: X value = X_flat[row offset + feature], next node = children_flat[2 * node + go_left]
+        X_flat   = X.ravel()
+        offsets  = (np.arange(X.shape[0]) * self.n_features)[:, None]
+        children = self.children.ravel()
+
+        node = np.repeat(self.roots[None, :], X.shape[0], axis=0)
+        for _ in range(self.depth):
+            go_left = X_flat.take(offsets + self.feature.take(node)) <= self.threshold.take(node)
+            node    = children.take(2 * node + go_left)
+        return node
+
+    def predict_proba(self, X) -> np.ndarray:
+        """ Same as RandomForestClassifier.predict_proba (trees summed in order, then divided by the count). """
+        leaf_values = self.value[self.apply(X)]                         # (n_samples, n_trees, n_classes)
+        return np.cumsum(leaf_values, axis=1)[:, -1] / self.n_estimators  # (cumsum -> sequential like sklearn)
+
+    def predict(self, X) -> np.ndarray:
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+
+# ==================================================================== ===================================
+# Export / Load
+# ==================================================================== ===================================
+def flatten_forest(model) -> FlatForest:
+    """ RandomForestClassifier (single output) -> FlatForest with all trees concatenated. """
+    if getattr(model, "n_outputs_", 1) != 1: raise ValueError("only single-output forests are supported")
+
+    parts, offset, roots, depth = [], 0, [], 0
+    for estimator in model.estimators_:
+        tree  = estimator.tree_
+        nodes = np.arange(tree.node_count)
+        leaf  = tree.children_left == -1
+
+        # Leaves loop back to themselves so every tree can take the same number of steps
+        children = np.stack([np.where(leaf, nodes, tree.children_right), np.where(leaf, nodes, tree.children_left)], axis=1) + offset
+
+        # Same normalization as DecisionTreeClassifier.predict_proba
+        value = tree.value[:, 0, :model.n_classes_].astype(np.float64, copy=True)
+        normalizer = value.sum(axis=1)[:, None]; normalizer[normalizer == 0.0] = 1.0
+        value /= normalizer
+
+        parts.append((np.where(leaf, 0, tree.feature), np.where(leaf, 0.0, tree.threshold), children, value))
+        roots.append(offset); offset += tree.node_count; depth = max(depth, tree.max_depth)
+
+    feature, threshold, children, value = (np.concatenate(column) for column in zip(*parts))
+    return FlatForest(feature.astype(np.int32), threshold.astype(np.float64), np.ascontiguousarray(children, dtype=np.int32),
+                      np.ascontiguousarray(value), np.asarray(roots, dtype=np.int32), depth, model.n_features_in_, model.classes_)
+
+def save_flat_forest(forest: FlatForest, out_dir, source=None):
+    """ source: source_fingerprint() of the pickle the forest came from (recorded in meta.json) """
+    os.makedirs(out_dir, exist_ok=True)
+    for name in NODE_ARRAYS: np.save(os.path.join(out_dir, f"{name}.npy"), getattr(forest, name))
+
+    meta = {"depth": forest.depth, "n_features": forest.n_features, "classes": forest.classes_.tolist(), "source": source}
+    with open(os.path.join(out_dir, META_FILE), "w") as f: json.dump(meta, f)
+
+def load_flat_forest(model_dir, mmap=True) -> FlatForest:
+    """ Map an exported forest (raises FileNotFoundError if it hasn't been exported). """
+    with open(os.path.join(model_dir, META_FILE)) as f: meta = json.load(f)
+    meta.pop("source", None)
+    arrays = {name: np.load(os.path.join(model_dir, f"{name}.npy"), mmap_mode="r" if mmap else None) for name in NODE_ARRAYS}
+    return FlatForest(**arrays, **meta)
+
+def source_fingerprint(model_path) -> dict:
+    """ Size & sha256 of a pickle (mtimes change on every checkout/copy, so they aren't used). """
+    with open(model_path, "rb") as f: digest = hashlib.file_digest(f, "sha256").hexdigest()
+    return {"size": os.path.getsize(model_path), "sha256": digest}
+
+def export_is_current(model_path) -> bool:
+    """ True if the flat export of model_path exists and was made from this exact pickle. """
+    try:
+        with open(os.path.join(flat_dir(model_path), META_FILE)) as f: source = json.load(f).get("source")
+    except FileNotFoundError: return False
+    return source == source_fingerprint(model_path)
+
+def flat_dir(model_path) -> str:
+    """ Where the flat export of a .pkl lives (rf_models/flat/<name>/). """
+    return os.path.join(os.path.dirname(model_path), "flat", os.path.splitext(os.path.basename(model_path))[0])
+
+def model_paths(rf_model_path) -> list[str]:
+    return sorted(glob.glob(os.path.join(rf_model_path, "*.pkl")))
@@ -1,11 +1,17 @@
 import logging
 logger = logging.getLogger(__name__)
 
+from .flat_forest import load_flat_forest, flat_dir, export_is_current
+
 # =======================================================================
 # Load Saved Models for Prosody & Pronunciation
 # =======================================================================
 # Loads a Single Model
 def load_model(model_path):
+    # Prefer the flat export (python manage.py export_rf_models): memory-mapped & scored without sklearn
+    if export_is_current(model_path): return load_flat_forest(flat_dir(model_path))
+    logger.warning(f"No flat export of {model_path} (or it was made from another version of the pickle), loading the pickle (run: python manage.py export_rf_models)")
+
     # Import joblib inside the function as it is only needed for this, no need to keep it loaded after
     import joblib
     return joblib.load(model_path)
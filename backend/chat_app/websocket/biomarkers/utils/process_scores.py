@@ -11,24 +11,50 @@ CHUNK_SIZE = int(BioConfig.WINDOW_SIZE / BioConfig.HOP_LENGTH)
 # -----------------------------------------------------------------------
 # Function Definitions
 # -----------------------------------------------------------------------
-# Seperate features in X-second non-overlapping chunks (X seconds defined in biomarker_config.py)
+# Seperate (frames, features) into X-second non-overlapping chunks, flattened to (n_chunks, chunk_size * features)
+# A contiguous float32 array comes back as a reshaped view (no copy); leftover frames are left out (see ChunkBuffer)
 def get_chunks(features, chunk_size=CHUNK_SIZE):
-    return [features.iloc[i:i+chunk_size].values for i in range(0, len(features), chunk_size) if len(features.iloc[i:i+chunk_size]) == chunk_size]
-
-# Reshape 3D data to 2D
-def reshape_data(X):
-    return X.reshape(X.shape[0], -1)
+    features = np.ascontiguousarray(features, dtype=np.float32)
+    n_chunks = len(features) // chunk_size
+    return features[:n_chunks * chunk_size].reshape(n_chunks, chunk_size * features.shape[1])
 
 # Takes a classifier model and returns probability values
 def get_probs(model, X):
     return model.predict_proba(X)[:, 1]
 
-# Get biomarker scores using saved model files 
+# Get biomarker scores using saved model files (one per chunk)
 def process_scores(features, model, chunk_size=CHUNK_SIZE):
-    # Seperate features in X-second non-overlapping chunks & reshape 3D data to 2D
-    chunks        = get_chunks(features, chunk_size)
-    feature_array = reshape_data(np.array(chunks))
+    feature_array = get_chunks(features, chunk_size)
+    if len(feature_array) == 0: raise ValueError(f"need at least {chunk_size} frames, got {len(features)}")
 
     # Use the given classifier model to get probability values
     scores = get_probs(model, feature_array)
     return scores
+
+
+# =======================================================================
+# Per-Session Carry-Over
+# =======================================================================
+class ChunkBuffer:
+    """
+    Frames that don't fill a whole chunk yet are kept for the next call instead of being thrown away.
+    push() takes the new frames of each model (same frame count, e.g. prosody & pronunciation) and returns
+    every complete chunk as a tuple of contiguous (chunk_size, features) arrays, one per model.
+    """
+    def __init__(self, chunk_size=CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.carry      = ()   # leftover frames per model (empty until the first push)
+
+    def __len__(self): return len(self.carry[0]) if self.carry else 0
+
+    def push(self, *features) -> list[tuple[np.ndarray, ...]]:
+        features = [np.asarray(f, dtype=np.float32) for f in features]
+        if self.carry: features = [np.concatenate([carry, f]) for carry, f in zip(self.carry, features)]
+        else:          features = [np.ascontiguousarray(f) for f in features]
+
+        # Whole chunks are slices of the (new) arrays, only the remainder is copied
+        n = len(features[0]) // self.chunk_size * self.chunk_size
+        self.carry = tuple(f[n:].copy() for f in features)
+        return [tuple(f[i:i + self.chunk_size] for f in features) for i in range(0, n, self.chunk_size)]
+
+    def clear(self): self.carry = ()
@@ -15,12 +15,19 @@ from math     import ceil
 
 # From this project
 from ..services              import logging_utils as lu 
+from ..services              import metrics, tracing
 from ..                      import config as cf
 from ..services.db_services  import ChatService
 from .services.bg_helpers    import fire_and_log
 from .services.chatHelpers   import handle_transcription, handle_stt_output
-from .services.audioHelpers  import extract_audio_biomarkers, extract_text_biomarkers
+from .services.audioHelpers  import extract_audio_biomarkers, extract_block_biomarkers, extract_text_biomarkers
+from .services.featureStream import FeatureStream
+from .services.promptBuilder import SessionPrompt
+from .services.speculativeReply import Speculator
 from .services.speechProvider import SpeechToTextProvider
+from .biomarkers.core.pragmatic import CoherenceAccumulator
+from .biomarkers.utils.process_scores import ChunkBuffer
+from .biomarkers              import biomarker_config as BioConfig
 
 SECOND = 32_000 # How big a chunk of audio of one second is, in bytes
 
@@ -39,7 +46,7 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
     * ToDo: send_json or do json.dumps inside send ?
 
     """
-    MAX_CONTEXT = 10  # (how many recent messages to keep for the LLM)
+    MAX_CONTEXT = 10  # (how many recent messages to keep for the biomarkers & to resume a chat with)
     SECONDS = 3 # How often we want to send audio to calculate biomarkers
 
     # =======================================================================
@@ -68,6 +75,7 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
         self.user   = self.scope["user"]
         self.source = self.scope.get("source", "unknown")
         await self.accept()
+        metrics.ACTIVE_SESSIONS.inc(); self._counted = True
         
         # I don't think any frontend uses these during the chat right now, but I'll leave this option in
         self.return_biomarkers = False # (self.source in ["webapp"])
@@ -84,7 +92,15 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
         
         # Adding one default message at the start of the chat every time (so I have a reference timestamp before every user message)
         self.context_buffer = [("assistant", "How can I help you today?", time())] + self.context_buffer
+
+        # The LLM prompt for this session (only grows between truncations, so the server can reuse its cache)
+        self.session_prompt = SessionPrompt(session_id=self.session.pk)
+        self.session_prompt.extend(self.context_buffer)
         
+        # Per-message altered grammar features & coherence, so each turn only processes the newest utterance
+        self.grammar_cache = {}
+        self.coherence     = CoherenceAccumulator()
+
         # Other misc. setup
         self.overlapped_speech_count  = 0.0
         self.audio_windows_count      = 0.0
@@ -93,8 +109,13 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
         # Create new speech provider instances
         loop_stt = asyncio.get_event_loop()
         # TODO: Define a function for ts_callback to perform when we receive word-level timestamps
-        self.stt_provider = SpeechToTextProvider(handle_stt_output, self._add_message_CB, self.send, self._utt_bio, None, loop_stt)
+        self.speculator   = Speculator(lambda: self.session_prompt) if cf.STT_SPECULATIVE else None # (LLM request on stable interim results)
+        self.stt_provider = SpeechToTextProvider(handle_stt_output, self._add_message_CB, self.send, self._utt_bio, None, loop_stt, speculator=self.speculator)
         self.audio_buffer = bytearray()
+        self.chunk_buffer = ChunkBuffer() # LLD frames that don't fill a whole window yet (non-streaming path)
+
+        # Streaming openSMILE extractor for this session (audio biomarker LLDs are computed as the audio arrives)
+        self.feature_stream = FeatureStream() if BioConfig.STREAMING_FEATURES else None
 
         # -----------------------------------------------------------------------
         # 3) Send misc information to the frontend (ToDo: biomarkers, etc)
@@ -113,6 +134,8 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
         # DO NOT close the session -- just clean local state.
         --- Originally had pausing in here, but im just changing it so disconnects end the chat. ---
         """
+        if getattr(self, "_counted", False): metrics.ACTIVE_SESSIONS.dec(); self._counted = False
+
         # 1) Close the ChatSession in the DB
         if self.session.is_active: await database_sync_to_async(ChatService.close_session)(self.user, self.session, source=self.source)
 
@@ -120,8 +143,18 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
         for task in getattr(self, "_bg_tasks", []): task.cancel()
         await asyncio.gather(*getattr(self, "_bg_tasks", []), return_exceptions=True)
 
+        # Drop a speculative LLM request that is still running
+        if getattr(self, "speculator", None) is not None: self.speculator.cancel()
+
+        # Stop this session's openSMILE instance
+        if getattr(self, "feature_stream", None) is not None: self.feature_stream.close(); self.feature_stream = None
+
         # Reset some properties for the next connection
         self.context_buffer           = []
+        self.session_prompt           = SessionPrompt()
+        self.grammar_cache            = {}
+        self.chunk_buffer             = ChunkBuffer()
+        self.coherence                = CoherenceAccumulator()
         self.overlapped_speech_count  = 0.0
         self.audio_windows_count      = 0.0
         self.overlapped_speech_events = []
@@ -135,7 +168,8 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
     async def receive_json(self, data, **kwargs):
         if   data["type"] == "overlapped_speech" : await self._handle_overlap(data=data)
         elif data["type"] == "audio_data"        : await self._handle_audio_data(data)
-        elif data["type"] == "transcription"     : await handle_transcription(data, msg_callback=self._add_message_CB, send_callback=self.send, bio_callback=self._utt_bio)
+        elif data["type"] == "transcription"     :
+            with tracing.turn(source="transcription"): await handle_transcription(data, msg_callback=self._add_message_CB, send_callback=self.send, bio_callback=self._utt_bio)
         elif data["type"] == "end_chat"          : 
             self.stt_provider.stop()
             await database_sync_to_async(ChatService.close_session)(self.user, self.session, source=self.source)
@@ -153,11 +187,15 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
     # Text Transcriptions
     # =======================================================================
     # TODO: Because altered_grammar specifically is so slow, they will actually go to the db out of order. Need to add a manual time setting argument.
+    @tracing.traced("utterance_biomarkers")
     async def _utt_bio(self):
-        """ On-Utterance Biomarkers (saves them to the DB as soon as we get them). """
-        utterance_biomarkers = await extract_text_biomarkers(self.context_buffer)
-        fire_and_log(database_sync_to_async(ChatService.add_biomarkers_bulk)(self.session, utterance_biomarkers))
-        if self.return_biomarkers: await self.send(json.dumps({"type": "biomarker_scores", "data": utterance_biomarkers}))
+        """ On-Utterance Biomarkers (each one is saved to the DB & sent as soon as it is done, a timed-out one is sent as None & not saved). """
+        async def _on_score(biomarker, score):
+            if score is not None:      fire_and_log(database_sync_to_async(ChatService.add_biomarker)(self.session, biomarker, score))
+            if self.return_biomarkers: await self.send(json.dumps({"type": "biomarker_scores", "data": {biomarker: score}}))
+
+        # Snapshot the context, the next turn may change it while these are still running (results are merged into the live one)
+        await extract_text_biomarkers(list(self.context_buffer), self.grammar_cache, self.coherence, on_score=_on_score, current=lambda: self.context_buffer)
     
     async def _add_message_CB(self, role, text, time):
         """
@@ -170,9 +208,10 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
         # Update in memory context
         self.context_buffer.append((role, text, time))
         if len(self.context_buffer) > self.MAX_CONTEXT: self.context_buffer.pop(0)
+        self.session_prompt.add(role, text)
 
-        # Return the updated context (if the message was from the user, this will be used for the LLM)
-        if role == "user": return self.context_buffer
+        # Return the updated prompt (if the message was from the user, this will be used for the LLM)
+        if role == "user": return self.session_prompt
         
     # =======================================================================
     # Audio Data
@@ -181,23 +220,33 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
         
          # Send audio to the speech to text provider
         self.stt_provider.send_audio(data)
-                            
-        # # Generate the audio-related biomarker scores
-        self.audio_buffer.extend(base64.b64decode(data['data']))
-        if len(self.audio_buffer) >= (self.SECONDS * SECOND):
-            audio_data = {"data": bytes(self.audio_buffer), "sampleRate": data['sampleRate']}
-            audio_biomarkers = await extract_audio_biomarkers(audio_data, self.overlapped_speech_count)
-            self.audio_buffer.clear()
+        audio_bytes = base64.b64decode(data['data'])
 
-            # Save biomarkers to the DB
-            fire_and_log(database_sync_to_async(ChatService.add_biomarkers_bulk)(self.session, audio_biomarkers))
-            if self.return_biomarkers: await self.send(json.dumps({"type": "audio_scores", "data": audio_biomarkers}))
+        # Streaming: the LLDs are extracted as the audio arrives, score every 5 second block that is ready
+        if self.feature_stream is not None:
+            self.feature_stream.write(audio_bytes, data['sampleRate'])
+            for prosody_features, pronunciation_features in self.feature_stream.ready_blocks():
+                await self._save_audio_biomarkers(await extract_block_biomarkers(prosody_features, pronunciation_features, self.overlapped_speech_count))
+
+        # # Generate the audio-related biomarker scores
+        else:
+            self.audio_buffer.extend(audio_bytes)
+            if len(self.audio_buffer) >= (self.SECONDS * SECOND):
+                audio_data = {"data": bytes(self.audio_buffer), "sampleRate": data['sampleRate']}
+                self.audio_buffer.clear()
+                for audio_biomarkers in await extract_audio_biomarkers(audio_data, self.overlapped_speech_count, self.chunk_buffer):
+                    await self._save_audio_biomarkers(audio_biomarkers)
 
         # Update turntaking (12 audio windows for 1 minute of data)
         self.audio_windows_count += 1
         self.overlapped_speech_count = self.overlapped_speech_count / (self.audio_windows_count / 12)
         
         
+    async def _save_audio_biomarkers(self, audio_biomarkers):
+        """ Save biomarkers to the DB (and send them to the frontend if requested). """
+        fire_and_log(database_sync_to_async(ChatService.add_biomarkers_bulk)(self.session, audio_biomarkers))
+        if self.return_biomarkers: await self.send(json.dumps({"type": "audio_scores", "data": audio_biomarkers}))
+        
     def _toggle_stream(self, data):
         cmd = data["data"]
         if cmd == "start":
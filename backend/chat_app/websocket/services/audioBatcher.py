@@ -0,0 +1,75 @@
+# ======================================================================= ===================================
+# Audio Batcher -- cross-session micro-batching for the prosody/pronunciation random forests
+# ======================================================================= ===================================
+"""
+Every session used to score its own 5 second windows, so N active sessions meant N predict_proba calls of a
+single row each. Tree ensembles score a batch for barely more than one row, so instead:
+
+    1) score() queues the window (prosody & pronunciation LLD frames) and waits on a future
+    2) The first window of a batch starts a timer; every window that arrives in the next AUDIO_BATCH_WINDOW
+       seconds (or until AUDIO_BATCH_SIZE windows are waiting) joins it
+    3) The batch is stacked along the frame axis and scored with one run_batch call (one predict_proba per
+       model, in the audio pool) and each session gets its own row back
+
+A single session only pays the few milliseconds of the window. Runs on the event loop, no locks needed.
+
+"""
+import asyncio, logging
+import numpy as np
+
+from ..biomarkers import biomarker_config as BioConfig
+
+logger = logging.getLogger(__name__)
+
+
+# ======================================================================= ===================================
+# Audio Batcher
+# ======================================================================= ===================================
+class AudioBatcher:
+    def __init__(self, run_batch, window=BioConfig.AUDIO_BATCH_WINDOW, max_batch=BioConfig.AUDIO_BATCH_SIZE):
+        """ run_batch: async (prosody_frames, pronunciation_frames, overlapped_speech_counts) -> list of score dicts """
+        self.run_batch = run_batch
+        self.window    = window
+        self.max_batch = max_batch
+
+        self._pending = []     # (prosody, pronunciation, overlapped_speech_count, future)
+        self._timer   = None
+        self._tasks   = set()  # batches being scored (kept referenced until they finish)
+
+    # --------------------------------------------------------------------
+    # Public API
+    # --------------------------------------------------------------------
+    async def score(self, prosody_features, pronunciation_features, overlapped_speech_count) -> dict:
+        """ Scores of one window, computed together with whatever other sessions sent meanwhile. """
+        loop   = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((prosody_features, pronunciation_features, overlapped_speech_count, future))
+
+        if   len(self._pending) >= self.max_batch: self._flush()
+        elif self._timer is None:                  self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    # --------------------------------------------------------------------
+    # Batches
+    # --------------------------------------------------------------------
+    def _flush(self):
+        if self._timer is not None: self._timer.cancel(); self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch: return
+
+        task = asyncio.get_running_loop().create_task(self._run(batch))
+        self._tasks.add(task); task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch):
+        prosody, pronunciation, counts, futures = zip(*batch)
+        try:
+            results = await self.run_batch(np.concatenate(prosody), np.concatenate(pronunciation), list(counts))
+        except Exception as e:
+            logger.error(f"Audio batch of {len(batch)} failed: {e}")
+            for future in futures:
+                if not future.done(): future.set_exception(e)
+            return
+
+        # (a session that disconnected meanwhile cancelled its future)
+        for future, result in zip(futures, results):
+            if not future.done(): future.set_result(result)
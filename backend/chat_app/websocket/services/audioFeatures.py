@@ -0,0 +1,53 @@
+# ======================================================================= ===================================
+# Audio Features -- raw audio -> the prosody/pronunciation LLDs (runs in the audio workers, see biomarkerJobs.py)
+# ======================================================================= ===================================
+"""
+The worker side of audioHelpers.py: only the openSMILE extractor & the audio front-end. It doesn't import the
+app config (LLM queue, HTTP clients), the worker pools or the batcher, so an audio worker process loads nothing
+but this and the random forests.
+
+"""
+import logging
+import numpy as np
+import opensmile
+
+from ..biomarkers.biomarker_config import SAMPLE_RATE, PROSODY_FEATURES, PRONUNCIATION_FEATURES
+from ..biomarkers.utils.lld_config import lld_config_path
+from .audioFrontend                import prepare_audio
+from ...services                   import logging_utils as lu
+
+logger = logging.getLogger(__name__)
+
+# =======================================================================
+# Constants
+# =======================================================================
+# Initialize opensmile feature extractor (only the ComParE_2016 LLDs used by the prosody/pronunciation models, ~1.4x faster)
+feature_extractor = opensmile.Smile(
+    feature_set     = lld_config_path(),
+    feature_level   = "lld",
+    sampling_rate   = SAMPLE_RATE,
+)
+PROSODY_IDX       = [feature_extractor.feature_names.index(name) for name in PROSODY_FEATURES      ]
+PRONUNCIATION_IDX = [feature_extractor.feature_names.index(name) for name in PRONUNCIATION_FEATURES]
+
+
+# =======================================================================
+# Handle Audio Data
+# =======================================================================
+def handle_audio_data(data):
+    try:
+        # Decode the received base64 data to bytes & get the sample rate
+        audio_bytes, sample_rate = data["data"], data["sampleRate"]
+        logger.info(f"{lu.CYAN}[Aud] Audio data received: {len(audio_bytes):,} bytes at {sample_rate:,}Hz {lu.RESET}")
+
+        # Normalize & resample to 16,000 Hz if necessary (float32 throughout, see audioFrontend.py)
+        audio_array = prepare_audio(audio_bytes, sample_rate)
+        features = feature_extractor(audio_array, SAMPLE_RATE)[0] # raw (features, frames) array, no DataFrame
+
+        # Get only the specified features for each biomarker -> contiguous (frames, features) float32
+        return np.ascontiguousarray(features[PROSODY_IDX].T), np.ascontiguousarray(features[PRONUNCIATION_IDX].T)
+
+    # On error, returns both as None
+    except Exception as e:
+        logger.error(f"Error processing audio data: {e}")
+        return None, None
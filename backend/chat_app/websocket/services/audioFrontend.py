@@ -0,0 +1,116 @@
+# ======================================================================= ===================================
+# Audio Front-End -- int16 PCM from the frontend -> float32 signal for openSMILE
+# ======================================================================= ===================================
+"""
+Replaces the librosa path in handle_audio_data:
+
+    - Peak normalization is done straight from the int16 samples into one float32 buffer (no float64 copy)
+    - Resampling uses scipy's polyphase resampler with the anti-aliasing filter for each rate designed once
+      and cached (48k/44.1k/24k -> 16k are built at import)
+    - The old librosa.util.buf_to_float call after normalizing divided the signal by 32768 a second time;
+      that's gone, so openSMILE now sees the normalized signal
+
+openSMILE multiplies the float signal by 32768 and casts to int16, so the peak is normalized to PEAK_LEVEL
+(just under 1.0) to keep the largest sample from wrapping around.
+
+"""
+from functools import lru_cache
+from math      import gcd
+
+import numpy as np
+from scipy.signal import firwin, resample_poly
+
+from ..biomarkers.biomarker_config import SAMPLE_RATE
+
+PEAK_LEVEL   = 32767 / 32768
+COMMON_RATES = (48_000, 44_100, 24_000)
+
+
+# =======================================================================
+# Polyphase filters (designed once per rate)
+# =======================================================================
+def _ratio(sample_rate, target_rate=SAMPLE_RATE) -> tuple[int, int]:
+    g = gcd(int(sample_rate), int(target_rate))
+    return int(target_rate) // g, int(sample_rate) // g
+
+@lru_cache(maxsize=16)
+def _polyphase_filter(up: int, down: int) -> np.ndarray:
+    """ Same low-pass FIR that resample_poly designs on every call (kaiser 5.0, 10 zero crossings per side). """
+    max_rate = max(up, down)
+    h = firwin(2 * 10 * max_rate + 1, 1.0 / max_rate, window=("kaiser", 5.0)).astype(np.float32)
+    h.flags.writeable = False
+    return h
+
+for _rate in COMMON_RATES: _polyphase_filter(*_ratio(_rate))
+
+
+# =======================================================================
+# Public helpers
+# =======================================================================
+def resample(audio: np.ndarray, sample_rate: int, target_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """ float32 in, float32 out (returned as is if the rates already match). """
+    if sample_rate == target_rate: return audio
+    up, down = _ratio(sample_rate, target_rate)
+    return resample_poly(audio, up, down, window=_polyphase_filter(up, down))
+
+# -----------------------------------------------------------------------
+# Streaming (chunk by chunk, same output as resampling the whole signal at once)
+# -----------------------------------------------------------------------
+class StreamResampler:
+    """
+    resample() on every ~100 ms chunk by itself would treat each chunk edge as silence (a filter transient every
+    chunk). This keeps the input the filter still needs between calls, so the concatenated output equals
+    resample_poly over the whole stream; the newest ~10 input samples are held back until the next chunk.
+    """
+    def __init__(self, sample_rate: int, target_rate: int = SAMPLE_RATE):
+        self.rate          = sample_rate
+        self.up, self.down = _ratio(sample_rate, target_rate)
+        h = _polyphase_filter(self.up, self.down) * np.float32(self.up)   # (resample_poly scales the filter by up)
+        self.half_len = (len(h) - 1) // 2
+
+        # Polyphase taps: output phase p uses h[p], h[p + up], ... against the newest input sample going back
+        self.taps   = -(-len(h) // self.up)
+        self._phase = np.zeros((self.up, self.taps), dtype=np.float32)
+        for p in range(self.up): self._phase[p, :len(h[p::self.up])] = h[p::self.up]
+
+        self._buffer = np.zeros(self.taps, dtype=np.float32)  # input kept for the filter (zeros before the stream starts)
+        self._offset = -self.taps                              # absolute input index of _buffer[0]
+        self._next   = 0                                       # next output sample to produce
+
+    def process(self, audio: np.ndarray) -> np.ndarray:
+        self._buffer = np.concatenate([self._buffer, np.asarray(audio, dtype=np.float32)])
+        n_in = self._offset + len(self._buffer)
+
+        # Output j sits at conv index j*down + half_len and needs input up to (j*down + half_len) // up
+        last = (n_in * self.up - 1 - self.half_len) // self.down
+        j    = np.arange(self._next, last + 1)
+        conv = j * self.down + self.half_len
+        newest = conv // self.up - self._offset
+        window = self._buffer[newest[:, None] - np.arange(self.taps)]
+        out    = np.einsum("ij,ij->i", self._phase[conv % self.up], window).astype(np.float32)
+
+        # Keep only what the next output still needs
+        self._next = last + 1
+        keep_from  = (self._next * self.down + self.half_len) // self.up - self.taps + 1 - self._offset
+        if keep_from > 0: self._buffer = self._buffer[keep_from:]; self._offset += keep_from
+        return out
+
+def pcm_to_float32(audio_bytes: bytes) -> np.ndarray:
+    """ int16 PCM -> peak normalized float32, in a single pass over the samples. """
+    pcm = np.frombuffer(audio_bytes, dtype=np.int16)
+    if pcm.size == 0: return np.zeros(0, dtype=np.float32)
+
+    peak = max(int(pcm.max()), -int(pcm.min()), 1) # (ints, so -32768 can't overflow)
+    out  = np.empty(pcm.shape, dtype=np.float32)
+    np.multiply(pcm, np.float32(PEAK_LEVEL / peak), out=out)
+    return out
+
+def prepare_audio(audio_bytes: bytes, sample_rate: int) -> np.ndarray:
+    """ int16 PCM at any rate -> peak normalized float32 at SAMPLE_RATE. """
+    if sample_rate == SAMPLE_RATE: return pcm_to_float32(audio_bytes)
+
+    # Resample the raw samples first and normalize the result (the filter can overshoot the input peak)
+    audio = resample(np.frombuffer(audio_bytes, dtype=np.int16).astype(np.float32), sample_rate)
+    peak  = float(np.max(np.abs(audio))) if audio.size else 0.0
+    if peak > 0: audio *= np.float32(PEAK_LEVEL / peak)
+    return audio
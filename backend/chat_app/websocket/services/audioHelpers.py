@@ -2,15 +2,15 @@
 # Audio Helper -- handles incoming audio data and the biomarkers generated from it
 # ======================================================================= ===================================
 # Might need to make sure this should or shouldn't be done threaded like this
-# "librosa is precise but slow; if latency matters and you’re always going integer-ratio 48 kHz to 16 kHz or similar, scipy.signal.resample_poly is ~3-5x faster."
+# (the openSMILE extraction itself is in audioFeatures.py, which the audio workers import instead of this)
 
 # Audio Data
 import numpy as np
-import base64, librosa, opensmile
 
-# Threading
-import asyncio
-from concurrent.futures import ThreadPoolExecutor
+# Threading / Processes
+import asyncio, multiprocessing
+from concurrent.futures         import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
 # Logging
 from time import time
@@ -18,91 +18,159 @@ import logging
 logger = logging.getLogger(__name__)
 
 # Project Code
-from ..biomarkers.biomarker_scores import generate_audio_biomarkers, generate_utterance_biomarkers
-from ..biomarkers.biomarker_config import SAMPLE_RATE, PROSODY_FEATURES, PRONUNCIATION_FEATURES
+from ..biomarkers                  import biomarker_config as BioConfig
+from .                             import biomarkerJobs as jobs
+from .audioBatcher                 import AudioBatcher
 from ... import config as cf
+from ...services.metrics import BIOMARKER, QUEUE_WAIT, POOL_BACKLOG
+from ...services         import tracing
 
 # =======================================================================
-# Constants
+# Worker pools -- audio & text each get their own (sizes/backend in biomarker_config.py)
 # =======================================================================
-# Initialize opensmile feature extractor
-feature_extractor = opensmile.Smile(
-    feature_set     = opensmile.FeatureSet.ComParE_2016,
-    feature_level   = opensmile.FeatureLevel.LowLevelDescriptors,
-    sampling_rate   = SAMPLE_RATE,
-)
+USE_PROCESSES = BioConfig.BIOMARKER_POOL == "process"
 
-# Re-use one pool for the whole process
-_POOL = ThreadPoolExecutor(max_workers=4)
+def _make_pool(kind):
+    workers, initializer = {"audio": (BioConfig.AUDIO_WORKERS, jobs.init_audio_worker),
+                            "text" : (BioConfig.TEXT_WORKERS,  jobs.init_text_worker )}[kind]
 
-# =======================================================================
-# Handle Audio Data
-# =======================================================================
-def handle_audio_data(data):
+    # forkserver: workers start from a clean process, not a fork of the running server & its threads
+    if USE_PROCESSES: return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("forkserver"), initializer=initializer)
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"bio-{kind}")
+
+_POOLS = {"audio": _make_pool("audio"), "text": _make_pool("text")}
+
+async def _run_in_pool(kind, fn, *args):
+    """ Run fn in the audio/text pool; a process pool that lost a worker is replaced and the job retried once. """
+    loop = asyncio.get_running_loop()
+    POOL_BACKLOG.inc(pool=kind); submitted = time()
     try:
-        # Decode the received base64 data to bytes & get the sample rate
-        audio_bytes, sample_rate = data["data"], data["sampleRate"]
-        logger.info(f"{cf.CYAN}[Aud] Audio data received: {len(audio_bytes):,} bytes at {sample_rate:,}Hz {cf.RESET}")
-        
-        # Normalize audio data
-        audio_array = np.frombuffer(audio_bytes, dtype=np.int16)
-        audio_array = audio_array / max(np.max(np.abs(audio_array)), 1e-9) # (divide by zero)
-
-        # Resample to 16,000 Hz if necessary
-        if sample_rate != SAMPLE_RATE:  # SAMPLE_RATE is 16_000
-            audio_array = librosa.resample(audio_array, orig_sr=sample_rate, target_sr=SAMPLE_RATE)
-            logger.info(f"Resampled audio to {SAMPLE_RATE}Hz")
-
-        # Convert to float32 & extract features
-        audio_array = librosa.util.buf_to_float(audio_array, n_bytes=2, dtype=np.float32)
-        features = feature_extractor.process_signal(audio_array, SAMPLE_RATE)
-
-        # Get only the specified features for each biomarker
-        return features[PROSODY_FEATURES], features[PRONUNCIATION_FEATURES]
-        
-    # On error, returns both as None
-    except Exception as e: 
-        logger.error(f"Error processing audio data: {e}")
-        return None, None
-    
+        try:
+            started, result = await loop.run_in_executor(_POOLS[kind], jobs.timed_call, fn, *args)
+        except BrokenProcessPool:
+            logger.error(f"{kind} biomarker pool broke, restarting it")
+            _POOLS[kind] = _make_pool(kind)
+            started, result = await loop.run_in_executor(_POOLS[kind], jobs.timed_call, fn, *args)
+    finally:
+        POOL_BACKLOG.dec(pool=kind)
+
+    QUEUE_WAIT.observe(max(started - submitted, 0.0), pool=kind)
+    return result
+
+async def _run_shared(kind, fn, arrays, *args):
+    """ Same as _run_in_pool, but the arrays go through shared memory (fn gets their spec). """
+    shm, spec = jobs.to_shared(*arrays)
+    try:     return await _run_in_pool(kind, fn, spec, *args)
+    finally: shm.close(); shm.unlink()
 
 # =======================================================================
 # Audio Data/Biomarkers Wrapper
 # =======================================================================
-async def extract_audio_biomarkers(data, overlapped_speech_count):
+async def extract_audio_biomarkers(data, overlapped_speech_count, chunk_buffer):
     """
-    Async wrapper that:
-      1. Runs the heavy feature extraction in a worker thread
-      2. Turns those features into biomarker scores
-
+    Async wrapper that runs the heavy feature extraction & the audio biomarker models in the audio pool.
     Nothing inside blocks the event-loop.
+
+    The LLD frames go through the session's ChunkBuffer, so this returns the scores of every complete window
+    (possibly none) and the frames left over wait for the next call.
     """
     t0 = time()
-    loop = asyncio.get_running_loop()
+    audio_bytes, sample_rate = data["data"], data["sampleRate"]
+
+    pcm = [np.frombuffer(audio_bytes, dtype=np.int16)]
+
+    # (with process pools a worker updates a copy of the ChunkBuffer, so the leftover frames are brought back)
+    # Batching: only extract the chunks here, the models run in a batch with the other sessions' windows
+    if BioConfig.AUDIO_BATCHING:
+        if USE_PROCESSES: chunks, new_buffer = await _run_shared ("audio", jobs.extract_job_shared, pcm, sample_rate, chunk_buffer)
+        else            : chunks, new_buffer = await _run_in_pool("audio", jobs.extract_job, audio_bytes, sample_rate, chunk_buffer)
+        if USE_PROCESSES: chunk_buffer.carry = new_buffer.carry
+        audio_biomarkers = list(await asyncio.gather(*(_BATCHER.score(prosody, pronunciation, overlapped_speech_count) for prosody, pronunciation in chunks)))
+    else:
+        if USE_PROCESSES: audio_biomarkers, new_buffer = await _run_shared ("audio", jobs.audio_job_shared, pcm, sample_rate, overlapped_speech_count, chunk_buffer)
+        else            : audio_biomarkers, new_buffer = await _run_in_pool("audio", jobs.audio_job, audio_bytes, sample_rate, overlapped_speech_count, chunk_buffer)
+        if USE_PROCESSES: chunk_buffer.carry = new_buffer.carry
+    logger.info(f"{cf.CYAN}[Bio] Audio biomarkers done:   {(time()-t0):5.4f}s ({len(audio_biomarkers)} windows) {cf.RESET}")
+    if audio_biomarkers: BIOMARKER.observe(time() - t0, biomarker="audio")
+
+    return audio_biomarkers
+
 
-    # 1) Run heavy function in thread pool
-    prosody_features, pronunciation_features = await loop.run_in_executor(_POOL, handle_audio_data, data)
-    t1 = time()
-    logger.info(f"{cf.CYAN}[Aud] Audio data processed:    {(t1-t0):5.4f}s {cf.RESET}")
+# -----------------------------------------------------------------------
+# Ready-made feature blocks (from a FeatureStream)
+# -----------------------------------------------------------------------
+async def extract_block_biomarkers(prosody_features, pronunciation_features, overlapped_speech_count):
+    """ The LLDs were already computed while the audio streamed in, so this only runs the models. """
+    t0 = time()
 
-    # 2) Generate the audio-related biomarker scores
-    audio_biomarkers = generate_audio_biomarkers(prosody_features, pronunciation_features, overlapped_speech_count)
-    logger.info(f"{cf.CYAN}[Bio] Audio biomarkers done:   {(time()-t1):5.4f}s {cf.RESET}")
+    if   BioConfig.AUDIO_BATCHING: audio_biomarkers = await _BATCHER.score(prosody_features, pronunciation_features, overlapped_speech_count)
+    elif USE_PROCESSES: audio_biomarkers = await _run_shared ("audio", jobs.block_job_shared, [prosody_features, pronunciation_features], overlapped_speech_count)
+    else            : audio_biomarkers = await _run_in_pool("audio", jobs.block_job, prosody_features, pronunciation_features, overlapped_speech_count)
+    logger.info(f"{cf.CYAN}[Bio] Audio biomarkers done:   {(time()-t0):5.4f}s {cf.RESET}")
+    BIOMARKER.observe(time() - t0, biomarker="audio")
 
     return audio_biomarkers
 
 
+# -----------------------------------------------------------------------
+# Cross-session batches (see audioBatcher.py)
+# -----------------------------------------------------------------------
+async def _score_batch(prosody_features, pronunciation_features, overlapped_speech_counts):
+    """ One batch of windows from every session -> one score dict per window, scored in the audio pool. """
+    if USE_PROCESSES: return await _run_shared ("audio", jobs.batch_job_shared, [prosody_features, pronunciation_features], overlapped_speech_counts)
+    return                   await _run_in_pool("audio", jobs.batch_job, prosody_features, pronunciation_features, overlapped_speech_counts)
+
+_BATCHER = AudioBatcher(_score_batch)
+
+
 # =======================================================================
 # On-Utterance Biomarkers
 # =======================================================================
 # I'm also just gonna put this here for now, obviously file structure should be changed
-async def extract_text_biomarkers(context_buffer):
+def _merge_grammar_cache(grammar_cache, new_cache, context_buffer):
+    """ Same rules as CoherenceAccumulator.merge: keep the messages in the current context, add the job's new ones. """
+    current = {message for message in context_buffer if message[0] == "user"}
+    for message in [m for m in new_cache if m in current and m not in grammar_cache]: grammar_cache[message] = new_cache[message]
+    for message in [m for m in grammar_cache if m not in current]: grammar_cache.pop(message)
+
+async def _text_biomarker(biomarker, context_buffer, grammar_cache, coherence, current):
+    """
+    One utterance biomarker in the text pool. The job only gets a copy of the session state it uses, and its
+    results are merged back by message once it finishes (against current(), the session's context by then):
+    overlapping jobs can finish in any order, and a job that timed out (still running in a worker thread or
+    process) never touches the session's state.
+    """
+    cache_copy     = dict(grammar_cache) if biomarker == "alteredgrammar" and grammar_cache is not None else None
+    coherence_copy = coherence.copy()    if biomarker == "pragmatic"      and coherence     is not None else None
+    score, new_cache, new_coherence = await _run_in_pool("text", jobs.text_job, biomarker, context_buffer, cache_copy, coherence_copy)
+
+    if cache_copy     is not None: _merge_grammar_cache(grammar_cache, new_cache, current())
+    if coherence_copy is not None: coherence.merge(new_coherence, current())
+    return score
+
+async def extract_text_biomarkers(context_buffer, grammar_cache=None, coherence=None, on_score=None, current=None):
+    """
+    Runs pragmatic, altered grammar & anomia as separate jobs, so a slow parse doesn't hold up the other scores.
+    on_score(biomarker, score) is awaited as each one finishes; one that runs past its UTTERANCE_TIMEOUTS entry
+    is None (a process worker still finishes the job, but the result is dropped).
+    current() returns the session's context buffer as it is now (default: context_buffer, the snapshot scored).
+    """
     t0 = time()
-    loop = asyncio.get_running_loop()
-    
-    # Run heavy function in thread pool
-    utterance_biomarkers = await loop.run_in_executor(_POOL, lambda: generate_utterance_biomarkers(context_buffer))
+    if current is None: current = lambda: context_buffer
+
+    async def _one(biomarker):
+        start = time()
+        try:
+            with tracing.span(f"biomarker.{biomarker}"): score = await asyncio.wait_for(_text_biomarker(biomarker, context_buffer, grammar_cache, coherence, current), timeout=BioConfig.UTTERANCE_TIMEOUTS[biomarker])
+        except asyncio.TimeoutError:
+            score = None; logger.warning(f"{cf.MAGENTA}[Bio] {biomarker} timed out after {BioConfig.UTTERANCE_TIMEOUTS[biomarker]}s {cf.RESET}")
+        BIOMARKER.observe(time() - start, biomarker=biomarker)
+        if on_score is not None: await on_score(biomarker, score)
+        return biomarker, score
+
+    # Run the three side by side
+    utterance_biomarkers = dict(await asyncio.gather(*(_one(biomarker) for biomarker in BioConfig.UTTERANCE_TIMEOUTS)))
     logger.info(f"{cf.MAGENTA}[Bio] Biomarkers done in:      {(time()-t0):5.4f}s {cf.RESET}")
 
     # Return the biomarkers
-    return utterance_biomarkers 
+    return utterance_biomarkers
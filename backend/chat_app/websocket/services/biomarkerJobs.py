@@ -0,0 +1,118 @@
+# ======================================================================= ===================================
+# Biomarker Jobs -- what runs inside the audio/text worker pools (see audioHelpers.py)
+# ======================================================================= ===================================
+"""
+With BIOMARKER_POOL = "process", audio and text biomarkers run in two separate process pools:
+
+    - Each worker loads ONLY its own models once (init_audio_worker / init_text_worker), so the random forests
+      and openSMILE never share a GIL with Stanza & coherence, and neither shares one with the event loop.
+      Nothing a worker imports pulls in the app config (LLM queue, HTTP clients), the pools or the batcher
+    - Audio (int16 PCM) and feature blocks are passed through shared memory; only a small (name, shapes, dtypes)
+      spec is pickled. The parent creates & unlinks the block, the worker just attaches to it
+    - Per-session state (grammar feature cache, coherence accumulator, the audio ChunkBuffer) is sent with the
+      job and the updated copy is sent back (text state is merged back by message, see audioHelpers._text_biomarker)
+
+The *_job functions take plain arrays, so the thread pool backend calls them directly.
+
+"""
+import logging
+from time            import time
+from contextlib      import contextmanager
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+# =======================================================================
+# Shared memory helpers
+# =======================================================================
+def _layout(nbytes):
+    """ Byte offset of each array in the block (8-byte aligned) and the total size. """
+    offsets, size = [], 0
+    for n in nbytes: offsets.append(size); size += -(-n // 8) * 8
+    return offsets, size
+
+def to_shared(*arrays: np.ndarray):
+    """ Copy the arrays into one new shared memory block -> (block, spec). The caller closes & unlinks the block. """
+    offsets, size = _layout([array.nbytes for array in arrays])
+    shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    for array, offset in zip(arrays, offsets): np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf, offset=offset)[...] = array
+    return shm, (shm.name, [(array.shape, array.dtype.str) for array in arrays])
+
+@contextmanager
+def attach(spec):
+    """ Contiguous views of the arrays in a block created by to_shared (only valid inside the with). """
+    name, layout = spec
+    shm = shared_memory.SharedMemory(name=name) # (workers share the parent's resource tracker, the parent unlinks it)
+    offsets, _ = _layout([int(np.prod(shape)) * np.dtype(dtype).itemsize for shape, dtype in layout])
+    views = [np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=offset) for (shape, dtype), offset in zip(layout, offsets)]
+    try:     yield views
+    finally: del views; shm.close()
+
+
+# =======================================================================
+# Worker initializers (load the models once per process)
+# =======================================================================
+def _worker_logging():
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+def init_audio_worker():
+    _worker_logging()
+    from ..biomarkers.rf_models import model_loader  # noqa: F401  (random forests)
+    from . import audioFeatures                       # noqa: F401  (openSMILE extractor)
+
+def init_text_worker():
+    _worker_logging()
+    from ..biomarkers.biomarker_scores                   import _text_biomarkers
+    from ..biomarkers.biomarker_models.grammar_model.predictor import GRAMMAR_MODEL
+    _text_biomarkers()   # Stanza pipeline, LSA store, ...
+    GRAMMAR_MODEL.get()
+
+
+# =======================================================================
+# Jobs
+# =======================================================================
+# Every job is submitted through this, so the parent can tell how long it waited for a worker
+def timed_call(fn, *args):
+    return time(), fn(*args)
+
+# 1) Raw audio -> openSMILE -> session ChunkBuffer -> every complete (prosody, pronunciation) chunk & the updated buffer
+def extract_job(audio_bytes, sample_rate, chunk_buffer):
+    from .audioFeatures import handle_audio_data
+    prosody_features, pronunciation_features = handle_audio_data({"data": audio_bytes, "sampleRate": sample_rate})
+    if prosody_features is None: return [], chunk_buffer
+    return chunk_buffer.push(prosody_features, pronunciation_features), chunk_buffer
+
+def extract_job_shared(spec, sample_rate, chunk_buffer):
+    with attach(spec) as (pcm,): return extract_job(pcm.data.cast("B"), sample_rate, chunk_buffer)
+
+#    ... and prosody/pronunciation/turntaking for each of those chunks (returns the list of scores & the buffer)
+def audio_job(audio_bytes, sample_rate, overlapped_speech_count, chunk_buffer):
+    from ..biomarkers.biomarker_scores import generate_audio_biomarkers
+    chunks, chunk_buffer = extract_job(audio_bytes, sample_rate, chunk_buffer)
+    return [generate_audio_biomarkers(prosody, pronunciation, overlapped_speech_count) for prosody, pronunciation in chunks], chunk_buffer
+
+def audio_job_shared(spec, sample_rate, overlapped_speech_count, chunk_buffer):
+    with attach(spec) as (pcm,): return audio_job(pcm.data.cast("B"), sample_rate, overlapped_speech_count, chunk_buffer)
+
+# 2) Ready LLD block (from a FeatureStream) -> scores; (frames, features) float32 arrays for each model
+def block_job(prosody_features, pronunciation_features, overlapped_speech_count):
+    from ..biomarkers.biomarker_scores import generate_audio_biomarkers
+    return generate_audio_biomarkers(prosody_features, pronunciation_features, overlapped_speech_count)
+
+def block_job_shared(spec, overlapped_speech_count):
+    # (the models read the shared views directly, so everything is scored before detaching)
+    with attach(spec) as (prosody, pronunciation): return block_job(prosody, pronunciation, overlapped_speech_count)
+
+#    ... or many blocks (from every session, see audioBatcher.py) stacked along the frame axis -> one score dict each
+def batch_job(prosody_features, pronunciation_features, overlapped_speech_counts):
+    from ..biomarkers.biomarker_scores import generate_audio_biomarkers_batch
+    return generate_audio_biomarkers_batch(prosody_features, pronunciation_features, overlapped_speech_counts)
+
+def batch_job_shared(spec, overlapped_speech_counts):
+    with attach(spec) as (prosody, pronunciation): return batch_job(prosody, pronunciation, overlapped_speech_counts)
+
+# 3) Context buffer -> one of pragmatic/altered grammar/anomia (+ the updated per-session state)
+def text_job(biomarker, context_buffer, grammar_cache, coherence):
+    from ..biomarkers.biomarker_scores import generate_utterance_biomarker
+    return generate_utterance_biomarker(biomarker, context_buffer, grammar_cache, coherence), grammar_cache, coherence
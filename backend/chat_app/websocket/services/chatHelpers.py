@@ -4,18 +4,22 @@
 ======================================================================= 
 """
 import json, logging, asyncio, base64
-from math import ceil
+from math       import ceil
+from contextlib import aclosing
 logger = logging.getLogger(__name__)
 
 from time        import time
 from datetime    import datetime, timezone
 from ...         import config        as cf
 from ...services import logging_utils as lu 
+from ...services import metrics, tracing
+from ...services.llm.llm_queue import LLMQueueFull
 from .speechProvider import TextToSpeechProvider
 from .bg_helpers import fire_and_log
 from .lipsyncHelpers import to_wav_file, run_rhubarb, load_rhubarb_json
 
 ERROR_UTTERANCE = "I'm sorry, I encountered an error while processing your request."
+LLM_STOP        = ["<|end|>", "\n"] # (the server leaves the stop string out of the reply)
 test = "\033[42m"
 
 CHUNK_SIZE = 8_192 # How many bytes of audio we can send at a time
@@ -23,8 +27,9 @@ CHUNK_SIZE = 8_192 # How many bytes of audio we can send at a time
 # ======================================================================= ===================================
 # Process the users message & reply with the LLM ASAP
 # ======================================================================= ===================================
-async def handle_transcription(data, msg_callback, send_callback, bio_callback):
-    """ Takes three callbacks from the consumers object """
+@tracing.traced("handle_transcription")
+async def handle_transcription(data, msg_callback, send_callback, bio_callback, speculator=None):
+    """ Takes three callbacks from the consumers object (& the session's Speculator if replies are speculative) """
     t0 = time()
     
     # -----------------------------------------------------------------------
@@ -33,19 +38,24 @@ async def handle_transcription(data, msg_callback, send_callback, bio_callback):
     text = data["data"].lower()
     logger.info(f"{lu.YELLOW}[LLM] User utt received: \n{lu.BG_GREEN}{text} {lu.RESET}")
 
-    # Fire-and-forget DB write for the "user" message & update in-memory context
-    context_buffer = await msg_callback(role="user", text=data['data'], time=time())
+    # Fire-and-forget DB write for the "user" message & update in-memory context (returns the session's prompt)
+    session_prompt = await msg_callback(role="user", text=data['data'], time=time())
+    speculation    = speculator.take(data['data'], session_prompt) if speculator is not None else None
 
     # -----------------------------------------------------------------------
     # 2) Get the LLMs response (awaited since it is the most important/longest process)
     # -----------------------------------------------------------------------
     t1 = time(); logger.info(f"{lu.YELLOW}[LLM] Sending LLM request... {lu.RESET}")
-    system_utt = await generate_LLM_response(context_buffer)
+    async def send_delta(text): await send_callback(json.dumps({'type': 'llm_delta', 'data': text}))
+    if speculation is not None: system_utt = await speculation.adopt(on_delta=send_delta if cf.LLM_STREAM else None)
+    else:                       system_utt = await generate_LLM_response(session_prompt, on_delta=send_delta if cf.LLM_STREAM else None)
     t2 = time(); logger.info(f"{lu.YELLOW}[LLM] LLM response received: (in {(t2-t1):.4f}) \n{lu.BG_MAGENTA}{system_utt} {lu.RESET}")
+    metrics.LLM_LATENCY.observe(t2 - t1)
 
     # Immediately send the response back through the websocket
     await send_callback(json.dumps({'type': 'llm_response', 'data': system_utt, 'time': datetime.now(timezone.utc).strftime("%H:%M:%S")}))
     t3 = time(); logger.info(f"{lu.YELLOW}[LLM] Response sent {(t3-t2):.4f}s ({(t3-t0):.4f}s total). {lu.RESET}")
+    metrics.STT_TO_LLM.observe(t3 - t0)
 
     # -----------------------------------------------------------------------
     # 3) Background persistence & biomarkers
@@ -57,17 +67,18 @@ async def handle_transcription(data, msg_callback, send_callback, bio_callback):
     asyncio.create_task(bio_callback())
     return system_utt
     
-async def handle_stt_output(data, msg_callback, send_callback, bio_callback):
+@tracing.traced("handle_stt_output")
+async def handle_stt_output(data, msg_callback, send_callback, bio_callback, speculator=None):
     user_utt = data['data']
     
     await send_callback(json.dumps({'type': 'user_utt', 'data': user_utt, 'time': datetime.now(timezone.utc).strftime("%H:%M:%S")}))
     logger.info(f"{lu.YELLOW}[LLM] Sent user utterance to frontend: {user_utt} {lu.RESET}")
     
-    system_utt = await handle_transcription(data, msg_callback, send_callback, bio_callback)
+    system_utt = await handle_transcription(data, msg_callback, send_callback, bio_callback, speculator)
     
     # Synthesize the speech 
     tts_provider = TextToSpeechProvider()
-    speech = tts_provider.synthesize_speech(system_utt, "wav")
+    with metrics.TTS_LATENCY.time(): speech = tts_provider.synthesize_speech(system_utt, "wav")
     
     # TODO: turn on when ready to test lipsync stuff
     # to_wav_file(speech, "output.wav")
@@ -77,6 +88,7 @@ async def handle_stt_output(data, msg_callback, send_callback, bio_callback):
     fire_and_log(handle_speech(speech, send_callback))
     logger.info(f"{lu.YELLOW}[LLM] Response sent to frontend. {lu.RESET}")
     
+@tracing.traced("handle_speech")
 async def handle_speech(audio_bytes: bytes, send_callback) -> None:
         # Splits audio data into smaller chunks so we can send it to the frontend
         n_chunks = ceil(len(audio_bytes) / CHUNK_SIZE)
@@ -89,40 +101,55 @@ async def handle_speech(audio_bytes: bytes, send_callback) -> None:
 # ======================================================================= ===================================
 # Generate LLM Response
 # ======================================================================= ===================================
-async def generate_LLM_response(context_buffer):
+@tracing.traced("llm")
+async def generate_LLM_response(session_prompt, on_delta=None):
     """
     Original stop characters included punctuation (but not all? '!')...
         stop=["<|end|>", ".", "?"]
 
+    session_prompt is the session's SessionPrompt (see promptBuilder.py), its slot id is sent along so the
+    server can reuse the KV cache of the previous turn.
+
+    With on_delta, the reply is streamed and on_delta(text) is awaited for every new piece as it arrives
+    (the full reply is still returned at the end).
+
     Wrap the response logic in a try-except block. If the model throws an error, return a default response.
     """
-    # 1) Prepare a prompt for the LLM
-    full_prompt = prepare_LLM_input(context_buffer)
+    # 1) Prepare a prompt for the LLM (fit into the token budget first)
+    await session_prompt.fit()
+    full_prompt = session_prompt.render()
+    slot_id     = session_prompt.slot_id
+    session     = session_prompt.session_id
+
+    # 2a) Stream the response, passing each piece on as it arrives
+    if on_delta is not None:
+        try:
+            t0, parts = time(), []
+            # (aclosing: an error or a cancel frees the HTTP response & the LLM queue slot right away, not on GC)
+            async with aclosing(cf.llm.stream(full_prompt, max_tokens=cf.MAX_LENGTH, stop=LLM_STOP, slot_id=slot_id, session=session)) as stream:
+                async for text in stream:
+                    if not parts: metrics.LLM_FIRST_TOKEN.observe(time() - t0)
+                    parts.append(text); await on_delta(text)
+            system_utt = "".join(parts).strip()
+
+        except LLMQueueFull as e:
+            logger.warning(f"LLM busy, not waiting: {e}"); system_utt = ERROR_UTTERANCE
+        except Exception as e:
+            logger.error(f"Error in get_LLM_response: {e}"); system_utt = ERROR_UTTERANCE
+
+        return system_utt or ERROR_UTTERANCE
 
-    # 2) Get a response from the LLM (hosted on a webserver)
+    # 2b) Get a response from the LLM (hosted on a webserver), only the generated text comes back
     try:
-        output = await cf.llm(full_prompt, max_tokens=cf.MAX_LENGTH, stop=["<|end|>", "\n"], echo=True) 
-        system_utt = (output["choices"][0]["text"].split("<|assistant|>")[-1]).strip()
+        output = await cf.llm.complete(full_prompt, max_tokens=cf.MAX_LENGTH, stop=LLM_STOP, slot_id=slot_id, session=session)
+        system_utt = output["text"].strip()
 
+        logger.info(f"{lu.YELLOW}[LLM] {output['finish_reason']}, usage {output['usage']}, timings {output['timings']} {lu.RESET}")
+        if output["finish_reason"] == "length": logger.warning(f"LLM reply was cut off at {cf.MAX_LENGTH} tokens")
+
+    except LLMQueueFull as e:
+        logger.warning(f"LLM busy, not waiting: {e}"); system_utt = ERROR_UTTERANCE
     except Exception as e: 
         logger.error(f"Error in get_LLM_response: {e}"); system_utt = ERROR_UTTERANCE
 
     return system_utt
-
-# -----------------------------------------------------------------------
-# Helpers for preparing the input message
-# -----------------------------------------------------------------------
-# Formats a turn from the chat history for LLM input
-def format_turn(turn): return f"\n<|{turn[0]}|>\n{turn[1]}<|end|>"
-
-# Use a set number of turns from the chat history to give context to the LLM
-def prepare_LLM_input(context_buffer):
-    """
-    1) Start the LLM input string with the specified prompt defined during configuration
-    2) Format the each turn in the history (context_buffer) for LLM input & add them to the LLM input string
-    3) Finally, complete the LLM input; add a tag for the LLM to respond & return the completed prompt
-    """
-    LLM_input  = f"<|system|>\n{cf.PROMPT}<|end|>"
-    LLM_input += "".join([format_turn(turn) for turn in context_buffer])
-    LLM_input += f"\n<|assistant|>\n"
-    return LLM_input
\ No newline at end of file
@@ -0,0 +1,156 @@
+# ======================================================================= ===================================
+# Feature Stream -- streaming openSMILE LLD extraction, one per session
+# ======================================================================= ===================================
+"""
+Instead of collecting a few seconds of audio and running Smile.process_signal on it from scratch (new openSMILE
+instance every time, LLD context lost at every chunk edge), each session keeps ONE openSMILE instance running:
+
+    1) write() queues the ~100 ms audio_data chunks as they arrive (never blocks the event loop)
+    2) A feeder thread pushes them into openSMILE's external audio source (a ring buffer, see
+       biomarkers/opensmile_configs/streaming_wave_input.conf.inc) and retries while it is full
+    3) openSMILE's run() loop computes LLD frames on its own thread as soon as there is enough audio
+    4) The sink callback collects frames; every WINDOW_SIZE seconds of frames (CHUNK_SIZE rows) becomes one
+       ready (prosody, pronunciation) block of float32 arrays, so scoring a window only has to run the models
+
+Audio is peak normalized with the running peak of the session (a chunk-by-chunk peak would change the gain
+every 100 ms) and written to openSMILE as int16. Other input rates go through one StreamResampler per session, so
+the filter runs across chunk edges like it does over a whole window in the batch path.
+
+The blocks equal process_signal on the same audio only while that gain doesn't change (see the parity test in
+chat_app/tests.py); until the peak is reached, energy & spectral LLDs differ (by ~2% of their range in a review).
+
+The engine is driven through opensmile internals (Smile._options, opensmile.core.lib.OpenSMILE), only checked
+with OPENSMILE_VERSION: any other version raises when a stream is opened instead of failing halfway through.
+
+"""
+import os, logging, threading
+from queue import Queue
+from time  import sleep
+
+import numpy as np
+import opensmile
+
+from ..biomarkers.biomarker_config    import SAMPLE_RATE, PROSODY_FEATURES, PRONUNCIATION_FEATURES
+from ..biomarkers.utils.process_scores import CHUNK_SIZE
+from ..biomarkers.utils.lld_config     import lld_config_path
+from .audioFrontend                    import StreamResampler
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------------------------------------
+# openSMILE setup (shared by every stream)
+# --------------------------------------------------------------------
+SOURCE_COMPONENT = opensmile.config.EXTERNAL_SOURCE_COMPONENT
+SINK_COMPONENT   = opensmile.config.EXTERNAL_OUTPUT_COMPONENT
+SOURCE_CONFIG    = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "biomarkers", "opensmile_configs", "streaming_wave_input.conf.inc")
+WAVE_BUFFER      = 10 * SAMPLE_RATE  # samples in openSMILE's input ring buffer
+OPENSMILE_VERSION = "2.6.0"          # the version the private API below was checked against (requirements-web.txt)
+
+# Only the LLDs the biomarker models use (see biomarkers/utils/lld_config.py)
+_SMILE = opensmile.Smile(
+    feature_set   = lld_config_path(),
+    feature_level = "lld",
+    sampling_rate = SAMPLE_RATE,
+)
+_PROSODY_IDX       = [_SMILE.feature_names.index(name) for name in PROSODY_FEATURES      ]
+_PRONUNCIATION_IDX = [_SMILE.feature_names.index(name) for name in PRONUNCIATION_FEATURES]
+
+
+# --------------------------------------------------------------------
+# opensmile internals (everything private is used through here)
+# --------------------------------------------------------------------
+def _open_engine(smile, **options):
+    """ A raw openSMILE engine with smile's config & options (plus the given ones), not started yet. """
+    if opensmile.__version__ != OPENSMILE_VERSION:
+        raise RuntimeError(f"FeatureStream uses opensmile internals checked with {OPENSMILE_VERSION}, found {opensmile.__version__} "
+                           f"(check Smile._options & opensmile.core.lib.OpenSMILE, or set STREAMING_FEATURES = False)")
+    try:
+        from opensmile.core.lib import OpenSMILE
+        engine_options = smile._options(); engine_options.update(options)
+    except (ImportError, AttributeError) as e: raise RuntimeError(f"opensmile internals used by FeatureStream changed: {e}") from e
+
+    engine = OpenSMILE()
+    engine.initialize(config_file=smile.config_path, options=engine_options, loglevel=smile.loglevel)
+    return engine
+
+
+# ======================================================================= ===================================
+# Feature Stream
+# ======================================================================= ===================================
+class FeatureStream:
+    def __init__(self, smile=_SMILE, block_frames=CHUNK_SIZE, peak=1.0):
+        """ peak: starting value of the running peak (32767 passes int16 input through at its own gain) """
+        self.block_frames = block_frames
+
+        self._frames = []              # LLD rows not yet in a block (appended on openSMILE's thread)
+        self._blocks = []              # ready (prosody, pronunciation) blocks
+        self._lock   = threading.Lock()
+        self._audio  = Queue()         # int16 bytes waiting for the feeder thread
+        self._peak   = float(peak)
+        self._resampler = None         # (input rate != SAMPLE_RATE)
+        self._closed = False
+
+        # One openSMILE instance for the whole session
+        self._engine = _open_engine(smile, source=SOURCE_CONFIG, sampleRate=SAMPLE_RATE, nBits=16, waveBufferSize=WAVE_BUFFER)
+        self._engine.external_sink_set_callback_ex(SINK_COMPONENT, self._on_frame)
+
+        self._runner = threading.Thread(target=self._run,  name="smile-run",  daemon=True)
+        self._feeder = threading.Thread(target=self._feed, name="smile-feed", daemon=True)
+        self._runner.start(); self._feeder.start()
+
+    # --------------------------------------------------------------------
+    # Public API
+    # --------------------------------------------------------------------
+    def write(self, audio_bytes: bytes, sample_rate: int = SAMPLE_RATE):
+        """ Queue one chunk of 16-bit mono PCM (resampled to SAMPLE_RATE if needed). """
+        if self._closed or not audio_bytes: return
+        audio = np.frombuffer(audio_bytes, dtype=np.int16).astype(np.float32)
+        if sample_rate != SAMPLE_RATE:
+            if self._resampler is None or self._resampler.rate != sample_rate: self._resampler = StreamResampler(sample_rate)
+            audio = self._resampler.process(audio)
+
+        # Running peak normalization to the full int16 range
+        self._peak = max(self._peak, float(np.max(np.abs(audio))) if audio.size else 0.0)
+        self._audio.put(np.clip(audio * (32767.0 / self._peak), -32768, 32767).astype(np.int16).tobytes())
+
+    def ready_blocks(self) -> list[tuple[np.ndarray, np.ndarray]]:
+        """ Every complete (prosody_features, pronunciation_features) block since the last call, (frames, features) each. """
+        with self._lock: blocks, self._blocks = self._blocks, []
+        return blocks
+
+    def close(self):
+        """ Stop openSMILE (frames that never made a full block are dropped). """
+        if self._closed: return
+        self._closed = True
+        self._audio.put(None)
+        self._feeder.join(timeout=5); self._runner.join(timeout=5)
+        self._engine.free()
+
+    # --------------------------------------------------------------------
+    # Threads
+    # --------------------------------------------------------------------
+    def _run(self):
+        try:              self._engine.run()
+        except Exception as e: logger.error(f"openSMILE stream stopped: {e}")
+
+    def _feed(self):
+        while True:
+            chunk = self._audio.get()
+            if chunk is None: break
+
+            # The ring buffer is full until openSMILE catches up -- wait for it
+            while not self._engine.external_audio_source_write_data(SOURCE_COMPONENT, chunk):
+                if not self._runner.is_alive(): return
+                sleep(0.005)
+
+        try:              self._engine.external_audio_source_set_eoi(SOURCE_COMPONENT)
+        except Exception: pass
+
+    def _on_frame(self, data, meta):
+        """ Sink callback (openSMILE's thread): one LLD row per 10 ms frame. """
+        with self._lock:
+            self._frames.append(np.array(data, dtype=np.float32))
+            if len(self._frames) < self.block_frames: return
+
+            block, self._frames = np.vstack(self._frames[:self.block_frames]), self._frames[self.block_frames:]
+            self._blocks.append((np.ascontiguousarray(block[:, _PROSODY_IDX]), np.ascontiguousarray(block[:, _PRONUNCIATION_IDX])))
@@ -0,0 +1,118 @@
+# ======================================================================= ===================================
+# Prompt Builder -- one append-only Phi-3 prompt per session, fit into a token budget
+# ======================================================================= ===================================
+"""
+The prompt used to be rebuilt from the last MAX_CONTEXT messages, so once the context buffer was full the oldest
+message was dropped every turn and the prompt changed right after the system prompt. The LLM server can only
+reuse the KV state of a prefix it has already evaluated, so every turn re-evaluated the whole conversation. A
+message count also says nothing about size: one long monologue could overflow n_ctx, short turns wasted it.
+
+SessionPrompt keeps the system prompt plus every turn since the last truncation:
+
+    1) add() appends the turn; the previous prompt stays an exact prefix of the next one, so the server only
+       evaluates the newest turns
+    2) fit() (before each request) counts the tokens of turns it hasn't seen yet -- once per turn, with the
+       server's tokenizer or an estimate if that fails or the server is busy -- and if the prompt is over PROMPT_TOKEN_BUDGET
+       (n_ctx minus MAX_LENGTH for the reply) drops the oldest turns in one block, down to PROMPT_KEEP_RATIO
+       of the budget. The cache is lost once in a while instead of every turn
+    3) slot_id pins the session to one llama.cpp server slot (each slot keeps its own cache)
+
+"""
+import asyncio, logging
+from math import ceil
+logger = logging.getLogger(__name__)
+
+from ... import config as cf
+
+ASSISTANT_TAG   = "\n<|assistant|>\n"
+MIN_TAIL_TOKENS = 64   # the newest turn keeps at least this much, even if the system prompt alone is over budget
+
+
+# Formats a turn from the chat history for LLM input
+def format_turn(role, text): return f"\n<|{role}|>\n{text}<|end|>"
+
+# Token estimate, used when the server can't count them
+def estimate_tokens(text): return ceil(len(text) / cf.CHARS_PER_TOKEN)
+
+async def count_tokens(text, session=None):
+    """
+    Tokens in text by the LLM's own tokenizer (counts a BOS token too, so it is never low), else the estimate --
+    also when the session's replica is busy generating (the LLM queue returns None rather than wait behind the reply)
+    """
+    try:                   count = await cf.llm.count_tokens(text, session=session)
+    except Exception as e: logger.warning(f"Token count failed ({e}), estimating"); count = None
+    return estimate_tokens(text) if count is None else count
+
+
+# ======================================================================= ===================================
+# Session Prompt
+# ======================================================================= ===================================
+class SessionPrompt:
+    def __init__(self, session_id=None, system_prompt=cf.PROMPT, budget=cf.PROMPT_TOKEN_BUDGET, keep_ratio=cf.PROMPT_KEEP_RATIO):
+        self.session_id = session_id
+        self.system     = f"<|system|>\n{system_prompt}<|end|>"
+        self.budget     = budget
+        self.keep_ratio = keep_ratio
+        self.turns      = []    # [role, text, tokens (None until counted)], oldest first
+        self._overhead  = None  # tokens of the system prompt & assistant tag
+
+    def __len__(self): return len(self.turns)
+
+    @property
+    def tokens(self) -> int:
+        """ Prompt size as of the last fit() """
+        return (self._overhead or 0) + sum(turn[2] or 0 for turn in self.turns)
+
+    @property
+    def slot_id(self):
+        """ The llama.cpp server slot for this session (None when the server doesn't have slots, see LLM_SLOTS). """
+        if not cf.LLM_SLOTS or self.session_id is None: return None
+        return hash(self.session_id) % cf.LLM_SLOTS
+
+    def add(self, role, text): self.turns.append([role, text, None])
+
+    def preview(self, role, text):
+        """ A copy with one more turn (this prompt is left as is), e.g. to start a reply before the turn is final """
+        copy = SessionPrompt(self.session_id, budget=self.budget, keep_ratio=self.keep_ratio)
+        copy.system, copy._overhead, copy.turns = self.system, self._overhead, list(self.turns)
+        copy.add(role, text)
+        return copy
+
+    def extend(self, turns):
+        """ (role, text, ...) tuples, e.g. the context buffer the session was resumed with """
+        for turn in turns: self.add(turn[0], turn[1])
+
+    # --------------------------------------------------------------------
+    # Token Budget
+    # --------------------------------------------------------------------
+    async def fit(self):
+        """ Count the new turns & drop the oldest ones if the prompt is over budget (call before render). """
+        if self._overhead is None: self._overhead = await count_tokens(self.system + ASSISTANT_TAG, self.session_id)
+
+        new    = [turn for turn in self.turns if turn[2] is None]
+        counts = await asyncio.gather(*(count_tokens(format_turn(role, text), self.session_id) for role, text, _ in new))
+        for turn, n in zip(new, counts): turn[2] = n
+
+        if self.tokens <= self.budget: return
+
+        # Over budget: drop a block of the oldest turns (never the newest one)
+        target, before = int(self.budget * self.keep_ratio), len(self.turns)
+        while len(self.turns) > 1 and self.tokens > target: self.turns.pop(0)
+        logger.info(f"Session prompt over {self.budget} tokens, dropped the oldest {before - len(self.turns)} turns ({self.tokens} left)")
+
+        # A single turn that doesn't fit on its own keeps its end (the most recent speech)
+        available = self.budget - self._overhead
+        if available <= 0:
+            logger.error(f"System prompt is {self._overhead} tokens, no room left in the {self.budget} token budget; keeping the last {MIN_TAIL_TOKENS} tokens of the newest turn")
+            available = MIN_TAIL_TOKENS
+        if self.turns and self.turns[0][2] > available:
+            role, text, tokens = self.turns[0]
+            keep = int(len(text) * available / tokens * 0.9)   # (a little under, the ratio is only approximate)
+            self.turns[0] = [role, text[len(text) - keep:], available]
+            logger.warning(f"One {role} turn was {tokens} tokens, kept its last {keep} characters")
+
+    def render(self) -> str:
+        """ The full LLM input, ending with the tag for the assistant to respond """
+        return self.system + "".join(format_turn(role, text) for role, text, _ in self.turns) + ASSISTANT_TAG
+
+    def clear(self): self.turns = []
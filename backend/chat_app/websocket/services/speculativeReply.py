@@ -0,0 +1,98 @@
+# ======================================================================= ===================================
+# Speculative Reply -- start the LLM request on a stable interim transcript
+# ======================================================================= ===================================
+"""
+With STT_SPECULATIVE on, Google STT also sends interim results. Once the whole interim transcript is stable
+(STT_SPECULATIVE_STABILITY), the speech provider hands it to the session's Speculator, which starts
+generate_LLM_response on a preview of the session prompt with that text as the user turn, while the user is still
+finishing (and STT is still waiting out the end-of-speech silence).
+
+    - A newer stable interim that says something else cancels the running request & starts another one
+    - The final transcript take()s the speculation: if it says the same thing (ignoring case & punctuation) the
+      reply is kept -- already finished, or still streaming -- and otherwise (or if the history changed meanwhile,
+      e.g. the previous reply was added after the speculation started) it is cancelled & the request reissued
+    - The reply is only buffered until then; adopt() passes on what was generated so far & then every new piece
+    - No turn is started for the interim text: the request's spans are held (under an llm.speculative span) and
+      adopt() files them under the final transcript's turn
+
+Everything runs on the event loop (the STT thread schedules start() with call_soon_threadsafe).
+
+"""
+import asyncio, logging, re
+logger = logging.getLogger(__name__)
+
+from ...services import metrics, tracing
+from ...services import logging_utils as lu
+from .chatHelpers import generate_LLM_response
+
+# (same words, ignoring case & punctuation)
+def same_words(a, b): return re.sub(r"[^\w\s]", "", a.lower()).split() == re.sub(r"[^\w\s]", "", b.lower()).split()
+
+
+# ======================================================================= ===================================
+# One speculative request
+# ======================================================================= ===================================
+class Speculation:
+    def __init__(self, text, session_prompt):
+        self.text    = text
+        self.history = list(session_prompt.turns)  # the turns before this one (the reply is only good for the same history)
+        self.parts   = []     # reply pieces generated so far
+        self.sink    = None   # where new pieces go once the speculation is adopted
+        self.spans   = tracing.SpanBuffer()  # (filed under the final transcript's turn if adopted, dropped otherwise)
+        self.task    = asyncio.get_running_loop().create_task(self._run(session_prompt.preview("user", text)))
+
+    async def _run(self, session_prompt):
+        with tracing.capture(self.spans), tracing.span("llm.speculative", chars=len(self.text)):
+            return await generate_LLM_response(session_prompt, on_delta=self._on_delta)
+
+    async def _on_delta(self, text):
+        self.parts.append(text)
+        if self.sink is not None: await self.sink(text)
+
+    async def adopt(self, on_delta=None) -> str:
+        """ The reply (waits for it if it is still being generated); with on_delta, every piece is passed on, in order """
+        self.spans.release(tracing.TURN_ID.get())
+        if on_delta is not None:
+            sent = 0
+            while sent < len(self.parts): await on_delta(self.parts[sent]); sent += 1
+            self.sink = on_delta
+        return await self.task
+
+    def cancel(self): self.task.cancel()
+
+
+# ======================================================================= ===================================
+# Per-session Speculator
+# ======================================================================= ===================================
+class Speculator:
+    def __init__(self, get_prompt):
+        """ get_prompt: returns the session's SessionPrompt as it is now (before the user turn is added) """
+        self.get_prompt = get_prompt
+        self.current    = None
+
+    def start(self, text):
+        """ Speculate on a stable interim transcript (nothing to do if the current speculation says the same) """
+        if self.current is not None:
+            if same_words(self.current.text, text): return
+            self.current.cancel(); metrics.LLM_SPECULATION.inc(outcome="restarted")
+
+        logger.info(f"{lu.YELLOW}[LLM] Speculative request on interim transcript: {text} {lu.RESET}")
+        self.current = Speculation(text, self.get_prompt())
+
+    def take(self, text, session_prompt):
+        """
+        The speculation for the final transcript, or None (after cancelling it) if the final one differs -- or if the
+        history changed meanwhile (session_prompt already has the final user turn)
+        """
+        speculation, self.current = self.current, None
+        if speculation is None: return None
+
+        if same_words(speculation.text, text) and speculation.history == session_prompt.turns[:-1]:
+            metrics.LLM_SPECULATION.inc(outcome="hit"); return speculation
+
+        speculation.cancel(); metrics.LLM_SPECULATION.inc(outcome="miss")
+        logger.info(f"{lu.YELLOW}[LLM] Final transcript (or history) differs from the speculation, reissuing {lu.RESET}")
+        return None
+
+    def cancel(self):
+        if self.current is not None: self.current.cancel(); self.current = None
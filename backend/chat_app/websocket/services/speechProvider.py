@@ -8,6 +8,7 @@ import threading, asyncio, base64, logging
 from queue import Queue
 
 from ... import config as cf
+from ...services import tracing
 
 
 logger = logging.getLogger(__name__)
@@ -18,7 +19,7 @@ CHUNK_SIZE = 2_048  # 64ms of 16-bit PCM audio = 2048 bytes
 
 class SpeechToTextProvider:
     '''Speech-to-Text provider that uses Google Cloud's Speech-to-Text API'''
-    def __init__(self, transcript_callback=None, msg_callback=None, send_callback=None, bio_callback=None, on_timestamps_callback=None, loop=None):
+    def __init__(self, transcript_callback=None, msg_callback=None, send_callback=None, bio_callback=None, on_timestamps_callback=None, loop=None, speculator=None):
         self._client = speech.SpeechClient()
         self._streaming_config = None
         self._audio_buffer = Queue()
@@ -30,6 +31,7 @@ class SpeechToTextProvider:
         self.ts_callback = on_timestamps_callback # The function to call when word-level timestamps are received
         self._loop = loop or asyncio.get_event_loop()
         self._recent_transcript = None
+        self._speculator = speculator # Starts the LLM request on stable interim results (None: wait for the final transcript)
 
     def _audio_generator(self):
         '''Generates audio requests from the audio buffer.'''
@@ -55,7 +57,7 @@ class SpeechToTextProvider:
         )
         self._streaming_config = speech.StreamingRecognitionConfig(
             config=config,
-            interim_results=False,
+            interim_results=self._speculator is not None,
         )
 
         threading.Thread(target=self._start_streaming_thread, daemon=True).start()
@@ -87,6 +89,7 @@ class SpeechToTextProvider:
         '''Listens to the responses from the Google Cloud STT API. If the received response is final, it calls the
         transcription callback defined in the constructor, as well as the word timestamps callback from the constructor.'''
         for response in responses:
+            self._speculate(response.results)
             for result in response.results:
                 if result.is_final:
                     transcript = result.alternatives[0].transcript
@@ -94,16 +97,21 @@ class SpeechToTextProvider:
                         continue
                     self._recent_transcript = transcript
                     logger.info(f"{cf.RED}[Transcription] Received final transcription: {transcript}")
+
+                    # A final transcript starts a new turn (the callback scheduled in the block inherits the turn id,
+                    # this thread doesn't keep it)
                     word_timestamps = self._get_word_timestamps(datetime.now(), result.alternatives[0].words)
                     if self._transcript_callback:
                         data = {"type": "user_utt", "data": transcript}
-                        if asyncio.iscoroutinefunction(self._transcript_callback):
-                            asyncio.run_coroutine_threadsafe(
-                                self._transcript_callback(data, self._msg_callback, self._send_callback, self._bio_callback),
-                                self._loop
-                            )
-                        else:
-                            self._transcript_callback(data)
+                        with tracing.turn(source="stt", chars=len(transcript)):
+                            if asyncio.iscoroutinefunction(self._transcript_callback):
+                                speculator = {"speculator": self._speculator} if self._speculator else {}
+                                asyncio.run_coroutine_threadsafe(
+                                    self._transcript_callback(data, self._msg_callback, self._send_callback, self._bio_callback, **speculator),
+                                    self._loop
+                                )
+                            else:
+                                self._transcript_callback(data)
                     if self.ts_callback:
                         if asyncio.iscoroutinefunction(self.ts_callback):
                             asyncio.run_coroutine_threadsafe(
@@ -113,6 +121,15 @@ class SpeechToTextProvider:
                         else:
                             self.ts_callback(word_timestamps)
                             
+    def _speculate(self, results):
+        '''With interim results on, hands the interim transcript to the speculator once every part of it is stable
+        (the final transcript then decides whether that reply is kept, see speculativeReply.py).'''
+        if self._speculator is None or not results or any(result.is_final for result in results): return
+        if min(result.stability for result in results) < cf.STT_SPECULATIVE_STABILITY: return
+
+        transcript = "".join(result.alternatives[0].transcript for result in results).strip()
+        if transcript: self._loop.call_soon_threadsafe(self._speculator.start, transcript)
+
     def _get_word_timestamps(self, now, words):
         ''' Gets word-level timestamps of an array of WordInfo objects. Will return an array of dictionaries
         with the word, word start timestamp, and word end timestamp (as a datetime.datetime object).'''
@@ -163,6 +180,7 @@ class TextToSpeechProvider:
     #         logger.error(f"{cf.RED}[TTS] Error synthesizing speech: {e}")
     
     # May not need if we decide to use the Google Cloud TTS instead
+    @tracing.traced("tts")
     def synthesize_speech(self, text: str, encoding: str) -> bytes:
         '''Synthesizes speech using Google's Gemini TTS API. Returns the audio content as bytes.'''
         try:
@@ -12,6 +12,7 @@ interface WSMessage { type: string; data: unknown; }
 export default function useChatSocket({ 
     recording, 
     onLLMResponse = (unknown)   => {}, 
+    onLLMDelta    = (unknown)   => {},
     onScores      = (WSMessage) => {},
     onUserUtt     = (text) => {},
     onAudio       = (data) => {},
@@ -37,6 +38,8 @@ export default function useChatSocket({
         const { type, data } = JSON.parse(event.data) as WSMessage;
         if (type === "llm_response") {
             onLLMResponse(data);
+        } else if (type === "llm_delta") {
+            onLLMDelta(data);
         } else if (type === "biomarker_scores") {
             console.log("On-Utterance scores received");
             onScores({ type, data });
@@ -54,7 +57,7 @@ export default function useChatSocket({
         } else if (type === "lipsync_data") {
             console.log("Received lipsync data")
         }
-    }, [onLLMResponse, onScores]);
+    }, [onLLMResponse, onLLMDelta, onScores]);
 
     // Open and close the websocket connection on change of the "recording" flag
     const wsRef = useRef<WebSocket | null>(null); 
@@ -11,6 +11,7 @@ export interface LocalChatMessage {
     ts     : string;
     role   : "user" | "assistant";
     content: string;
+    partial?: boolean;               // still being streamed (llm_delta), replaced by the final reply
 }
 
 // --------------------------------------------------------------------
@@ -20,10 +21,21 @@ export function useLocalChatSession () {
     // State variable
     const [session, setSession] = useState<LocalChatSession>({id: crypto.randomUUID(), messages: [], started: new Date().toISOString() });
 
-    // Update the state using this
+    // Update the state using this (a finished message replaces the partial one of the same role, if any)
     const pushMessage = (role: "user" | "assistant", content: string) =>
-        setSession((s) => ({...s, messages: [...s.messages, { id: crypto.randomUUID(), ts: new Date().toISOString(), role, content }],
-    }));
+        setSession((s) => {
+            const i = s.messages.findIndex((m) => m.partial && m.role === role);
+            if (i === -1) return {...s, messages: [...s.messages, { id: crypto.randomUUID(), ts: new Date().toISOString(), role, content }]};
+            return {...s, messages: s.messages.map((m, j) => j === i ? { ...m, content, partial: false } : m)};
+        });
 
-    return { pushMessage, session };
+    // Streamed pieces of a message: the first one starts a partial message, the rest are appended to it
+    const appendPartial = (role: "user" | "assistant", text: string) =>
+        setSession((s) => {
+            const i = s.messages.findIndex((m) => m.partial && m.role === role);
+            if (i === -1) return {...s, messages: [...s.messages, { id: crypto.randomUUID(), ts: new Date().toISOString(), role, content: text, partial: true }]};
+            return {...s, messages: s.messages.map((m, j) => j === i ? { ...m, content: m.content + text } : m)};
+        });
+
+    return { pushMessage, appendPartial, session };
 }
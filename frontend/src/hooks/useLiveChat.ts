@@ -13,10 +13,12 @@ import { logText } from '@/utils/loggingHelpers';
 export default function useLiveChat({
     onUserUtterance,
     onSystemUtterance = (_: string) => {},
+    onSystemDelta     = (_: string) => {},
     onScores          = (         ) => {},
 } : {
     onUserUtterance   : (text: string) => void;
     onSystemUtterance : (text: string) => void;
+    onSystemDelta?    : (text: string) => void;   // each streamed piece of the reply (llm_delta), before onSystemUtterance
     onScores          : (            ) => void;
 }) {
     // Misc. setup
@@ -34,6 +36,9 @@ export default function useLiveChat({
 		onLLMResponse: (text: string) => {
 			onLLMres(text);
 		},
+		onLLMDelta: (text: string) => {
+			onSystemDelta(text);
+		},
 		onScores,
 		onUserUtt: onUserUtterance,
 		onAudio: sendAudio,
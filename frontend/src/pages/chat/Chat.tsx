@@ -18,12 +18,13 @@ export function Chat() {
     const navigate = useNavigate();
 
     // Local (frontend, view-related only) chat tracking
-    const { pushMessage, session } = useLocalChatSession();
-    const onUserUtterance   = (text: string) => { pushMessage("user",      text); };
-    const onSystemUtterance = (text: string) => { pushMessage("assistant", text); };
+    const { pushMessage, appendPartial, session } = useLocalChatSession();
+    const onUserUtterance   = (text: string) => { pushMessage  ("user",      text); };
+    const onSystemUtterance = (text: string) => { pushMessage  ("assistant", text); }; // (replaces the streamed text)
+    const onSystemDelta     = (text: string) => { appendPartial("assistant", text); };
 
     // Live-chat hook
-    const { start, stop, save } = useLiveChat({ onUserUtterance, onSystemUtterance, onScores: () => {} });
+    const { start, stop, save } = useLiveChat({ onUserUtterance, onSystemUtterance, onSystemDelta, onScores: () => {} });
     
     // Separate recording flag that we control ourselves
     const [recording, setRecording ] = useState(false);